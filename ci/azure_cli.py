@@ -0,0 +1,78 @@
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import tracing
+
+# Shared helpers for running the Azure CLI from the ci scripts: JSON output,
+# retries with backoff when Azure throttles, and the deadline of the running check.
+
+CACHE_DIR = os.environ.get("CI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "course-ci"))
+
+MAX_RETRIES = int(os.environ.get("AZ_MAX_RETRIES", "3"))
+# Rows per Resource Graph page (the service maximum), for both the CLI and the REST backend
+GRAPH_PAGE_SIZE = 1000
+# Azure error codes for throttling/overload (e.g. 'TooManyRequests', 'SubscriptionRequestsThrottled'),
+# or an HTTP 429/503 status as the CLI reports it ('Status code: 429', 'HTTP 503')
+THROTTLE_PATTERN = re.compile(
+    r"\b(?:TooManyRequests|ServerBusy|\w*Throttled)\b|\b(?:status(?:\s*code)?|http(?:/[\d.]+)?)\W{0,2}(?:429|503)\b",
+    re.IGNORECASE,
+)
+
+# Per-thread state of the running check: its deadline and output buffer
+context = threading.local()
+
+def remaining_time():
+    """Seconds left before the current check's deadline, or None outside a check."""
+    deadline = getattr(context, "deadline", None)
+    return None if deadline is None else deadline - time.monotonic()
+
+def is_throttled(message):
+    return THROTTLE_PATTERN.search(message) is not None
+
+def log(message):
+    """Prints to the output buffer of the check running on this thread, else to stdout."""
+    print(message, file=getattr(context, "output", None) or sys.stdout)
+
+def backoff(attempt):
+    """Sleeps before retry `attempt`. Returns False if the check's deadline does not allow it."""
+    delay = min(30, 2 ** attempt) + random.uniform(0, 1)
+    remaining = remaining_time()
+    if remaining is not None and remaining <= delay:
+        return False
+    log(f"   [INFO] Azure is throttling requests, retrying in {delay:.1f}s...")
+    time.sleep(delay)
+    return True
+
+def run_az_cmd(cmd_list):
+    """Executes Azure CLI command and returns JSON output."""
+    # Force JSON output if not present
+    if "--output" not in cmd_list and "-o" not in cmd_list:
+        cmd_list.extend(["-o", "json"])
+
+    for attempt in range(MAX_RETRIES + 1):
+        timeout = remaining_time()
+        if timeout is not None and timeout <= 0:
+            log(f"   [WARN] Check deadline exceeded before: {' '.join(cmd_list[:3])}")
+            return None
+        try:
+            result = tracing.run(
+                cmd_list, capture_output=True, text=True, check=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            log(f"   [WARN] Timed out: {' '.join(cmd_list[:3])}")
+            return None
+        except subprocess.CalledProcessError as e:
+            if attempt < MAX_RETRIES and is_throttled(e.stderr or "") and backoff(attempt):
+                continue
+            return None
+        if not result.stdout.strip():
+            return None
+        return json.loads(result.stdout)
+    return None
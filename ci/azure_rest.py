@@ -0,0 +1,243 @@
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import tracing
+from azure_cli import GRAPH_PAGE_SIZE
+
+ARM_ENDPOINT = os.environ.get("ARM_ENDPOINT", "https://management.azure.com")
+# '{account}' is replaced with the storage account name
+BLOB_ENDPOINT = os.environ.get("BLOB_ENDPOINT", "https://{account}.blob.core.windows.net")
+LOGIN_ENDPOINT = os.environ.get("LOGIN_ENDPOINT", "https://login.microsoftonline.com")
+
+ARM_SCOPE = "https://management.azure.com/.default"
+STORAGE_SCOPE = "https://storage.azure.com/.default"
+
+RESOURCES_API_VERSION = "2021-04-01"
+GRAPH_API_VERSION = "2021-03-01"
+BLOB_API_VERSION = "2021-08-06"
+HTTP_TIMEOUT = float(os.environ.get("AZURE_HTTP_TIMEOUT", "30"))
+MAX_RETRIES = int(os.environ.get("AZ_MAX_RETRIES", "3"))
+# Statuses Azure uses for throttling and transient overload
+RETRY_STATUSES = (429, 503)
+
+
+class AzureRestError(Exception):
+    """Raised when an Azure endpoint answers with an unexpected status."""
+
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+
+
+class ConnectionPool:
+    """Keeps idle keep-alive connections per (scheme, host) for reuse across requests."""
+
+    def __init__(self, timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_cls(netloc, timeout=self.timeout)
+
+    def _release(self, scheme, netloc, conn):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def request(self, method, url, headers=None, body=None, timeout=None):
+        """Sends one request and returns (status, body bytes). `timeout` overrides the pool's for this request."""
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        # A pooled connection may have been closed by the server; retry once on a fresh one
+        for attempt in range(2):
+            conn = self._acquire(parts.scheme, parts.netloc)
+            conn.timeout = timeout if timeout is not None else self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                with tracing.span(f"{method} {parts.netloc}", "http"):
+                    conn.request(method, path, body=body, headers=headers or {})
+                    response = conn.getresponse()
+                    data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+            return response.status, data
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+class TokenProvider:
+    """
+    Acquires one bearer token per scope and reuses it until shortly before expiry.
+    Uses the service principal from ARM_* variables when present, else the logged-in az CLI.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope):
+        static_token = os.environ.get("AZURE_ACCESS_TOKEN")
+        if static_token:
+            return static_token
+
+        with self._lock:
+            token, expires_at = self._tokens.get(scope, (None, 0))
+            if token and time.time() < expires_at - 300:
+                return token
+            token, expires_at = self._acquire(scope)
+            self._tokens[scope] = (token, expires_at)
+            return token
+
+    def _acquire(self, scope):
+        tenant = os.environ.get("ARM_TENANT_ID")
+        client_id = os.environ.get("ARM_CLIENT_ID")
+        secret = os.environ.get("ARM_CLIENT_SECRET")
+
+        if tenant and client_id and secret:
+            body = urlencode({
+                "grant_type": "client_credentials",
+                "client_id": client_id,
+                "client_secret": secret,
+                "scope": scope,
+            })
+            status, data = self.pool.request(
+                "POST", f"{LOGIN_ENDPOINT}/{tenant}/oauth2/v2.0/token",
+                headers={"Content-Type": "application/x-www-form-urlencoded"}, body=body,
+            )
+            if status != 200:
+                raise AzureRestError(status, data.decode("utf-8", "replace"))
+            payload = json.loads(data)
+            return payload["access_token"], time.time() + int(payload.get("expires_in", 3600))
+
+        resource = scope[:-len("/.default")]
+        result = tracing.run(
+            ["az", "account", "get-access-token", "--resource", resource, "-o", "json"],
+            capture_output=True, text=True, check=True,
+        )
+        payload = json.loads(result.stdout)
+        return payload["accessToken"], payload.get("expires_on", time.time() + 3600)
+
+
+class AzureRestBackend:
+    """Queries ARM and Blob endpoints directly, sharing tokens and connections across checks."""
+
+    def __init__(self, subscription_id=None, remaining_time=None, backoff=None):
+        self.pool = ConnectionPool()
+        self.tokens = TokenProvider(self.pool)
+        self._subscription_id = subscription_id or os.environ.get("ARM_SUBSCRIPTION_ID")
+        # Hooks from the caller: seconds left for the current check, and a sleep that
+        # returns False when the deadline does not allow another attempt
+        self.remaining_time = remaining_time or (lambda: None)
+        self.backoff = backoff or self._default_backoff
+
+    @staticmethod
+    def _default_backoff(attempt):
+        time.sleep(min(30, 2 ** attempt))
+        return True
+
+    def _send(self, method, url, headers, body=None):
+        for attempt in range(MAX_RETRIES + 1):
+            remaining = self.remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"Check deadline exceeded before {method} {urlsplit(url).path}")
+            # A single request may not outlive the check's deadline
+            timeout = HTTP_TIMEOUT if remaining is None else min(HTTP_TIMEOUT, remaining)
+            status, data = self.pool.request(method, url, headers=headers, body=body, timeout=timeout)
+            if status not in RETRY_STATUSES or attempt == MAX_RETRIES or not self.backoff(attempt):
+                return status, data
+
+    @property
+    def subscription_id(self):
+        if not self._subscription_id:
+            result = tracing.run(
+                ["az", "account", "show", "--query", "id", "-o", "tsv"],
+                capture_output=True, text=True, check=True,
+            )
+            self._subscription_id = result.stdout.strip()
+        return self._subscription_id
+
+    def _get_json(self, url):
+        status, data = self._send("GET", url, {"Authorization": f"Bearer {self.tokens.get(ARM_SCOPE)}"})
+        if status == 404:
+            return None
+        if status != 200:
+            raise AzureRestError(status, data.decode("utf-8", "replace"))
+        return json.loads(data)
+
+    def list_resources(self, rg_name):
+        """Returns the resources of a group in the 'az resource list' shape, or None if it is missing."""
+        url = (f"{ARM_ENDPOINT}/subscriptions/{self.subscription_id}/resourceGroups/{rg_name}"
+               f"/resources?api-version={RESOURCES_API_VERSION}")
+        resources = []
+        while url:
+            page = self._get_json(url)
+            if page is None:
+                return None
+            resources.extend(page.get("value", []))
+            url = page.get("nextLink")
+        return resources
+
+    def query_graph(self, query):
+        """Runs a Resource Graph query over the subscription and returns every row, page by page."""
+        url = f"{ARM_ENDPOINT}/providers/Microsoft.ResourceGraph/resources?api-version={GRAPH_API_VERSION}"
+        rows, skip_token = [], None
+        while True:
+            options = {"resultFormat": "objectArray", "$top": GRAPH_PAGE_SIZE}
+            if skip_token:
+                options["$skipToken"] = skip_token
+            body = json.dumps({"subscriptions": [self.subscription_id], "query": query, "options": options})
+            status, data = self._send("POST", url, {
+                "Authorization": f"Bearer {self.tokens.get(ARM_SCOPE)}",
+                "Content-Type": "application/json",
+            }, body.encode("utf-8"))
+            if status != 200:
+                raise AzureRestError(status, data.decode("utf-8", "replace"))
+            page = json.loads(data)
+            rows.extend(page.get("data", []))
+            skip_token = page.get("$skipToken")
+            if not skip_token:
+                return rows
+
+    def container_exists(self, account_name, container_name):
+        url = f"{BLOB_ENDPOINT.format(account=account_name)}/{container_name}?restype=container"
+        status, data = self._send("HEAD", url, {
+            "Authorization": f"Bearer {self.tokens.get(STORAGE_SCOPE)}",
+            "x-ms-version": BLOB_API_VERSION,
+        })
+        if status == 200:
+            return True
+        if status == 404:
+            return False
+        raise AzureRestError(status, data.decode("utf-8", "replace"))
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from azure_cli import CACHE_DIR, run_az_cmd
+
+# Creates (if needed) the per-student Terraform state backend: resource group, storage
+# account and containers. Once a student's backend is known to be complete, a marker
+# is kept for MARKER_TTL seconds and later runs only fetch the storage account key.
+
+MARKER_TTL = int(os.environ.get("BACKEND_MARKER_TTL", "86400"))
+LOCATION = os.environ.get("BACKEND_LOCATION", "northeurope")
+STATE_CONTAINER = "tfstate"
+PLANS_CONTAINER = "validation-plans"
+
+
+class BackendNames:
+    """Names derived from the student id, exactly as the workflows always did."""
+    __slots__ = ("student_id", "resource_group", "account")
+
+    def __init__(self, student_id):
+        lower_id = student_id.lower()
+        self.student_id = lower_id
+        self.resource_group = f"rg-course-{lower_id}-state"
+        self.account = "st" + re.sub(r"[^a-z0-9]", "", lower_id)[:22]
+
+
+# --- Marker ---
+
+def _marker_path(names):
+    return os.path.join(CACHE_DIR, f"backend-{names.student_id}.json")
+
+
+def read_marker(names, containers):
+    """True if a fresh marker says this backend already has all the given containers."""
+    try:
+        with open(_marker_path(names), "r", encoding="utf-8") as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (
+        time.time() - marker.get("ready_at", 0) < MARKER_TTL
+        and marker.get("account") == names.account
+        and set(containers) <= set(marker.get("containers", []))
+    )
+
+
+def write_marker(names, containers):
+    # The account key is deliberately not stored
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_marker_path(names), "w", encoding="utf-8") as f:
+        json.dump({
+            "resource_group": names.resource_group,
+            "account": names.account,
+            "containers": sorted(containers),
+            "ready_at": int(time.time()),
+        }, f)
+
+
+def clear_marker(names):
+    try:
+        os.remove(_marker_path(names))
+    except OSError:
+        pass
+
+
+# --- Bootstrap ---
+
+def _account_key(names):
+    return run_az_cmd([
+        "az", "storage", "account", "keys", "list",
+        "--resource-group", names.resource_group, "--account-name", names.account, "--query", "[0].value",
+    ])
+
+
+def _ensure_container(names, key, container):
+    storage_args = ["--name", container, "--account-name", names.account, "--account-key", key]
+    if run_az_cmd(["az", "storage", "container", "show", *storage_args]) is not None:
+        return True
+    return run_az_cmd(["az", "storage", "container", "create", *storage_args]) is not None
+
+
+def bootstrap(names, containers, location=LOCATION):
+    """
+    Makes sure the backend exists and returns the storage account key.
+    Independent existence checks run in parallel; creates run only for what is missing.
+    """
+    with ThreadPoolExecutor(max_workers=max(2, len(containers))) as pool:
+        group_check = pool.submit(run_az_cmd, ["az", "group", "show", "--name", names.resource_group])
+        account_check = pool.submit(run_az_cmd, [
+            "az", "storage", "account", "show", "--name", names.account, "--resource-group", names.resource_group,
+        ])
+        group_exists = group_check.result() is not None
+        account_exists = account_check.result() is not None
+
+        if not group_exists:
+            print(f"[INFO] Creating resource group {names.resource_group}...")
+            if run_az_cmd(["az", "group", "create", "--name", names.resource_group, "--location", location]) is None:
+                raise RuntimeError(f"Could not create resource group {names.resource_group}")
+        if not account_exists:
+            print(f"[INFO] Creating storage account {names.account}...")
+            if run_az_cmd([
+                "az", "storage", "account", "create", "--name", names.account,
+                "--resource-group", names.resource_group, "--sku", "Standard_LRS", "--encryption-services", "blob",
+            ]) is None:
+                raise RuntimeError(f"Could not create storage account {names.account}")
+
+        key = _account_key(names)
+        if not key:
+            raise RuntimeError(f"Could not read the keys of storage account {names.account}")
+
+        results = pool.map(lambda container: _ensure_container(names, key, container), containers)
+        missing = [c for c, ok in zip(containers, results) if not ok]
+        if missing:
+            raise RuntimeError(f"Could not create container(s): {', '.join(missing)}")
+    return key
+
+
+@tracing.traced("backend_bootstrap", "stage")
+def ensure_backend(student_id, containers=(STATE_CONTAINER,), location=LOCATION, refresh=False):
+    """Returns (names, account key). Warm runs cost a single 'keys list' call."""
+    names = BackendNames(student_id)
+    if not refresh and read_marker(names, containers):
+        key = _account_key(names)
+        if key:
+            print(f"[INFO] Backend {names.account} is ready (cached).")
+            return names, key
+        # The backend disappeared behind the marker's back (e.g. the nightly cleanup)
+        clear_marker(names)
+
+    key = bootstrap(names, list(containers), location)
+    write_marker(names, containers)
+    print(f"[INFO] Backend {names.account} is ready.")
+    return names, key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates the per-student Terraform state backend if needed.")
+    parser.add_argument("student_id")
+    parser.add_argument("--plans-container", action="store_true",
+                        help=f"Also ensure the '{PLANS_CONTAINER}' container used for validation plans")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the ready marker")
+    parser.add_argument("--location", default=LOCATION)
+    args = parser.parse_args()
+
+    containers = [STATE_CONTAINER] + ([PLANS_CONTAINER] if args.plans_container else [])
+    try:
+        names, key = ensure_backend(args.student_id, containers, args.location, args.refresh)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    print(f"::add-mask::{key}")
+    lines = [
+        f"STATE_RG={names.resource_group}",
+        f"STATE_SA={names.account}",
+        f"STATE_CONTAINER={STATE_CONTAINER}",
+        f"STORAGE_KEY={key}",
+    ]
+    if args.plans_container:
+        lines.append(f"PLANS_CONTAINER={PLANS_CONTAINER}")
+
+    github_output = os.environ.get("GITHUB_OUTPUT")
+    if github_output:
+        with open(github_output, "a") as f:
+            f.write("\n".join(lines) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
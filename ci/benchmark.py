@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import quiz_extract
+import validate_plan
+import which_checks
+
+# Regressions smaller than these are treated as noise, whatever the relative threshold
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA = 1 << 20
+
+
+# --- Generators ---
+
+def _module_prefix(level):
+    return "".join(f"module.m{depth}." for depth in range(1, level + 1))
+
+
+def generate_plan(resource_count, module_depth=0):
+    """
+    Builds a synthetic `terraform show -json` document with `resource_count` resources,
+    spread evenly over the root module and a chain of `module_depth` nested child modules.
+    """
+    levels = module_depth + 1
+    modules = [{"resources": []} for _ in range(levels)]
+    changes, prior = [], []
+    for i in range(resource_count):
+        level = i % levels
+        values = {
+            "name": f"res-{i}",
+            "location": "westeurope",
+            "sku_name": "standard",
+            "tags": {"student": "bench", "index": str(i)},
+            "network_rules": [{"default_action": "Deny", "ip_rules": [f"10.0.{i % 256}.0/24"]}],
+            "description": "x" * 200,
+        }
+        address = f"{_module_prefix(level)}azurerm_key_vault.kv{i}"
+        modules[level]["resources"].append({
+            "address": address,
+            "mode": "managed",
+            "type": "azurerm_key_vault",
+            "name": f"kv{i}",
+            "provider_name": "registry.terraform.io/hashicorp/azurerm",
+            "schema_version": 0,
+            "values": values,
+            "sensitive_values": {"tags": {}, "network_rules": [{}]},
+        })
+        changes.append({
+            "address": address,
+            "type": "azurerm_key_vault",
+            "name": f"kv{i}",
+            "change": {"actions": ["create"], "before": None, "after": values},
+        })
+        prior.append({"address": address, "values": values})
+
+    for level in range(levels - 1, 0, -1):
+        modules[level]["address"] = _module_prefix(level).rstrip(".")
+        modules[level - 1]["child_modules"] = [modules[level]]
+
+    return {
+        "format_version": "1.2",
+        "terraform_version": "1.6.6",
+        "variables": {"student_id": {"value": "bench"}},
+        "planned_values": {"root_module": modules[0]},
+        "resource_changes": changes,
+        "prior_state": {"values": {"root_module": {"resources": prior}}},
+        "configuration": {"root_module": {"resources": [{"address": c["address"]} for c in changes]}},
+    }
+
+
+def generate_spec(resource_count):
+    """Rules for the synthetic plan: exact, per-instance and wildcard attribute checks."""
+    attributes = {f"azurerm_key_vault.kv{i}": {"sku_name": "standard", "tags.student": "bench"}
+                  for i in range(0, resource_count, max(1, resource_count // 100))}
+    attributes["azurerm_key_vault.*"] = {"location": "westeurope", "network_rules[*].default_action": "Deny"}
+    return {"resources": ["azurerm_key_vault.kv0"], "attributes": attributes}
+
+
+def generate_quiz(questions, options=4, filler_lines=5):
+    """Builds a quiz markdown file with `questions` questions, one option ticked in each."""
+    lines = ["# Quiz", ""]
+    for q in range(1, questions + 1):
+        lines.append(f"## Question {q}")
+        lines.extend(f"Some explanation of the scenario, line {n}." for n in range(filler_lines))
+        ticked = q % options
+        for o in range(options):
+            mark = "x" if o == ticked else " "
+            lines.append(f"- [{mark}] {chr(ord('A') + o)}) Option {o} of question {q}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_tasks_config(tasks):
+    """Builds a tasks_config.yml with `tasks` tasks listed under every router key."""
+    lines = ["# Synthetic router config"]
+    for key in ("quiz", "plan", "manual"):
+        lines.append(f"{key}:")
+        lines.extend(f"  - task{n:05d}" for n in range(tasks))
+    return "\n".join(lines) + "\n"
+
+
+def _route_all(config, tasks):
+    index = which_checks.compile_index(config)
+    for n in range(tasks):
+        index.checks_for(f"task{n:05d}")
+
+
+# --- Measurement ---
+
+def measure(func, repeat=3):
+    """Returns (best seconds over `repeat` calls, peak bytes of one traced call)."""
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def build_benchmarks(tmp, args):
+    """Writes the synthetic inputs into `tmp` and returns {benchmark name: callable}."""
+    plan_path = Path(tmp) / "tfplan.json"
+    plan_path.write_text(json.dumps(generate_plan(args.resources, args.module_depth)), encoding="utf-8")
+    spec = generate_spec(args.resources)
+    index = validate_plan.load_planned_resources(plan_path, spec)
+
+    quiz_dir = Path(tmp) / "task_quiz"
+    quiz_dir.mkdir()
+    quiz_text = generate_quiz(args.questions)
+    (quiz_dir / "instructions.md").write_text(quiz_text, encoding="utf-8")
+
+    config_path = os.path.join(tmp, "tasks_config.yml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(generate_tasks_config(args.tasks))
+
+    return {
+        "plan.load_json+collect_planned_resources":
+            lambda: validate_plan.collect_planned_resources(validate_plan.load_json(plan_path)),
+        "plan.load_planned_resources": lambda: validate_plan.load_planned_resources(plan_path, spec),
+        "plan.validate_resources": lambda: validate_plan.validate_resources(spec, index),
+        "quiz.scan": lambda: quiz_extract.scan(quiz_text, "instructions.md"),
+        "quiz.extract_answers": lambda: quiz_extract.extract_answers(str(quiz_dir), use_artifact=False),
+        "router.load_config": lambda: which_checks.load_config(config_path),
+        "router.compile_index+lookup": lambda: _route_all(which_checks.load_config(config_path), args.tasks),
+    }
+
+
+def run_suite(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, func in build_benchmarks(tmp, args).items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            seconds, peak = measure(func, args.repeat)
+            results[name] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+            "params": {key: getattr(args, key) for key in ("resources", "module_depth", "questions", "tasks", "repeat")},
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Returns the regressions of `current` against `baseline` beyond the relative threshold."""
+    regressions = []
+    if baseline.get("meta", {}).get("params") != current["meta"]["params"]:
+        print("[WARN] Baseline was recorded with different parameters; comparison may be meaningless.")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric, min_delta in (("seconds", MIN_TIME_DELTA), ("peak_bytes", MIN_MEMORY_DELTA)):
+            old, new = base[metric], result[metric]
+            if new > old * (1 + threshold) and new - old > min_delta:
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1) if old else 1:.0%})")
+    return regressions
+
+
+def print_table(report):
+    params = report["meta"]["params"]
+    print(f"Synthetic inputs: {params['resources']} resources (module depth {params['module_depth']}), "
+          f"{params['questions']} quiz questions, {params['tasks']} router tasks")
+    print("| Benchmark | Time (s) | Peak memory (MiB) |")
+    print("| :--- | ---: | ---: |")
+    for name, result in report["results"].items():
+        print(f"| {name} | {result['seconds']:.4f} | {result['peak_bytes'] / (1 << 20):.1f} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the ci/ validation scripts.")
+    parser.add_argument("--resources", type=int, default=10000, help="Resources in the synthetic plan")
+    parser.add_argument("--module-depth", type=int, default=2, help="Nesting depth of child modules in the plan")
+    parser.add_argument("--questions", type=int, default=2000, help="Questions in the synthetic quiz")
+    parser.add_argument("--tasks", type=int, default=5000, help="Tasks in the synthetic tasks_config.yml")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls per benchmark (best is kept)")
+    parser.add_argument("--only", action="append", help="Only run benchmarks whose name starts with this prefix")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown/growth (default 0.25)")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    print_table(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"[RESULT] {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print(f"[RESULT] No regressions beyond {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+
+import tracing
+import which_checks
+
+# Maps the files changed between two git refs to the task directories that need to be
+# validated again. Edits inside task*/ select that task; edits to a rule file keyed by
+# task name select only the tasks whose entry changed; edits to tasks_config.yml select
+# the tasks whose routing changed. Any other change under ci/ or the workflows can change
+# every verdict and selects all tasks. Tasks with no check enabled are left out.
+
+TASK_PREFIX = "task"
+PER_TASK_RULES = ("ci/answers.json", "ci/quiz_answers.json", "ci/manual_checks.json", "ci/variables.json")
+ROUTER_CONFIG = "ci/tasks_config.yml"
+GLOBAL_PREFIXES = ("ci/", ".github/workflows/")
+# Shared files that never change a verdict
+IGNORED_PREFIXES = ("ci/fixtures/",)
+NULL_SHA = "0" * 40
+
+
+def git(args, repo_dir):
+    """Runs a git command and returns its stdout, or None if it failed."""
+    result = tracing.run(["git", *args], cwd=repo_dir, capture_output=True, text=True)
+    return result.stdout if result.returncode == 0 else None
+
+
+def ensure_commit(ref, repo_dir):
+    """Makes sure `ref` is available locally, fetching it if the checkout is shallow."""
+    if git(["cat-file", "-e", f"{ref}^{{commit}}"], repo_dir) is not None:
+        return True
+    print(f"[INFO] Fetching {ref}...", file=sys.stderr)
+    git(["fetch", "--no-tags", "--depth=1", "origin", ref], repo_dir)
+    return git(["cat-file", "-e", f"{ref}^{{commit}}"], repo_dir) is not None
+
+
+def diff_base(base, head, repo_dir):
+    """The merge base of the two refs if history allows, else `base` itself (plain tree diff)."""
+    merge_base = git(["merge-base", base, head], repo_dir)
+    return merge_base.strip() if merge_base else base
+
+
+def changed_files(base, head, repo_dir):
+    # Renames are reported as delete + add so both task directories are seen
+    out = git(["diff", "--name-only", "--no-renames", "-z", base, head], repo_dir)
+    if out is None:
+        raise RuntimeError(f"git diff {base} {head} failed")
+    return [path for path in out.split("\0") if path]
+
+
+def read_at(ref, path, repo_dir):
+    """Contents of `path` at `ref`, or None if it does not exist there."""
+    return git(["show", f"{ref}:{path}"], repo_dir)
+
+
+def task_dirs_at(ref, repo_dir):
+    out = git(["ls-tree", "-d", "--name-only", ref], repo_dir) or ""
+    return sorted(name for name in out.splitlines() if name.startswith(TASK_PREFIX))
+
+
+def _json_at(ref, path, repo_dir):
+    text = read_at(ref, path, repo_dir)
+    try:
+        return json.loads(text) if text else {}
+    except ValueError:
+        return None
+
+
+def changed_entries(path, base, head, repo_dir):
+    """Task names whose entry in a per-task rule file differs; None if either side is unreadable."""
+    old, new = _json_at(base, path, repo_dir), _json_at(head, path, repo_dir)
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    return {task for task in old.keys() | new.keys() if old.get(task) != new.get(task)}
+
+
+def _router_at(ref, repo_dir):
+    text = read_at(ref, ROUTER_CONFIG, repo_dir)
+    return which_checks.compile_index(which_checks.parse_config(text) if text is not None else None)
+
+
+@tracing.traced("changed_tasks", "stage")
+def affected_tasks(base, head, repo_dir="."):
+    """
+    Returns {task: [reasons]} for the tasks at `head` that the changes between the refs can
+    affect, plus the {task: checks} routing at `head` for every task directory there.
+    """
+    tasks = task_dirs_at(head, repo_dir)
+    router = _router_at(head, repo_dir)
+    routing = {task: router.checks_for(task) for task in tasks}
+    reasons = {}
+
+    def add(task, reason):
+        if task in routing:
+            reasons.setdefault(task, []).append(reason)
+
+    everything = None
+    for path in changed_files(base, head, repo_dir):
+        top = path.split("/", 1)[0]
+        if top.startswith(TASK_PREFIX) and "/" in path:
+            add(top, path)
+        elif path in PER_TASK_RULES:
+            entries = changed_entries(path, base, head, repo_dir)
+            if entries is None:
+                everything = everything or path
+            for task in entries or ():
+                add(task, path)
+        elif path == ROUTER_CONFIG:
+            old_router = _router_at(base, repo_dir)
+            for task, checks in routing.items():
+                if old_router.checks_for(task) != checks:
+                    add(task, path)
+        elif path.startswith(IGNORED_PREFIXES):
+            continue
+        elif path.startswith(GLOBAL_PREFIXES):
+            everything = everything or path
+
+    if everything:
+        for task in tasks:
+            add(task, everything)
+    return {task: reasons[task] for task in tasks if task in reasons}, routing
+
+
+def detect(base, head="HEAD", repo_dir="."):
+    """Summary of what to validate between `base` and `head`."""
+    if not base or base == NULL_SHA or not ensure_commit(base, repo_dir):
+        # New branch or unknown base: nothing to compare against, validate every task
+        tasks = task_dirs_at(head, repo_dir)
+        router = _router_at(head, repo_dir)
+        affected = {task: ["no base to compare with"] for task in tasks}
+        routing = {task: router.checks_for(task) for task in tasks}
+        compared = None
+    else:
+        compared = diff_base(base, head, repo_dir)
+        affected, routing = affected_tasks(compared, head, repo_dir)
+
+    selected = {task: routing[task] for task in affected if any(routing[task].values())}
+    return {
+        "base": base,
+        "head": head,
+        "diff_base": compared,
+        "tasks": list(selected),
+        "checks": selected,
+        "reasons": {task: affected[task] for task in selected},
+        # Changed, but no check is enabled for them
+        "skipped": [task for task in affected if task not in selected],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lists the task directories affected by the changes between two refs.")
+    parser.add_argument("base", help="Base ref or sha (e.g. the pull request base)")
+    parser.add_argument("head", nargs="?", default="HEAD")
+    parser.add_argument("--repo", default=".", help="Repository directory (default: .)")
+    parser.add_argument("--github-output", action="store_true",
+                        help="Append tasks/checks/matrix/task_count to GITHUB_OUTPUT")
+    args = parser.parse_args()
+
+    try:
+        result = detect(args.base, args.head, args.repo)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+
+    github_output = os.environ.get("GITHUB_OUTPUT")
+    if args.github_output and github_output:
+        lines = [f"tasks={json.dumps(result['tasks'], separators=(',', ':'))}",
+                 *which_checks.matrix_outputs(result["checks"])]
+        with open(github_output, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
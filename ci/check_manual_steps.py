@@ -1,69 +1,205 @@
 import sys
-import subprocess
 import json
 import os
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def run_az_cmd(cmd_list):
-    """Executes Azure CLI command and returns JSON output."""
+import azure_cli
+import results_store
+import rules_bundle
+import tracing
+from azure_cli import CACHE_DIR, GRAPH_PAGE_SIZE, backoff, log, remaining_time, run_az_cmd
+
+# Resource group inventories are snapshotted on disk so the next task in the
+# same run can reuse them instead of calling 'az resource list' again.
+INVENTORY_TTL = int(os.environ.get("INVENTORY_TTL", "300"))
+
+STORAGE_ACCOUNT_TYPE = "Microsoft.Storage/storageAccounts"
+
+# 'cli' spawns the Azure CLI per query, 'rest' calls ARM/Blob endpoints over pooled connections
+BACKEND = os.environ.get("MANUAL_CHECKS_BACKEND", "cli")
+
+# Checks of a task run concurrently; each one gets its own deadline and
+# throttled Azure calls are retried with exponential backoff.
+MAX_PARALLEL_CHECKS = int(os.environ.get("MANUAL_CHECKS_CONCURRENCY", "4"))
+CHECK_TIMEOUT = float(os.environ.get("MANUAL_CHECK_TIMEOUT", "120"))
+
+# rg_name -> (index, fetched_by_this_process)
+_inventories = {}
+# One lock per resource group, so a slow listing only blocks checks on that group
+_inventory_locks = {}
+_inventory_locks_guard = threading.Lock()
+
+class InventoryError(RuntimeError):
+    """A resource group could not be listed; the checks on it are errors, not failures."""
+
+# --- Backends ---
+
+class AzCliBackend:
+    """Answers queries by running the Azure CLI."""
+
+    def list_resources(self, rg_name):
+        return run_az_cmd(["az", "resource", "list", "-g", rg_name])
+
+    def query_graph(self, query):
+        """Runs a Resource Graph query and returns every row, following the skip token."""
+        rows, skip_token = [], None
+        while True:
+            cmd = ["az", "graph", "query", "-q", query, "--first", str(GRAPH_PAGE_SIZE)]
+            if skip_token:
+                cmd += ["--skip-token", skip_token]
+            page = run_az_cmd(cmd)
+            if page is None:
+                raise RuntimeError("az graph query failed (is the resource-graph extension installed?)")
+            rows.extend(page.get("data", []))
+            skip_token = page.get("skip_token")
+            if not skip_token:
+                return rows
+
+    def container_exists(self, account_name, container_name):
+        result = run_az_cmd([
+            "az", "storage", "container", "exists", 
+            "--account-name", account_name, 
+            "--name", container_name, 
+            "--auth-mode", "login"
+        ])
+        return bool(result and result.get("exists") is True)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Returns the query backend selected by MANUAL_CHECKS_BACKEND, created once per process."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND == "rest":
+                from azure_rest import AzureRestBackend
+                _backend = AzureRestBackend(remaining_time=remaining_time, backoff=backoff)
+            elif BACKEND == "cli":
+                _backend = AzCliBackend()
+            else:
+                raise ValueError(f"Unknown MANUAL_CHECKS_BACKEND '{BACKEND}' (expected 'cli' or 'rest')")
+        return _backend
+
+# --- Inventory ---
+
+def build_index(resources):
+    """Indexes resources by lower-cased type, then lower-cased name (listing order is kept)."""
+    index = {}
+    for r in resources or []:
+        by_name = index.setdefault(r.get('type', '').lower(), {})
+        by_name.setdefault(r.get('name', '').lower(), r)
+    return index
+
+def _snapshot_path(rg_name):
+    return os.path.join(CACHE_DIR, f"inventory-{rg_name}.json")
+
+def _read_snapshot(rg_name):
     try:
-        # Force JSON output if not present
-        if "--output" not in cmd_list and "-o" not in cmd_list:
-            cmd_list.extend(["-o", "json"])
-            
-        result = subprocess.run(
-            cmd_list, capture_output=True, text=True, check=True
-        )
-        if not result.stdout.strip():
-            return None
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError:
+        with open(_snapshot_path(rg_name), 'r') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - snapshot.get("fetched_at", 0) > INVENTORY_TTL:
         return None
+    return snapshot.get("resources")
+
+def _write_snapshot(rg_name, resources):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = _snapshot_path(rg_name) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"fetched_at": time.time(), "resources": resources}, f)
+        os.replace(tmp_path, _snapshot_path(rg_name))
+    except OSError as e:
+        log(f"   [WARN] Could not write inventory snapshot: {e}")
+
+def get_inventory(rg_name, refresh=False):
+    """
+    Returns the resource index of a resource group. The group is listed once per
+    process; a snapshot younger than INVENTORY_TTL seconds is reused across processes.
+    A failed listing is not kept: it raises, and the next check lists the group again.
+    """
+    # Concurrent checks on the same group wait for a single listing; other groups are not blocked
+    with _inventory_locks_guard:
+        lock = _inventory_locks.setdefault(rg_name, threading.Lock())
+    with lock:
+        return _load_inventory(rg_name, refresh)
+
+def _load_inventory(rg_name, refresh):
+    if not refresh:
+        if rg_name in _inventories:
+            return _inventories[rg_name][0]
+        resources = _read_snapshot(rg_name)
+        if resources is not None:
+            log(f"   [INFO] Using inventory snapshot of {rg_name}.")
+            _inventories[rg_name] = (build_index(resources), False)
+            return _inventories[rg_name][0]
+
+    log(f"   [INFO] Fetching inventory of {rg_name}...")
+    resources = get_backend().list_resources(rg_name)
+    if resources is None:
+        raise InventoryError(f"Could not list resource group {rg_name}")
+    _write_snapshot(rg_name, resources)
+    _inventories[rg_name] = (build_index(resources), True)
+    return _inventories[rg_name][0]
+
+def find_resources(rg_name, r_type, match=lambda name: True):
+    """
+    Returns resources of a type whose lower-cased name satisfies `match`.
+    A miss served from a snapshot is retried once against a fresh listing,
+    so resources created after the snapshot are not reported as missing.
+    """
+    found = [r for name, r in get_inventory(rg_name).get(r_type.lower(), {}).items() if match(name)]
+    if not found and not _inventories[rg_name][1]:
+        found = [r for name, r in get_inventory(rg_name, refresh=True).get(r_type.lower(), {}).items() if match(name)]
+    return found
+
+def storage_account(accounts):
+    """
+    The storage account container checks look into: the first by name, so the choice
+    does not depend on the order in which Azure lists resources.
+    """
+    return min(accounts, key=lambda r: r.get('name', '').lower())
 
 # --- Check Functions ---
 
 def check_container_exists(rg_name, params):
     container_name = params.get('container_name')
-    print(f"   [CHECK] Looking for container '{container_name}'...")
+    log(f"   [CHECK] Looking for container '{container_name}'...")
     
-    # Get the first storage account in the RG
-    sa_name_res = run_az_cmd(["az", "storage", "account", "list", "-g", rg_name, "--query", "[0].name"])
+    # Get the storage account of the RG (the first by name when there are several)
+    accounts = find_resources(rg_name, STORAGE_ACCOUNT_TYPE)
     
-    if not sa_name_res:
-        print(f"   [FAIL] No Storage Account found in {rg_name}.")
+    if not accounts:
+        log(f"   [FAIL] No Storage Account found in {rg_name}.")
         return False
+    sa_name_res = storage_account(accounts).get('name')
     
     # Check container existence
-    cmd = [
-        "az", "storage", "container", "exists", 
-        "--account-name", sa_name_res, 
-        "--name", container_name, 
-        "--auth-mode", "login"
-    ]
-    result = run_az_cmd(cmd)
-    
-    if result and result.get("exists") is True:
-        return True
-    return False
+    try:
+        return get_backend().container_exists(sa_name_res, container_name)
+    except Exception as e:
+        log(f"   [WARN] Could not query container '{container_name}': {e}")
+        return False
 
 def check_resource_exists(rg_name, params):
     """Checks if a resource of a specific type exists with a specific name pattern."""
     r_type = params.get('resource_type')
     name_contains = params.get('name_contains', '')
-    print(f"   [CHECK] Looking for resource '{r_type}' containing name '{name_contains}'...")
+    log(f"   [CHECK] Looking for resource '{r_type}' containing name '{name_contains}'...")
 
-    # List resources of the specific type in the RG
-    resources = run_az_cmd(["az", "resource", "list", "-g", rg_name, "--resource-type", r_type])
+    # Look the type up in the resource group's inventory
+    resources = find_resources(rg_name, r_type, lambda name: name_contains.lower() in name)
     
-    if not resources:
-        print(f"   [FAIL] No resources of type {r_type} found in {rg_name}.")
-        return False
-        
-    for r in resources:
-        if name_contains.lower() in r.get('name', '').lower():
-            print(f"   [OK] Found resource: {r.get('name')}")
-            return True
+    if resources:
+        log(f"   [OK] Found resource: {resources[0].get('name')}")
+        return True
             
-    print(f"   [FAIL] Resource of type {r_type} with name containing '{name_contains}' not found.")
+    log(f"   [FAIL] Resource of type {r_type} with name containing '{name_contains}' not found in {rg_name}.")
     return False
 
 # --- Dispatcher ---
@@ -73,67 +209,131 @@ DISPATCHER = {
     "resource_exists": check_resource_exists
 }
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python check_manual.py <task_dir> <student_id>")
-        sys.exit(1)
+def resource_group_name(student_id, task_config):
+    # Defaulting to 'ch1' suffix as per your course structure, unless overridden in JSON
+    suffix = task_config.get("rg_suffix", "ch1")
+    return f"rg-course-{student_id}-{suffix}"
 
-    task_dir = sys.argv[1]
-    student_id = sys.argv[2]
-    
+def _run_check(handler, rg_name, check, timeout):
+    """
+    Runs one check with its own deadline and output buffer; handlers print through log(),
+    which writes to the buffer of the check running on the thread. Returns (passed, output).
+    """
+    out = io.StringIO()
+    azure_cli.context.output = out
+    azure_cli.context.deadline = time.monotonic() + timeout
+    try:
+        try:
+            with tracing.span(check_label(check), "check"):
+                passed = handler(rg_name, check)
+        except InventoryError as e:
+            # Azure did not answer: not evidence that the resource is missing
+            print(f"   [ERROR] {e}.", file=out)
+            print("   [ERROR] Check could not run.", file=out)
+            return False, out.getvalue()
+        except Exception as e:
+            print(f"   [FAIL] Check raised an error: {e}", file=out)
+            passed = False
+
+        if passed:
+            print("   [PASS] Check passed.", file=out)
+        else:
+            print("   [FAIL] Check failed.", file=out)
+        return passed, out.getvalue()
+    finally:
+        azure_cli.context.output = None
+        azure_cli.context.deadline = None
+
+def check_label(check):
+    """Short name of a check, e.g. 'resource_exists:Microsoft.Insights/actionGroups~ag-support-email'."""
+    target = check.get("container_name") or check.get("resource_type", "")
+    if check.get("name_contains"):
+        target += f"~{check['name_contains']}"
+    return f"{check.get('type')}:{target}"
+
+def run_checks(task_config, rg_name, max_workers=MAX_PARALLEL_CHECKS, timeout=CHECK_TIMEOUT, outcomes=None, out=None):
+    """
+    Runs every check of a task against the resource group, at most `max_workers` at a time
+    and each within `timeout` seconds. Output goes to `out` (default stdout) in configuration order.
+    Returns True if all passed; per-check items are appended to `outcomes` when given.
+    """
+    out = out or sys.stdout
+    checks = task_config.get("checks", [])
+    all_passed = True
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = []
+        for check in checks:
+            handler = DISPATCHER.get(check.get("type"))
+            futures.append(pool.submit(_run_check, handler, rg_name, check, timeout) if handler else None)
+
+        for check, future in zip(checks, futures):
+            if future is None:
+                print(f"   [WARN] Unknown check type: {check.get('type')}", file=out)
+                continue
+            passed, output = future.result()
+            if outcomes is not None:
+                outcomes.append({"item": check_label(check), "passed": passed})
+            out.write(output)
+            out.flush()
+            all_passed = all_passed and passed
+
+    return all_passed
+
+def check(task_dir, student_id, out=None):
+    """
+    Runs the manual verification of one task for a student.
+    Returns (exit code, {"resource_group", "passed"} or None when the task has no manual checks).
+    Output goes to `out` (default stdout).
+    """
+    out = out or sys.stdout
     # 1. Load Configuration
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "manual_checks.json")
+    config = rules_bundle.load_rules("manual_checks")
 
-    if not os.path.exists(config_path):
-        print(f"[INFO] Configuration file {config_path} not found. Skipping manual checks.")
-        sys.exit(0)
-
-    with open(config_path, 'r') as f:
-        config = json.load(f)
+    if config is None:
+        print(f"[INFO] Configuration file {config_path} not found. Skipping manual checks.", file=out)
+        return 0, None
 
     # 2. Check if current task has requirements
     # Normalize path (get the last folder name, e.g., 'task5')
     task_key = os.path.basename(os.path.normpath(task_dir))
 
     if task_key not in config:
-        print(f"[INFO] No manual verification defined for {task_key}. Proceeding.")
-        sys.exit(0)
+        print(f"[INFO] No manual verification defined for {task_key}. Proceeding.", file=out)
+        return 0, None
 
     task_config = config[task_key]
     
     # 3. Determine Resource Group Name
-    # Defaulting to 'ch1' suffix as per your course structure, unless overridden in JSON
-    suffix = task_config.get("rg_suffix", "ch1")
-    rg_name = f"rg-course-{student_id}-{suffix}"
+    rg_name = resource_group_name(student_id, task_config)
 
-    print(f"STARTING MANUAL VERIFICATION FOR: {task_key}")
-    print(f"Description: {task_config.get('description', 'Manual Check')}")
-    print(f"Target Resource Group: {rg_name}")
-
-    all_passed = True
+    print(f"STARTING MANUAL VERIFICATION FOR: {task_key}", file=out)
+    print(f"Description: {task_config.get('description', 'Manual Check')}", file=out)
+    print(f"Target Resource Group: {rg_name}", file=out)
 
     # 4. Run Checks
-    for check in task_config.get("checks", []):
-        check_type = check.get("type")
-        handler = DISPATCHER.get(check_type)
-        
-        if handler:
-            if handler(rg_name, check):
-                print("   [PASS] Check passed.")
-            else:
-                print("   [FAIL] Check failed.")
-                all_passed = False
-        else:
-             print(f"   [WARN] Unknown check type: {check_type}")
-
-    if all_passed:
-        print("\nRESULT: MANUAL CHECKS PASSED")
-        sys.exit(0)
+    started = time.perf_counter()
+    outcomes = []
+    passed = run_checks(task_config, rg_name, outcomes=outcomes, out=out)
+    results_store.record("manual", task_key, passed, outcomes, duration=round(time.perf_counter() - started, 3),
+                         student=student_id)
+    if passed:
+        print("\nRESULT: MANUAL CHECKS PASSED", file=out)
     else:
-        print("\nRESULT: MANUAL CHECKS FAILED")
-        print("Please complete the required manual steps in the Azure Portal.")
+        print("\nRESULT: MANUAL CHECKS FAILED", file=out)
+        print("Please complete the required manual steps in the Azure Portal.", file=out)
+    return (0 if passed else 1), {"resource_group": rg_name, "passed": passed}
+
+@tracing.traced("check_manual_steps", "stage")
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python check_manual.py <task_dir> <student_id>")
         sys.exit(1)
 
+    code, _ = check(sys.argv[1], sys.argv[2])
+    sys.exit(code)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
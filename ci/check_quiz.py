@@ -1,7 +1,11 @@
 import os
-import json
-import re
 import sys
+import time
+
+import quiz_extract
+import results_store
+import rules_bundle
+import tracing
 
 def write_github_summary(text):
     """Writes output to the GitHub Action Step Summary."""
@@ -15,109 +19,132 @@ def save_quiz_report_for_pr(text):
     with open("quiz_summary.md", "w", encoding="utf-8") as f:
         f.write(text)
 
-def parse_markdown_answers(file_path):
-    answers = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                match = re.search(r'-\s*\[[xX]\]\s*([A-Za-z])', line)
-                if match:
-                    answers.append(match.group(1).upper())
-    except FileNotFoundError:
-        return None
-    return answers
-
-def main():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    answers_file = os.path.join(script_dir, 'quiz_answers.json')
-    
-    if not os.path.exists(answers_file):
-        print(f"[ERROR] Configuration file not found: {answers_file}")
-        sys.exit(1)
-
-    with open(answers_file, 'r') as f:
-        answer_key = json.load(f)
-
-    if len(sys.argv) > 1:
-        target_path = sys.argv[1]
-    else:
-        target_path = os.getcwd()
-
-    target_folder_name = os.path.basename(os.path.normpath(target_path))
+def grade_quiz(target_folder_name, student_answers, expected_answers):
+    """
+    Compares the student's selections with the answer key.
+    Returns a dict with the verdict, the score, per-question results and the report text.
+    """
+    result = {
+        "passed": False,
+        "correct": 0,
+        "total": len(expected_answers),
+        "questions": [],
+        "error": None,
+        "report": "",
+    }
 
-    if target_folder_name not in answer_key:
-        print(f"[INFO] No quiz configuration found for '{target_folder_name}'. Skipping.")
-        sys.exit(0)
-
-    print(f"[INFO] Checking quiz for: {target_folder_name}")
-    
-    md_file_path = None
-    possible_files = [f for f in os.listdir(target_path) if f.endswith(".md")]
-    
-    if "instructions.md" in possible_files:
-        md_file_path = os.path.join(target_path, "instructions.md")
-    elif possible_files:
-        md_file_path = os.path.join(target_path, possible_files[0])
-    
-    if not md_file_path:
-        print(f"[ERROR] No .md file found in {target_path}")
-        sys.exit(1)
-
-    student_answers = parse_markdown_answers(md_file_path)
-    expected_answers = answer_key[target_folder_name]
+    # Check for count mismatch first
+    if len(student_answers) != len(expected_answers):
+        if len(student_answers) > len(expected_answers):
+            result["error"] = f"**Error:** Detected {len(student_answers)} selections, expected {len(expected_answers)}. Too many options selected."
+        else:
+            result["error"] = f"**Error:** Detected {len(student_answers)} selections, expected {len(expected_answers)}. Some questions missed."
+        result["report"] = result["error"]
+        return result
 
     # Build Report Table
     # We use #### to make it a sub-header in the PR comment
     summary_report = [f"#### Quiz Details: {target_folder_name}"]
     summary_report.append("| Question | Your Answer | Result |")
     summary_report.append("| :---: | :---: | :--- |")
-    
-    failed = False
-    error_msg = ""
-
-    # Check for count mismatch first
-    if len(student_answers) != len(expected_answers):
-        failed = True
-        if len(student_answers) > len(expected_answers):
-            error_msg = f"**Error:** Detected {len(student_answers)} selections, expected {len(expected_answers)}. Too many options selected."
-        else:
-            error_msg = f"**Error:** Detected {len(student_answers)} selections, expected {len(expected_answers)}. Some questions missed."
-        
-        print(f"[FAIL] {error_msg}")
-        save_quiz_report_for_pr(error_msg)
-        write_github_summary(f"### 🛑 Quiz Failed\n{error_msg}")
-        sys.exit(1)
 
     # Check correctness
-    correct_count = 0
     for i, (student, expected) in enumerate(zip(student_answers, expected_answers)):
         q_num = i + 1
-        if student == expected:
-            print(f"[PASS] Q{q_num}: Correct ({student})")
+        correct = student == expected
+        result["questions"].append({"question": q_num, "answer": student, "expected": expected, "correct": correct})
+        if correct:
             summary_report.append(f"| {q_num} | **{student}** | ✅ Correct |")
-            correct_count += 1
+            result["correct"] += 1
         else:
-            print(f"[FAIL] Q{q_num}: Expected {expected}, got {student}")
             summary_report.append(f"| {q_num} | {student} | ❌ **Incorrect** |")
-            failed = True
 
     # Calculate Score
-    score_percent = int((correct_count / len(expected_answers)) * 100)
-    summary_report.insert(1, f"\n**Score: {score_percent}%** ({correct_count}/{len(expected_answers)})\n")
+    score_percent = int((result["correct"] / len(expected_answers)) * 100)
+    summary_report.insert(1, f"\n**Score: {score_percent}%** ({result['correct']}/{len(expected_answers)})\n")
+
+    result["passed"] = result["correct"] == len(expected_answers)
+    result["report"] = "\n".join(summary_report)
+    return result
+
+def question_outcomes(result):
+    """Per-question items for the results store."""
+    return [
+        {"item": f"Q{q['question']}", "passed": q["correct"], "detail": f"expected {q['expected']}, got {q['answer']}"}
+        for q in result["questions"]
+    ]
+
+@tracing.traced("check_quiz", "stage")
+def check(target_path, out=None):
+    """
+    Runs the quiz check for one task directory, writing the PR and step summaries.
+    Returns (exit code, grade result or None when the task has no quiz).
+    Output goes to `out` (default stdout).
+    """
+    out = out or sys.stdout
+    started = time.perf_counter()
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    answers_file = os.path.join(script_dir, 'quiz_answers.json')
+    
+    answer_key = rules_bundle.load_rules("quiz_answers")
+    
+    if answer_key is None:
+        print(f"[ERROR] Configuration file not found: {answers_file}", file=out)
+        return 1, None
+
+    target_folder_name = os.path.basename(os.path.normpath(target_path))
 
-    report_text = "\n".join(summary_report)
+    if target_folder_name not in answer_key:
+        print(f"[INFO] No quiz configuration found for '{target_folder_name}'. Skipping.", file=out)
+        return 0, None
+
+    print(f"[INFO] Checking quiz for: {target_folder_name}", file=out)
+    
+    if not quiz_extract.quiz_files(target_path):
+        print(f"[ERROR] No .md file found in {target_path}", file=out)
+        return 1, None
+
+    student_answers = quiz_extract.selected_letters(target_path)
+    expected_answers = answer_key[target_folder_name]
+
+    result = grade_quiz(target_folder_name, student_answers, expected_answers)
+    results_store.record("quiz", target_folder_name, result["passed"], question_outcomes(result),
+                         duration=round(time.perf_counter() - started, 3))
+
+    if result["error"]:
+        print(f"[FAIL] {result['error']}", file=out)
+        save_quiz_report_for_pr(result["error"])
+        write_github_summary(f"### 🛑 Quiz Failed\n{result['error']}")
+        return 1, result
+
+    for q in result["questions"]:
+        if q["correct"]:
+            print(f"[PASS] Q{q['question']}: Correct ({q['answer']})", file=out)
+        else:
+            print(f"[FAIL] Q{q['question']}: Expected {q['expected']}, got {q['answer']}", file=out)
+
+    report_text = result["report"]
     
     # SAVE REPORT ALWAYS
     save_quiz_report_for_pr(report_text)
 
-    if failed:
+    if not result["passed"]:
         write_github_summary(report_text)
-        print("\n[RESULT] Verification FAILED.")
-        sys.exit(1)
+        print("\n[RESULT] Verification FAILED.", file=out)
+        return 1, result
     else:
         write_github_summary(report_text)
-        print("\n[RESULT] Verification PASSED.")
-        sys.exit(0)
+        print("\n[RESULT] Verification PASSED.", file=out)
+        return 0, result
+
+def main():
+    if len(sys.argv) > 1:
+        target_path = sys.argv[1]
+    else:
+        target_path = os.getcwd()
+
+    code, _ = check(target_path)
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import plugin_cache
+import tracing
+
+# Finds every student state written by framework_apply.yml (<student>/<task>.tfstate in the
+# 'tfstate' container of each st<student> account) and destroys the ones that still hold
+# resources, several at a time, sharing the keyed provider plugin caches of plugin_cache.py.
+
+STATE_CONTAINER = "tfstate"
+STATE_SUFFIX = ".tfstate"
+DEFAULT_WORKERS = int(os.environ.get("CLEANUP_CONCURRENCY", "4"))
+DESTROY_TIMEOUT = int(os.environ.get("CLEANUP_DESTROY_TIMEOUT", "3600"))
+
+
+def run_az(args):
+    """Runs an az command and returns its parsed JSON output, or None on failure."""
+    result = tracing.run(["az", *args, "-o", "json"], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"[WARN] az {' '.join(args[:3])} failed: {result.stderr.strip()}")
+        return None
+    return json.loads(result.stdout) if result.stdout.strip() else None
+
+
+def count_resources(state):
+    """Number of managed resource instances recorded in a state document."""
+    return sum(
+        len(resource.get("instances", []))
+        for resource in state.get("resources", [])
+        if resource.get("mode") == "managed"
+    )
+
+
+class StateRef:
+    """One state file: whose it is, which task it belongs to and where it lives."""
+    __slots__ = ("student", "task", "key", "store")
+
+    def __init__(self, student, task, key, store):
+        self.student = student
+        self.task = task
+        self.key = key
+        self.store = store
+
+    @classmethod
+    def from_key(cls, key, store):
+        """Parses '<student>/<task>.tfstate'; returns None for keys of another shape."""
+        student, _, name = key.partition("/")
+        if not student or "/" in name or not name.endswith(STATE_SUFFIX):
+            return None
+        return cls(student, name[:-len(STATE_SUFFIX)], key, store)
+
+
+# --- State stores ---
+# A store lists its state files, reads them, and tells 'terraform init' how to reach them.
+
+class BlobStateStore:
+    """The 'tfstate' container of one student's storage account."""
+
+    def __init__(self, resource_group, account, account_key, container=STATE_CONTAINER):
+        self.resource_group = resource_group
+        self.account = account
+        self.account_key = account_key
+        self.container = container
+
+    @classmethod
+    def discover(cls, max_workers=DEFAULT_WORKERS):
+        """Returns one store per 'rg-course-<id>-state' group that holds a storage account."""
+        groups = run_az(["group", "list", "--query",
+                         "[?starts_with(name, 'rg-course-') && ends_with(name, '-state')].name"]) or []
+
+        def open_group(rg_name):
+            accounts = run_az(["storage", "account", "list", "--resource-group", rg_name,
+                               "--query", "[?starts_with(name, 'st')].name"]) or []
+            stores = []
+            for account in accounts:
+                keys = run_az(["storage", "account", "keys", "list", "--resource-group", rg_name,
+                               "--account-name", account, "--query", "[0].value"])
+                if keys:
+                    stores.append(cls(rg_name, account, keys))
+            return stores
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return [store for stores in pool.map(open_group, groups) for store in stores]
+
+    def _storage_args(self):
+        return ["--account-name", self.account, "--account-key", self.account_key, "--container-name", self.container]
+
+    def list_states(self):
+        names = run_az(["storage", "blob", "list", *self._storage_args(), "--query", "[].name"]) or []
+        return [ref for ref in (StateRef.from_key(name, self) for name in names) if ref]
+
+    def read_state(self, ref):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.json")
+            result = tracing.run(
+                ["az", "storage", "blob", "download", *self._storage_args(), "--name", ref.key,
+                 "--file", path, "--no-progress", "-o", "none"],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"Could not download {ref.key}: {result.stderr.strip()}")
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    def init_args(self, ref, work_dir):
+        return [
+            f"-backend-config=resource_group_name={self.resource_group}",
+            f"-backend-config=storage_account_name={self.account}",
+            f"-backend-config=container_name={self.container}",
+            f"-backend-config=key={ref.key}",
+            f"-backend-config=access_key={self.account_key}",
+        ]
+
+    def __str__(self):
+        return self.account
+
+
+class LocalStateStore:
+    """A directory laid out like the blob container: <root>/<student>/<task>.tfstate."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_states(self):
+        refs = []
+        for student in sorted(os.listdir(self.root)):
+            student_dir = os.path.join(self.root, student)
+            if not os.path.isdir(student_dir):
+                continue
+            for name in sorted(os.listdir(student_dir)):
+                ref = StateRef.from_key(f"{student}/{name}", self)
+                if ref:
+                    refs.append(ref)
+        return refs
+
+    def read_state(self, ref):
+        with open(os.path.join(self.root, ref.key), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def init_args(self, ref, work_dir):
+        # An override file replaces the task's azurerm backend with the local state file
+        path = os.path.abspath(os.path.join(self.root, ref.key))
+        with open(os.path.join(work_dir, "cleanup_backend_override.tf"), "w", encoding="utf-8") as f:
+            f.write('terraform {\n  backend "local" {\n    path = ' + json.dumps(path) + "\n  }\n}\n")
+        return []
+
+    def __str__(self):
+        return self.root
+
+
+# --- Destroy ---
+
+def _terraform(args, cwd, env, timeout=None):
+    return tracing.run(["terraform", *args], cwd=cwd, env=env, capture_output=True, text=True, timeout=timeout)
+
+
+def destroy(ref, resources, repo_dir, init_lock, dry_run=False):
+    """Destroys one state from a scratch copy of its task directory. Returns a summary record."""
+    record = {"student": ref.student, "task": ref.task, "store": str(ref.store),
+              "resources": resources, "status": "skipped", "duration": 0.0}
+    task_dir = os.path.join(repo_dir, ref.task)
+    if not os.path.isdir(task_dir):
+        record["error"] = f"task directory '{ref.task}' not found"
+        return record
+    if dry_run:
+        record["status"] = "would_destroy"
+        return record
+
+    started = time.perf_counter()
+    env = {**os.environ, "TF_IN_AUTOMATION": "1", "TF_INPUT": "0", "TF_VAR_student_id": ref.student}
+    with tempfile.TemporaryDirectory(prefix=f"cleanup-{ref.task}-") as work_dir:
+        shutil.copytree(task_dir, work_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns(".terraform", "*.tfstate*", "tfplan*"))
+        init_args = ["-reconfigure", *ref.store.init_args(ref, work_dir)]
+        # The plugin cache is not safe for concurrent writes; init is short once it is warm
+        with init_lock:
+            result, init_record = plugin_cache.init(work_dir, init_args, env=env, capture=True)
+        record["plugin_cache_hit"] = init_record["hit"]
+        env.update(plugin_cache.environment(work_dir, init_record["key"]))
+        if result.returncode == 0:
+            try:
+                result = _terraform(["destroy", "-auto-approve", "-input=false", "-no-color"], work_dir, env,
+                                    timeout=DESTROY_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                result = None
+
+    record["duration"] = round(time.perf_counter() - started, 1)
+    if result is None:
+        record.update(status="failed", error=f"destroy timed out after {DESTROY_TIMEOUT}s")
+    elif result.returncode != 0:
+        record.update(status="failed", error=(result.stderr or result.stdout).strip()[-500:])
+    else:
+        record["status"] = "destroyed"
+    return record
+
+
+def _inspect(ref):
+    try:
+        return ref, count_resources(ref.store.read_state(ref)), None
+    except (RuntimeError, OSError, ValueError) as e:
+        return ref, None, str(e)
+
+
+def cleanup(stores, repo_dir, max_workers=DEFAULT_WORKERS, dry_run=False):
+    """Lists, inspects and destroys all states of the given stores. Returns the summary dict."""
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        refs = [ref for refs in pool.map(lambda store: store.list_states(), stores) for ref in refs]
+        inspected = list(pool.map(_inspect, refs))
+
+    records = []
+    to_destroy = []
+    for ref, resources, error in inspected:
+        if error:
+            records.append({"student": ref.student, "task": ref.task, "store": str(ref.store),
+                            "resources": None, "status": "failed", "duration": 0.0, "error": error})
+        elif resources == 0:
+            records.append({"student": ref.student, "task": ref.task, "store": str(ref.store),
+                            "resources": 0, "status": "empty", "duration": 0.0})
+        else:
+            to_destroy.append((ref, resources))
+
+    init_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(destroy, ref, resources, repo_dir, init_lock, dry_run) for ref, resources in to_destroy]
+        for future in futures:
+            record = future.result()
+            print(f"   [{record['status'].upper()}] {record['student']}/{record['task']} "
+                  f"({record['resources']} resources, {record['duration']}s)")
+            records.append(record)
+
+    destroyed = [r for r in records if r["status"] == "destroyed"]
+    return {
+        "states": len(refs),
+        "empty": sum(1 for r in records if r["status"] == "empty"),
+        "destroyed": len(destroyed),
+        "failed": sum(1 for r in records if r["status"] == "failed"),
+        "resources_reclaimed": sum(r["resources"] for r in destroyed),
+        "destroy_seconds": round(sum(r["duration"] for r in destroyed), 1),
+        "wall_seconds": round(time.perf_counter() - started, 1),
+        "plugin_cache_hits": sum(1 for r in records if r.get("plugin_cache_hit")),
+        "records": sorted(records, key=lambda r: (r["student"], r["task"])),
+    }
+
+
+def write_step_summary(summary):
+    lines = [
+        "## Nightly cleanup",
+        "",
+        f"{summary['states']} state(s) found, {summary['empty']} empty, {summary['destroyed']} destroyed, "
+        f"{summary['failed']} failed. {summary['resources_reclaimed']} resource(s) reclaimed; "
+        f"{summary['destroy_seconds']}s of destroy time in {summary['wall_seconds']}s wall time.",
+        "",
+        "| Student | Task | Resources | Status | Time (s) |",
+        "|---|---|---|---|---|",
+    ]
+    for r in summary["records"]:
+        if r["status"] != "empty":
+            lines.append(f"| {r['student']} | {r['task']} | {r['resources']} | {r['status']} | {r['duration']} |")
+
+    step_summary = os.environ.get("GITHUB_STEP_SUMMARY")
+    if step_summary:
+        with open(step_summary, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@tracing.traced("cleanup", "stage")
+def main():
+    parser = argparse.ArgumentParser(description="Destroys the resources of every student state that still has some.")
+    parser.add_argument("--repo", default=".", help="Directory holding the task* directories (default: .)")
+    parser.add_argument("--local-states", metavar="DIR",
+                        help="Read states from DIR/<student>/<task>.tfstate instead of the student storage accounts")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="List what would be destroyed without destroying")
+    parser.add_argument("--summary", default="cleanup_summary.json", help="Where to write the JSON summary")
+    args = parser.parse_args()
+
+    if args.local_states:
+        stores = [LocalStateStore(args.local_states)]
+    else:
+        stores = BlobStateStore.discover(args.workers)
+    print(f"[INFO] Scanning {len(stores)} state store(s)...")
+
+    summary = cleanup(stores, args.repo, args.workers, args.dry_run)
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    write_step_summary(summary)
+
+    print(f"[RESULT] {summary['destroyed']} destroyed, {summary['empty']} empty, {summary['failed']} failed; "
+          f"{summary['resources_reclaimed']} resource(s) reclaimed in {summary['wall_seconds']}s.")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,22 @@
 import os
-import json
 import sys
 
-def main():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, 'messages.json')
+import quiz_extract
+import rules_bundle
+import tracing
+
+def is_enabled(env_var_name):
+    val = os.environ.get(env_var_name, "")
+    if not val: return True
+    return val.lower() != "false"
+
+@tracing.traced("create_report", "stage")
+def create_report(status_quiz, status_manual, status_plan, status_apply,
+                  run_quiz, run_manual, run_plan, event_name, student_id, task_dir):
+    """Writes pr_comment.md for the given step outcomes. Returns True if the report is a failure."""
+    config = rules_bundle.load_rules("messages")
     
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-    except FileNotFoundError:
+    if config is None:
         config = {
             "course_name": "Cloud Training",
             "technology": "Azure",
@@ -17,25 +24,11 @@ def main():
             "steps": {}
         }
 
-    def is_enabled(env_var_name):
-        val = os.environ.get(env_var_name, "")
-        if not val: return True
-        return val.lower() != "false"
-
-    status_quiz = os.environ.get("QUIZ_RESULT", "skipped")
-    status_manual = os.environ.get("MANUAL_RESULT", "skipped")
-    status_plan = os.environ.get("PLAN_RESULT", "skipped")
-    status_apply = os.environ.get("APPLY_RESULT", "skipped")
-
-    run_quiz = is_enabled("RUN_QUIZ")
-    run_manual = is_enabled("RUN_MANUAL")
-    run_plan = is_enabled("RUN_PLAN")
-
-    event_name = os.environ.get("GITHUB_EVENT_NAME", "pull_request")
-    student_id = os.environ.get("STUDENT_ID", "Unknown")
-    task_dir = os.environ.get("TASK_DIR", "Unknown Task")
-
     icons = config.get("icons", {})
+
+    # Answers detected by the quiz step, reused from its artifact instead of re-scanning the markdown
+    answers_artifact = quiz_extract.read_artifact(os.path.basename(os.path.normpath(task_dir)))
+    detected_answers = ", ".join(a["letter"] for a in answers_artifact["answers"]) if answers_artifact else "-"
     
     # --- MESSAGES (Generic & Professional) ---
     def get_msg(step, status):
@@ -164,12 +157,29 @@ def main():
 <details><summary>Debug Info</summary>
 Student: `{student_id}`
 Checks: Quiz={run_quiz}, Manual={run_manual}, Plan={run_plan}
+Detected answers: {detected_answers}
 Event: {event_name}
 </details>
 """
 
     with open("pr_comment.md", "w", encoding="utf-8") as f:
         f.write(report)
+
+    return is_failure
+
+def main():
+    is_failure = create_report(
+        status_quiz=os.environ.get("QUIZ_RESULT", "skipped"),
+        status_manual=os.environ.get("MANUAL_RESULT", "skipped"),
+        status_plan=os.environ.get("PLAN_RESULT", "skipped"),
+        status_apply=os.environ.get("APPLY_RESULT", "skipped"),
+        run_quiz=is_enabled("RUN_QUIZ"),
+        run_manual=is_enabled("RUN_MANUAL"),
+        run_plan=is_enabled("RUN_PLAN"),
+        event_name=os.environ.get("GITHUB_EVENT_NAME", "pull_request"),
+        student_id=os.environ.get("STUDENT_ID", "Unknown"),
+        task_dir=os.environ.get("TASK_DIR", "Unknown Task"),
+    )
     
     if is_failure:
         github_output = os.environ.get('GITHUB_OUTPUT')
@@ -1,7 +1,23 @@
+import argparse
+import json
+import os
 import sys
 import subprocess
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+# Terraform reports each resource that exists in Azure but not in state like this.
+# The ID may be wrapped across lines; Azure IDs hold no whitespace, so it is removed.
+CONFLICT_PATTERN = re.compile(r'ID\s+"(/subscriptions/[^"]+)"\s+already\s+exists')
+
+# How long to wait for Azure to confirm deletions, and the poll interval bounds
+DELETE_TIMEOUT = int(os.environ.get("FIX_STATE_DELETE_TIMEOUT", "180"))
+POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 15
+MAX_PARALLEL_DELETES = int(os.environ.get("FIX_STATE_CONCURRENCY", "8"))
 
 def run_terraform_plan(tf_dir):
     """
@@ -10,7 +26,7 @@ def run_terraform_plan(tf_dir):
     print("🔄 Regenerating Terraform Plan...")
     cmd = ["terraform", f"-chdir={tf_dir}", "plan", "-input=false", "-out=tfplan"]
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = tracing.run(cmd, capture_output=True, text=True)
     
     if result.returncode != 0:
         print("❌ Failed to regenerate plan:")
@@ -19,13 +35,88 @@ def run_terraform_plan(tf_dir):
     
     print("✅ Plan regenerated successfully.")
 
+class ApplyResult:
+    """
+    Outcome of one streamed apply: exit code, conflicting IDs in the order Terraform
+    reported them, and the summaries of all other error diagnostics.
+    """
+    __slots__ = ("code", "conflicts", "errors")
+
+    def __init__(self):
+        self.code = None
+        self.conflicts = []
+        self.errors = []
+
+def _format_diagnostic(diagnostic):
+    address = diagnostic.get("address")
+    where = f" ({address})" if address else ""
+    return f"{diagnostic.get('summary', '')}{where}"
+
+def consume_apply_events(lines, result):
+    """
+    Parses 'terraform apply -json' output line by line as it arrives: prints progress
+    messages live and records error diagnostics, queueing 'already exists' conflicts
+    the moment they are emitted. Lines that are not JSON are echoed and scanned as text.
+    """
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            print(line, flush=True)
+            _queue_conflicts(find_conflicts(line), result)
+            continue
+
+        if event.get("type") != "diagnostic":
+            if event.get("type") != "version" and event.get("@message"):
+                print(event["@message"], flush=True)
+            continue
+
+        diagnostic = event.get("diagnostic", {})
+        if diagnostic.get("severity") != "error":
+            print(f"⚠️ {_format_diagnostic(diagnostic)}", flush=True)
+            continue
+        conflict_ids = find_conflicts(f"{diagnostic.get('summary', '')} {diagnostic.get('detail', '')}")
+        if conflict_ids:
+            _queue_conflicts(conflict_ids, result)
+        else:
+            print(f"❌ {_format_diagnostic(diagnostic)}", flush=True)
+            if diagnostic.get("detail"):
+                print(diagnostic["detail"], flush=True)
+            result.errors.append(_format_diagnostic(diagnostic))
+    return result
+
+def _queue_conflicts(conflict_ids, result):
+    for conflict_id in conflict_ids:
+        if conflict_id not in result.conflicts:
+            print(f"⚠️ Conflict queued: {conflict_id}", flush=True)
+            result.conflicts.append(conflict_id)
+
 def run_terraform_apply(tf_dir):
     """
-    Runs 'terraform apply' and returns exit code, stdout, and stderr.
+    Runs 'terraform apply -json', streaming its events as they arrive. Returns an ApplyResult.
     """
-    cmd = ["terraform", f"-chdir={tf_dir}", "apply", "-auto-approve", "-input=false", "tfplan"]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.returncode, result.stdout, result.stderr
+    cmd = ["terraform", f"-chdir={tf_dir}", "apply", "-auto-approve", "-input=false", "-json", "tfplan"]
+    result = ApplyResult()
+    # stderr is merged so crashes and provider output also show up in order
+    with tracing.span("terraform apply", "subprocess"), \
+            tracing.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as proc:
+        consume_apply_events(proc.stdout, result)
+    result.code = proc.returncode
+    return result
+
+def replay_apply(fixture_path):
+    """
+    Feeds a recorded 'terraform apply -json' log through the same parser, for offline runs.
+    The exit code is derived from the recorded diagnostics.
+    """
+    result = ApplyResult()
+    with open(fixture_path, "r", encoding="utf-8") as f:
+        consume_apply_events(f, result)
+    result.code = 1 if result.conflicts or result.errors else 0
+    return result
 
 def delete_azure_resource(resource_id):
     """
@@ -44,52 +135,142 @@ def delete_azure_resource(resource_id):
                 "--resource", parent_id,
                 "--name", child_name
             ]
-            subprocess.run(cmd, check=True, capture_output=True)
+            tracing.run(cmd, check=True, capture_output=True)
             return # Exit function on success
         except Exception as e:
             print(f"⚠️ Failed to delete via 'az monitor'. Falling back to generic delete. Error: {e}")
 
     # CASE 2: Standard Azure Resource ID
     print(f"🧹 AUTO-FIX: Deleting standard resource: {resource_id}")
-    cmd = ["az", "resource", "delete", "--ids", resource_id, "--verbose"]
+    cmd = ["az", "resource", "delete", "--ids", resource_id]
     
     # We allow this to fail (check=False) to avoid crashing the whole script if resource is already gone
-    subprocess.run(cmd, check=False)
+    result = tracing.run(cmd, check=False, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"⚠️ Delete of {resource_id} returned {result.returncode}: {result.stderr.strip()}")
 
+def resource_exists(resource_id):
+    """
+    Asks Azure whether a resource (or a 'ParentID|ChildName' diagnostic setting) still exists.
+    """
+    if "|" in resource_id:
+        parent_id, child_name = resource_id.split("|", 1)
+        cmd = ["az", "monitor", "diagnostic-settings", "show", "--resource", parent_id, "--name", child_name, "-o", "none"]
+    else:
+        cmd = ["az", "resource", "show", "--ids", resource_id, "-o", "none"]
+    return tracing.run(cmd, capture_output=True, text=True).returncode == 0
+
+def find_conflicts(stderr):
+    """
+    Returns every conflicting resource ID in the apply output, in order, without duplicates.
+    """
+    return list(dict.fromkeys("".join(match.split()) for match in CONFLICT_PATTERN.findall(stderr)))
+
+def _contains(parent_id, resource_id):
+    """
+    True if resource_id lives under parent_id (a child resource or a '|' sub-ID).
+    """
+    prefix = parent_id.lower()
+    child = resource_id.lower()
+    return child != prefix and (child.startswith(prefix + "/") or child.startswith(prefix + "|"))
+
+def deletion_waves(resource_ids):
+    """
+    Groups resource IDs so that children are deleted in an earlier wave than their parents.
+    IDs without relations to each other share a wave and can be deleted concurrently.
+    """
+    levels = {}
+
+    def level(resource_id):
+        if resource_id not in levels:
+            children = [other for other in resource_ids if _contains(resource_id, other)]
+            levels[resource_id] = 1 + max((level(c) for c in children), default=-1)
+        return levels[resource_id]
+
+    waves = {}
+    for resource_id in resource_ids:
+        waves.setdefault(level(resource_id), []).append(resource_id)
+    return [waves[k] for k in sorted(waves)]
+
+def wait_until_gone(resource_ids, timeout=DELETE_TIMEOUT):
+    """
+    Polls Azure until none of the resources exist anymore, backing off between polls.
+    Returns the IDs still present when the timeout is reached.
+    """
+    remaining = list(resource_ids)
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DELETES, len(remaining) or 1)) as pool:
+        while remaining:
+            still_there = [rid for rid, exists in zip(remaining, pool.map(resource_exists, remaining)) if exists]
+            remaining = still_there
+            if not remaining or time.monotonic() + interval > deadline:
+                break
+            print(f"⏳ Waiting for {len(remaining)} resource(s) to disappear from Azure...")
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+    return remaining
+
+def remediate(conflict_ids):
+    """
+    Deletes all conflicting resources, children first, one concurrent wave at a time.
+    Returns the IDs that could not be confirmed as deleted.
+    """
+    waves = deletion_waves(conflict_ids)
+    for number, wave in enumerate(waves, start=1):
+        print(f"🧹 Wave {number}/{len(waves)}: deleting {len(wave)} resource(s)...")
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DELETES, len(wave))) as pool:
+            list(pool.map(delete_azure_resource, wave))
+        # Parents of later waves cannot be removed while these still exist
+        leftover = wait_until_gone(wave)
+        if leftover:
+            return leftover
+    return []
+
+@tracing.traced("fix_state", "stage")
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: fix_state.py <tf_dir>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Applies a plan, auto-resolving 'already exists' state conflicts.")
+    parser.add_argument("tf_dir", nargs="?", help="Terraform directory holding 'tfplan' (not needed with --replay)")
+    parser.add_argument("--replay", metavar="FIXTURE",
+                        help="Parse a recorded 'terraform apply -json' log instead of running Terraform; nothing is deleted")
+    args = parser.parse_args()
+    if not args.replay and not args.tf_dir:
+        parser.error("tf_dir is required unless --replay is given")
 
-    tf_dir = sys.argv[1]
+    if args.replay:
+        result = replay_apply(args.replay)
+        for number, wave in enumerate(deletion_waves(result.conflicts), start=1):
+            print(f"🧹 Wave {number} would delete: {', '.join(wave)}")
+        sys.exit(result.code)
+
+    tf_dir = args.tf_dir
     max_retries = 3
     
     for attempt in range(max_retries):
         print(f"🚀 Terraform Apply: Attempt {attempt + 1}/{max_retries}...")
         
-        code, out, err = run_terraform_apply(tf_dir)
-        print(out)
-        print(err)
+        result = run_terraform_apply(tf_dir)
+        code = result.code
 
         if code == 0:
             print("✅ Terraform Apply finished successfully!")
             sys.exit(0)
         
-        # Regex to capture the ID causing the conflict
-        match = re.search(r'ID\s+"(/subscriptions/[^"]+)"\s+already exists', err)
+        conflict_ids = result.conflicts
         
-        if match:
-            conflict_id = match.group(1)
-            print(f"⚠️ State Conflict Detected! Resource exists in Azure but not in Terraform state.")
+        if conflict_ids:
+            print(f"⚠️ State Conflict Detected! {len(conflict_ids)} resource(s) exist in Azure but not in Terraform state:")
+            for conflict_id in conflict_ids:
+                print(f"   - {conflict_id}")
             
             try:
-                # 1. Attempt to delete the resource (Now with support for '|' IDs)
-                delete_azure_resource(conflict_id)
-                
-                print("⏳ Waiting 10s for Azure API consistency...")
-                time.sleep(10)
+                # 1. Delete every conflicting resource, children before parents
+                leftover = remediate(conflict_ids)
+                if leftover:
+                    print(f"❌ Resources still present after {DELETE_TIMEOUT}s: {', '.join(leftover)}")
+                    sys.exit(code)
                 
-                # 2. Regenerate plan because the Azure state has changed
+                # 2. Regenerate plan once, because the Azure state has changed
                 run_terraform_plan(tf_dir)
                 
                 # 3. Retry loop
@@ -105,4 +286,4 @@ def main():
     sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import check_quiz
+import quiz_extract
+import results_store
+import rules_bundle
+import set_env
+import tracing
+import validate_plan
+import which_checks
+
+# Rule files are loaded once in the parent and handed to every worker through
+# the pool initializer, so each worker parses them exactly once.
+_RULES = {}
+
+
+def load_rules():
+    """Loads every rule set the graders need. Missing files mean 'no rules'."""
+    rules = {name: rules_bundle.load_rules(name) or {} for name in ("answers", "quiz_answers", "variables", "manual_checks")}
+    # No router config means every check runs
+    rules["tasks_config"] = rules_bundle.load_rules("tasks_config")
+    return rules
+
+
+def _init_worker(rules):
+    _RULES.update(rules)
+    # Patterns in tasks_config are compiled once per worker
+    _RULES["router"] = which_checks.compile_index(rules["tasks_config"])
+
+
+def grade_quiz(student_id, task_dir, task_name):
+    started = time.perf_counter()
+    expected = _RULES["quiz_answers"].get(task_name)
+    if expected is None:
+        return {"status": "skipped", "reason": "No quiz configuration"}
+
+    if not quiz_extract.quiz_files(task_dir):
+        return {"status": "failure", "reason": f"No .md file found in {task_dir}"}
+
+    result = check_quiz.grade_quiz(task_name, quiz_extract.selected_letters(task_dir, use_artifact=False), expected)
+    results_store.record("quiz", task_name, result["passed"], check_quiz.question_outcomes(result),
+                         duration=round(time.perf_counter() - started, 3), student=student_id)
+    return {
+        "status": "success" if result["passed"] else "failure",
+        "correct": result["correct"],
+        "total": result["total"],
+        "error": result["error"],
+        "questions": result["questions"],
+    }
+
+
+def grade_plan(student_id, plan_path, task_name):
+    started = time.perf_counter()
+    spec = _RULES["answers"].get(task_name)
+    if spec is None:
+        return {"status": "skipped", "reason": "No validation rules"}
+    if not plan_path.exists():
+        return {"status": "failure", "reason": f"Plan not found: {plan_path}"}
+
+    try:
+        resources = validate_plan.load_planned_resources(plan_path, spec)
+    except Exception as e:
+        return {"status": "failure", "reason": f"ERROR loading plan: {e}"}
+
+    outcomes = []
+    errors = validate_plan.validate_resources(spec, resources, outcomes)
+    results_store.record("plan", task_name, not errors, outcomes,
+                         duration=round(time.perf_counter() - started, 3), student=student_id)
+    return {"status": "failure" if errors else "success", "errors": errors,
+            "warnings": validate_plan.destructive_changes(resources)}
+
+
+def resolve_variables(task_dir, task_name):
+    mappings = _RULES["variables"].get(task_name, {}).get("mappings", [])
+    student_answers = quiz_extract.selected_letters(task_dir, use_artifact=False)
+    variables = {}
+    for _, variables_to_set in set_env.resolve_variables(student_answers, mappings):
+        variables.update(variables_to_set or {})
+    return variables
+
+
+def grade_manual(student_id, task_name):
+    import check_manual_steps
+
+    task_config = _RULES["manual_checks"].get(task_name)
+    if task_config is None:
+        return {"status": "skipped", "reason": "No manual verification defined"}
+
+    started = time.perf_counter()
+    rg_name = check_manual_steps.resource_group_name(student_id, task_config)
+    outcomes = []
+    passed = check_manual_steps.run_checks(task_config, rg_name, outcomes=outcomes)
+    results_store.record("manual", task_name, passed, outcomes,
+                         duration=round(time.perf_counter() - started, 3), student=student_id)
+    return {"status": "success" if passed else "failure", "resource_group": rg_name}
+
+
+def grade_task(job):
+    """Grades one (student, task) pair. Runs inside a pool worker."""
+    student_id, task_dir, plan_path, with_manual = job
+    task_name = os.path.basename(os.path.normpath(task_dir))
+    checks = _RULES["router"].checks_for(task_name)
+    skipped = {"status": "skipped"}
+
+    with tracing.span(f"{student_id}/{task_name}", "task"):
+        result = {
+            "quiz": grade_quiz(student_id, task_dir, task_name) if checks["quiz"] else skipped,
+            "plan": grade_plan(student_id, Path(plan_path), task_name) if checks["plan"] else skipped,
+            "manual": grade_manual(student_id, task_name) if checks["manual"] and with_manual else skipped,
+            "variables": resolve_variables(task_dir, task_name),
+        }
+    # Pool workers exit without running exit handlers
+    tracing.flush(summary=False)
+    return student_id, task_name, result
+
+
+def discover_jobs(checkouts_dir, plans_dir, with_manual):
+    """Yields one job per task* directory of every student checkout."""
+    for student_id in sorted(os.listdir(checkouts_dir)):
+        checkout = os.path.join(checkouts_dir, student_id)
+        if not os.path.isdir(checkout):
+            continue
+        for task_name in sorted(os.listdir(checkout)):
+            task_dir = os.path.join(checkout, task_name)
+            if task_name.startswith("task") and os.path.isdir(task_dir):
+                plan_path = os.path.join(plans_dir, student_id, f"{task_name}.json")
+                yield student_id, task_dir, plan_path, with_manual
+
+
+def grade(jobs, rules, workers):
+    """Grades the jobs in a pool of `workers` processes. Returns {student: {task: result}}."""
+    results = {}
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules,)) as pool:
+        for student_id, task_name, result in pool.map(grade_task, jobs, chunksize=chunksize):
+            results.setdefault(student_id, {})[task_name] = result
+    return results
+
+
+@tracing.traced("grade_cohort", "stage")
+def main():
+    parser = argparse.ArgumentParser(description="Grades many student checkouts in a process pool.")
+    parser.add_argument("checkouts_dir", help="Directory with one checkout per student (<dir>/<student>/task*/)")
+    parser.add_argument("plans_dir", help="Directory with exported plans (<dir>/<student>/<task>.json)")
+    parser.add_argument("output_dir", help="Directory for the per-student result files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--manual", action="store_true", help="Also run the Azure manual checks (requires az login)")
+    args = parser.parse_args()
+
+    rules = load_rules()
+    jobs = list(discover_jobs(args.checkouts_dir, args.plans_dir, args.manual))
+    if not jobs:
+        print(f"[INFO] No task directories found in {args.checkouts_dir}.")
+        return 0
+
+    print(f"[INFO] Grading {len(jobs)} task(s) with {args.workers} worker(s)...")
+
+    results = grade(jobs, rules, args.workers)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed_students = 0
+    for student_id, tasks in results.items():
+        with open(os.path.join(args.output_dir, f"{student_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(tasks, f, indent=2)
+        if any(task[check]["status"] == "failure" for task in tasks.values() for check in ("quiz", "plan", "manual")):
+            failed_students += 1
+
+    print(f"[RESULT] Graded {len(results)} student(s); {failed_students} with failures. Results in {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
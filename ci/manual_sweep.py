@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import check_manual_steps
+import results_store
+import rules_bundle
+import tracing
+from check_manual_steps import STORAGE_ACCOUNT_TYPE, build_index, check_label, storage_account
+
+# Evaluates the manual_checks.json rules of every task for every student at once. The
+# inventory of all rg-course-* groups comes from a couple of paged Resource Graph queries
+# instead of one 'az resource list' per student and check; only blob containers, which
+# Resource Graph does not index, are probed one storage account at a time.
+
+GROUP_PREFIX = "rg-course-"
+# Groups created by backend_bootstrap.py; they mark a student even before any task group exists
+STATE_SUFFIX = "state"
+GRAPH_FILTER = f"where resourceGroup startswith '{GROUP_PREFIX}'"
+GROUPS_QUERY = (
+    "ResourceContainers | where type == 'microsoft.resources/subscriptions/resourcegroups'"
+    f" and name startswith '{GROUP_PREFIX}' | project name | order by name asc"
+)
+RESOURCES_QUERY = f"Resources | {GRAPH_FILTER} | project name, type, resourceGroup | order by resourceGroup asc, name asc"
+MAX_PARALLEL_PROBES = int(os.environ.get("MANUAL_CHECKS_CONCURRENCY", "4"))
+
+
+class FixtureBackend:
+    """
+    Offline stand-in for the query backend. Reads a JSON file with 'resource_groups' (names),
+    'resources' ({name, type, resourceGroup}) and 'containers' ({account: [container, ...]}).
+    """
+
+    def __init__(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            self.fixture = json.load(f)
+
+    def query_graph(self, query):
+        if query == GROUPS_QUERY:
+            return [{"name": name} for name in sorted(self.fixture.get("resource_groups", []))]
+        if query == RESOURCES_QUERY:
+            return sorted(self.fixture.get("resources", []), key=lambda r: (r["resourceGroup"].lower(), r["name"].lower()))
+        raise ValueError(f"Fixture backend cannot answer query: {query}")
+
+    def container_exists(self, account_name, container_name):
+        return container_name in self.fixture.get("containers", {}).get(account_name, [])
+
+
+class Inventory:
+    """Resources of all course groups, indexed by (lower-cased group, lower-cased type), then name."""
+
+    def __init__(self, groups, resources):
+        self.groups = {name.lower() for name in groups}
+        by_group = {}
+        for r in resources:
+            by_group.setdefault(r.get("resourceGroup", "").lower(), []).append(r)
+        self._index = {}
+        for rg_name, rows in by_group.items():
+            self.groups.add(rg_name)
+            for r_type, by_name in build_index(rows).items():
+                self._index[(rg_name, r_type)] = by_name
+
+    def find(self, rg_name, r_type, match=lambda name: True):
+        by_name = self._index.get((rg_name.lower(), r_type.lower()), {})
+        return [r for name, r in by_name.items() if match(name)]
+
+
+@tracing.traced("manual_sweep.inventory", "io")
+def fetch_inventory(backend):
+    groups = [row["name"] for row in backend.query_graph(GROUPS_QUERY)]
+    resources = backend.query_graph(RESOURCES_QUERY)
+    print(f"[INFO] Inventory: {len(groups)} resource group(s), {len(resources)} resource(s).")
+    return Inventory(groups, resources)
+
+
+def student_ids(groups, suffixes):
+    """Student ids of the rg-course-<id>-<suffix> groups, for the configured suffixes and 'state'."""
+    suffixes = {s.lower() for s in suffixes} | {STATE_SUFFIX}
+    students = set()
+    for name in groups:
+        if not name.startswith(GROUP_PREFIX):
+            continue
+        student, _, suffix = name[len(GROUP_PREFIX):].rpartition("-")
+        if student and suffix in suffixes:
+            students.add(student)
+    return sorted(students)
+
+
+def evaluate_check(inventory, rg_name, check):
+    """
+    Returns (passed, detail, probe) of one check against the inventory. Container checks that
+    need a look into a storage account return passed None and the (account, container) probe.
+    """
+    kind = check.get("type")
+    if kind == "resource_exists":
+        name_contains = check.get("name_contains", "").lower()
+        found = inventory.find(rg_name, check.get("resource_type", ""), lambda name: name_contains in name)
+        if found:
+            return True, found[0].get("name"), None
+        return False, f"not found in {rg_name}", None
+    if kind == "container_exists":
+        accounts = inventory.find(rg_name, STORAGE_ACCOUNT_TYPE)
+        if not accounts:
+            return False, f"no storage account in {rg_name}", None
+        probe = (storage_account(accounts).get("name"), check.get("container_name"))
+        return None, f"{probe[0]}/{probe[1]}", probe
+    return None, f"unknown check type '{kind}'", None
+
+
+def probe_containers(backend, probes, max_workers=MAX_PARALLEL_PROBES):
+    """Returns {(account, container): exists} for the distinct probes; a failed probe counts as missing."""
+    def probe(key):
+        try:
+            return bool(backend.container_exists(*key))
+        except Exception as e:
+            print(f"[WARN] Could not query container '{key[1]}' of {key[0]}: {e}")
+            return False
+
+    keys = sorted(set(probes))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return dict(zip(keys, pool.map(probe, keys)))
+
+
+@tracing.traced("manual_sweep", "stage")
+def sweep(backend, config, students=None, tasks=None):
+    """
+    Evaluates the manual checks of `tasks` (default: all configured) for `students`
+    (default: every student with a course group). Returns {student: {task: {passed, resource_group, items}}}.
+    """
+    tasks = [task for task in config if tasks is None or task in tasks]
+    inventory = fetch_inventory(backend)
+    if students is None:
+        students = student_ids(inventory.groups, {config[task].get("rg_suffix", "ch1") for task in tasks})
+    students = [student.lower() for student in students]
+
+    matrix, pending = {}, []
+    for student in students:
+        for task in tasks:
+            rg_name = check_manual_steps.resource_group_name(student, config[task]).lower()
+            items = []
+            for check in config[task].get("checks", []):
+                passed, detail, probe = evaluate_check(inventory, rg_name, check)
+                items.append({"item": check_label(check), "passed": passed, "detail": detail})
+                if probe:
+                    pending.append((items[-1], probe))
+            matrix.setdefault(student, {})[task] = {"resource_group": rg_name, "items": items}
+
+    if pending:
+        exists = probe_containers(backend, [probe for _, probe in pending])
+        print(f"[INFO] Probed {len(exists)} blob container(s).")
+        for item, probe in pending:
+            item["passed"] = exists[probe]
+
+    for tasks_of_student in matrix.values():
+        for result in tasks_of_student.values():
+            # Unknown check types are reported, as in check_manual_steps.py, but do not fail the task
+            result["passed"] = all(item["passed"] is not False for item in result["items"])
+    return matrix
+
+
+def record(matrix, duration):
+    """Appends one 'manual' record per (student, task) to the results store."""
+    per_result = round(duration / max(1, sum(len(tasks) for tasks in matrix.values())), 3)
+    for student, tasks in matrix.items():
+        for task, result in tasks.items():
+            items = [item for item in result["items"] if item["passed"] is not None]
+            results_store.record("manual", task, result["passed"], items, duration=per_result, student=student)
+
+
+def format_matrix(matrix, tasks, markdown=False):
+    rows = [["student", *tasks, "passed"]]
+    for student, results in sorted(matrix.items()):
+        marks = [("PASS" if results[task]["passed"] else "FAIL") if task in results else "-" for task in tasks]
+        rows.append([student, *marks, f"{marks.count('PASS')}/{len(tasks)}"])
+    if markdown:
+        lines = ["| " + " | ".join(row) + " |" for row in rows]
+        lines.insert(1, "|" + "---|" * len(rows[0]))
+        return "\n".join(lines)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the manual checks of every task for the whole cohort.")
+    parser.add_argument("--fixture", metavar="PATH", help="Answer queries from a JSON fixture instead of Azure")
+    parser.add_argument("--students", nargs="+", metavar="ID",
+                        help="Students to check (default: every student with an rg-course-* group)")
+    parser.add_argument("--tasks", nargs="+", metavar="TASK", help="Tasks to check (default: all in manual_checks.json)")
+    parser.add_argument("--output", metavar="PATH", help="Write the matrix with per-check details as JSON")
+    parser.add_argument("--record", action="store_true", help="Append the verdicts to the results store")
+    args = parser.parse_args()
+
+    config = rules_bundle.load_rules("manual_checks")
+    if not config:
+        print("[INFO] No manual checks configured.")
+        return 0
+    backend = FixtureBackend(args.fixture) if args.fixture else check_manual_steps.get_backend()
+
+    started = time.perf_counter()
+    try:
+        matrix = sweep(backend, config, students=args.students, tasks=args.tasks)
+    except Exception as e:
+        print(f"[ERROR] Sweep failed: {e}")
+        return 2
+    duration = time.perf_counter() - started
+
+    tasks = [task for task in config if args.tasks is None or task in args.tasks]
+    print(format_matrix(matrix, tasks))
+    failed = sum(1 for results in matrix.values() if not all(r["passed"] for r in results.values()))
+    print(f"[RESULT] {len(matrix)} student(s), {failed} with failures ({duration:.1f}s).")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(matrix, f, indent=2)
+    if args.record:
+        record(matrix, duration)
+    summary = os.environ.get("GITHUB_STEP_SUMMARY")
+    if summary:
+        with open(summary, "a", encoding="utf-8") as f:
+            f.write("### Manual checks (cohort)\n\n" + format_matrix(matrix, tasks, markdown=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+# Runs the pre-plan validation steps (router, quiz, manual checks, variables, report)
+# in one interpreter. Stage modules are imported lazily, independent stages run
+# concurrently, and results are handed between stages as dicts instead of files.
+# Each stage prints into its own buffer, which is written out as one log group.
+
+
+class Stage:
+    """One pipeline step: its dependencies and the function that runs it."""
+    __slots__ = ("name", "deps", "func", "always")
+
+    def __init__(self, name, deps, func, always=False):
+        self.name = name
+        self.deps = deps
+        self.func = func
+        # 'always' stages run even after a failure (e.g. the report)
+        self.always = always
+
+
+def status_of(code):
+    return "success" if code == 0 else "failure"
+
+
+# --- Stages ---
+
+def stage_route(ctx, out):
+    import which_checks
+
+    return {"status": "success", **which_checks.checks_for(ctx["task_name"])}
+
+
+def stage_quiz(ctx, out):
+    if not ctx["results"]["route"]["quiz"]:
+        return {"status": "skipped"}
+    import check_quiz
+
+    code, grade = check_quiz.check(ctx["task_dir"], out=out)
+    return {"status": status_of(code), "grade": grade}
+
+
+def stage_manual(ctx, out):
+    if not ctx["results"]["route"]["manual"]:
+        return {"status": "skipped"}
+    if not ctx["student_id"]:
+        print("[ERROR] Manual checks need a student id.", file=out)
+        return {"status": "failure"}
+    import check_manual_steps
+
+    code, result = check_manual_steps.check(ctx["task_dir"], ctx["student_id"], out=out)
+    return {"status": status_of(code), "manual": result}
+
+
+def stage_static(ctx, out):
+    if not ctx["results"]["route"]["plan"]:
+        return {"status": "skipped"}
+    import static_check
+
+    answers_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "answers.json")
+    code, results = static_check.run(ctx["task_dir"], answers_path, out=out)
+    return {"status": status_of(code), "checks": [list(r) for r in results]}
+
+
+def stage_variables(ctx, out):
+    import set_env
+
+    code, exported = set_env.export(ctx["task_dir"], out=out)
+    return {"status": status_of(code), "variables": exported}
+
+
+def stage_report(ctx, out):
+    import create_report
+
+    results = ctx["results"]
+    route = results.get("route", {})
+    is_failure = create_report.create_report(
+        status_quiz=results.get("quiz", {}).get("status", "skipped"),
+        status_manual=results.get("manual", {}).get("status", "skipped"),
+        # Plan and apply run outside the pipeline; their outcomes come from the workflow
+        status_plan=os.environ.get("PLAN_RESULT") or (
+            "failure" if results.get("static", {}).get("status") == "failure" else "skipped"),
+        status_apply=os.environ.get("APPLY_RESULT", "skipped"),
+        run_quiz=route.get("quiz", True),
+        run_manual=route.get("manual", True),
+        run_plan=route.get("plan", True),
+        event_name=os.environ.get("GITHUB_EVENT_NAME", "pull_request"),
+        student_id=ctx["student_id"] or "Unknown",
+        task_dir=ctx["task_name"],
+    )
+    return {"status": "success", "is_failure": is_failure}
+
+
+STAGES = (
+    Stage("route", (), stage_route),
+    Stage("quiz", ("route",), stage_quiz),
+    Stage("manual", ("route",), stage_manual),
+    Stage("static", ("route",), stage_static),
+    Stage("variables", ("quiz", "manual", "static"), stage_variables),
+    Stage("report", ("quiz", "manual", "static"), stage_report, always=True),
+)
+DEFAULT_STAGES = ("route", "quiz", "manual", "static", "variables")
+
+
+def _run_stage(stage, ctx):
+    """Runs one stage with its own output buffer. Returns (result, output)."""
+    out = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage.name, "stage"):
+            result = stage.func(ctx, out)
+    except Exception as e:
+        print(f"[ERROR] Stage '{stage.name}' raised: {e}", file=out)
+        result = {"status": "failure", "error": str(e)}
+    result["duration"] = round(time.perf_counter() - started, 3)
+    return result, out.getvalue()
+
+
+def run_pipeline(task_dir, student_id=None, stage_names=DEFAULT_STAGES, max_workers=4):
+    """
+    Runs the selected stages as a dependency graph. A stage starts once its selected
+    dependencies are done; after the first failure no new stage starts except 'always' ones.
+    Returns {stage name: result dict}.
+    """
+    selected = [s for s in STAGES if s.name in stage_names]
+    names = {s.name for s in selected}
+    task_dir = os.path.abspath(task_dir)
+    ctx = {
+        "task_dir": task_dir,
+        "task_name": os.path.basename(task_dir),
+        "student_id": student_id,
+        "results": {},
+    }
+    results = ctx["results"]
+    pending = list(selected)
+    running = {}
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for stage in list(pending):
+                deps = [d for d in stage.deps if d in names]
+                if any(d not in results for d in deps):
+                    continue
+                pending.remove(stage)
+                if failed and not stage.always:
+                    results[stage.name] = {"status": "skipped", "reason": "short-circuited"}
+                    continue
+                running[pool.submit(_run_stage, stage, ctx)] = stage
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                result, output = future.result()
+                results[stage.name] = result
+                failed = failed or result["status"] == "failure"
+                sys.stdout.write(f"::group::{stage.name} ({result['status']}, {result['duration']}s)\n")
+                sys.stdout.write(output)
+                sys.stdout.write("::endgroup::\n")
+                sys.stdout.flush()
+
+    return results
+
+
+def write_github_outputs(results):
+    """Emits the same outputs as which_checks.py plus one '<stage>_result' per stage."""
+    lines = []
+    route = results.get("route")
+    if route:
+        for check in ("quiz", "plan", "manual"):
+            lines.append(f"run_{check}={str(route[check]).lower()}")
+    for name, result in results.items():
+        lines.append(f"{name}_result={result['status']}")
+    if results.get("report", {}).get("is_failure"):
+        lines.append("is_failure=true")
+
+    github_output = os.environ.get("GITHUB_OUTPUT")
+    if github_output:
+        with open(github_output, "a") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the validation stages in one process.")
+    parser.add_argument("task_dir")
+    parser.add_argument("student_id", nargs="?", default=os.environ.get("TF_VAR_student_id"))
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                        help=f"Comma-separated stages out of: {', '.join(s.name for s in STAGES)}")
+    parser.add_argument("--results-file", help="Write the structured stage results to this JSON file")
+    args = parser.parse_args()
+
+    stage_names = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stage_names) - {s.name for s in STAGES}
+    if unknown:
+        print(f"[ERROR] Unknown stage(s): {', '.join(sorted(unknown))}")
+        return 2
+
+    results = run_pipeline(args.task_dir, args.student_id, stage_names)
+    write_github_outputs(results)
+
+    if args.results_file:
+        with open(args.results_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [name for name, r in results.items() if r["status"] == "failure"]
+    print(f"[RESULT] Pipeline {'FAILED at ' + ', '.join(failed) if failed else 'PASSED'}.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import tracing
+import validate_plan
+
+# A pruned plan artifact keeps, per resource, only the address, the planned actions and the
+# planned attributes referenced by the task's rules, gzip-compressed. Provider schemas, prior
+# state, configuration and the before/after documents are dropped. validate_plan.py reads it
+# in place of the full `terraform show -json` output; `pack --full` keeps a lossless copy.
+
+ARTIFACT_FORMAT = "course-plan-artifact/1"
+# Artifacts are written with this key first, so a reader can tell them from full plans
+ARTIFACT_PREFIX = '{"artifact_format":'
+# spec_hash of artifacts that kept every planned attribute
+ALL_ATTRIBUTES = "all"
+
+
+def spec_hash(spec) -> str:
+    """Identifies the rules an artifact was pruned for."""
+    if spec is None:
+        return ALL_ATTRIBUTES
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@tracing.traced("plan_artifact.build", "ci")
+def build(plan_path: Path, spec) -> dict:
+    """
+    Reads a full plan (plain or gzip) in one streaming pass and returns the artifact document.
+    With `spec` None every planned attribute is kept.
+    """
+    plain = json.JSONDecoder()
+    if spec is None:
+        values_decoder = plain
+    else:
+        values_decoder = json.JSONDecoder(object_hook=validate_plan._projecting_hook(validate_plan.compile_rules(spec)))
+    with validate_plan.open_plan(plan_path) as f:
+        found = validate_plan._PlanStream(f).find_all({
+            "format_version": plain,
+            "terraform_version": plain,
+            "planned_values": values_decoder,
+            "resource_changes": json.JSONDecoder(object_hook=validate_plan._change_hook),
+        }, stop_keys=validate_plan.PLAN_TAIL_KEYS, after=("planned_values",))
+
+    planned_values = found.get("planned_values") or {}
+    if spec is None:
+        resources = _unprojected_resources(planned_values.get("root_module", {}))
+    else:
+        resources = validate_plan.module_resources(planned_values.get("root_module", {}))
+    actions = {change["address"]: change for change in found.get("resource_changes") or []}
+
+    entries = []
+    for resource in resources:
+        change = actions.pop(resource.address, None)
+        entries.append({
+            "address": resource.address, "mode": resource.mode, "type": resource.type,
+            "name": resource.name, "index": resource.index,
+            # Unknown without a resource_changes entry, as when the full plan is read
+            "actions": change["actions"] if change else None,
+            "values": resource.values,
+        })
+    # Changes without planned values, e.g. deletes: kept so the actions are not lost
+    for change in actions.values():
+        entries.append({**change, "values": None})
+    entries.sort(key=lambda e: e["address"])
+
+    return {
+        "artifact_format": ARTIFACT_FORMAT,
+        "spec_hash": spec_hash(spec),
+        "format_version": found.get("format_version"),
+        "terraform_version": found.get("terraform_version"),
+        "resources": entries,
+    }
+
+
+def _unprojected_resources(root_module):
+    resources = []
+
+    def extract_from_module(module):
+        for r in module.get("resources", []):
+            resources.append(validate_plan.PlannedResource(
+                r.get("address"), r.get("mode"), r.get("type"), r.get("name"), r.get("index"), r.get("values") or {}))
+        for child in module.get("child_modules", []):
+            extract_from_module(child)
+
+    extract_from_module(root_module)
+    return resources
+
+
+def write(artifact: dict, out_path: Path):
+    # mtime=0 keeps the bytes stable for identical plans
+    data = json.dumps(artifact, separators=(",", ":")).encode("utf-8")
+    with open(out_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+
+
+def write_full(plan_path: Path, out_path: Path):
+    """Lossless gzip copy of the full plan; validate_plan.py reads it as well."""
+    with open(plan_path, "rb") as src, open(out_path, "wb") as raw, \
+            gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, validate_plan.READ_CHUNK)
+
+
+@tracing.traced("plan_artifact.load", "io")
+def load_index(f, spec: dict) -> validate_plan.ResourceIndex:
+    """Indexes an artifact opened as text. Refuses artifacts pruned for different rules."""
+    artifact = json.load(f)
+    if artifact.get("artifact_format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported plan artifact format '{artifact.get('artifact_format')}'")
+    if artifact.get("spec_hash") not in (ALL_ATTRIBUTES, spec_hash(spec)):
+        raise ValueError("Plan artifact was pruned for different rules; validate the full plan instead")
+
+    resources, removed = [], []
+    for e in artifact.get("resources", []):
+        resource = validate_plan.PlannedResource(e["address"], e.get("mode"), e.get("type"), e.get("name"),
+                                                 e.get("index"), e["values"], e.get("actions"))
+        # Entries without values are resources the plan removes
+        (removed if e["values"] is None else resources).append(resource)
+    return validate_plan.ResourceIndex(resources, removed)
+
+
+def task_spec(task, answers_path: Path):
+    """The task's plan rules; {} when there are none (addresses and actions only)."""
+    return validate_plan.load_answers(answers_path).get(task, {})
+
+
+@tracing.traced("plan_artifact", "stage")
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Writes pruned, compressed plan artifacts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pack = sub.add_parser("pack", help="Prune a 'terraform show -json' plan into an artifact")
+    pack.add_argument("plan", type=Path)
+    pack.add_argument("out", type=Path)
+    scope = pack.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--task", help="Keep the attributes referenced by this task's rules")
+    scope.add_argument("--all-attributes", action="store_true", help="Keep every planned attribute")
+    pack.add_argument("--answers", type=Path, default=Path(validate_plan.__file__).with_name("answers.json"))
+    pack.add_argument("--full", type=Path, metavar="PATH", help="Also write a lossless gzip copy of the plan")
+    unpack = sub.add_parser("unpack", help="Print an artifact (or gzip plan) as JSON")
+    unpack.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "unpack":
+        with validate_plan.open_plan(args.path) as f:
+            shutil.copyfileobj(f, sys.stdout)
+        return 0
+
+    try:
+        spec = None if args.all_attributes else task_spec(args.task, args.answers)
+        artifact = build(args.plan, spec)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Could not read plan {args.plan}: {e}")
+        return 2
+    write(artifact, args.out)
+    if args.full:
+        write_full(args.plan, args.full)
+
+    size, packed = args.plan.stat().st_size, args.out.stat().st_size
+    print(f"[INFO] {args.out}: {len(artifact['resources'])} resource(s), "
+          f"{packed} bytes ({size / max(packed, 1):.0f}x smaller than the plan)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
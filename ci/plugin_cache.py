@@ -0,0 +1,282 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import tracing
+
+# Provider plugin cache for 'terraform init'. Each set of provider requirements gets its own
+# TF_PLUGIN_CACHE_DIR under PLUGIN_CACHE_ROOT, keyed by the task's .terraform.lock.hcl (or,
+# without one, by its required_providers constraints) and the platform. The workflows persist
+# that directory with actions/cache; `init` wraps terraform init and records whether the
+# providers came from the cache, plus the bytes reused or downloaded. The records are kept
+# outside the cached directories, so each run has its own; the workflows upload them and
+# `stats` aggregates any number of runs.
+
+CI_CACHE_DIR = os.environ.get("CI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "course-ci"))
+CACHE_ROOT = os.environ.get("PLUGIN_CACHE_ROOT", os.path.join(CI_CACHE_DIR, "plugins"))
+STATS_FILE = os.environ.get("PLUGIN_CACHE_STATS", os.path.join(CI_CACHE_DIR, "plugin-cache-stats.jsonl"))
+# Optional filesystem mirror (terraform providers mirror layout) used instead of the registry
+MIRROR = os.environ.get("PLUGIN_MIRROR")
+LOCK_FILE = ".terraform.lock.hcl"
+# Written once an init against the directory succeeded, i.e. the providers are all there
+READY_MARKER = ".complete"
+_ARCH = {"x86_64": "amd64", "amd64": "amd64", "aarch64": "arm64", "arm64": "arm64"}
+
+
+def platform_name():
+    machine = platform.machine().lower()
+    return f"{platform.system().lower()}_{_ARCH.get(machine, machine)}"
+
+
+def provider_requirements(task_dir):
+    """
+    {local name: {"source", "version"}} from required_providers, plus implicit hashicorp/<prefix>
+    providers of resources without a declaration. None if the .tf files cannot be read.
+    """
+    import static_check
+
+    requirements, used = {}, set()
+    try:
+        for path in sorted(glob.glob(os.path.join(task_dir, "*.tf"))):
+            body = static_check.parse_file(path)
+            for block in body.blocks:
+                if block.type == "terraform":
+                    for required in block.nested("required_providers"):
+                        for name, expr in required.attributes.items():
+                            value = static_check.evaluate(expr, static_check.Scope())
+                            requirements[name] = value if isinstance(value, dict) else {"version": value}
+                elif block.type in ("resource", "data") and block.labels:
+                    used.add(block.labels[0].split("_", 1)[0])
+                elif block.type == "provider" and block.labels:
+                    used.add(block.labels[0])
+    except (OSError, ValueError):
+        return None
+    for name in used - requirements.keys():
+        requirements[name] = {"source": f"hashicorp/{name}"}
+    return {name: {k: str(v) for k, v in req.items() if isinstance(v, (str, int, float))}
+            for name, req in requirements.items()}
+
+
+def cache_key(task_dir):
+    """'lock-<hash>' from the lock file, else 'req-<hash>' from the provider constraints, plus the platform."""
+    lock_path = os.path.join(task_dir, LOCK_FILE)
+    digest = hashlib.sha256()
+    if os.path.exists(lock_path):
+        kind = "lock"
+        with open(lock_path, "rb") as f:
+            digest.update(f.read())
+    else:
+        requirements = provider_requirements(task_dir)
+        if requirements is not None:
+            kind = "req"
+            digest.update(json.dumps(requirements, sort_keys=True).encode("utf-8"))
+        else:
+            # Unreadable configuration: any change to the .tf files is a new key
+            kind = "tf"
+            for path in sorted(glob.glob(os.path.join(task_dir, "*.tf"))):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return f"{kind}-{digest.hexdigest()[:16]}-{platform_name()}"
+
+
+def cache_dir(key):
+    return os.path.join(CACHE_ROOT, key)
+
+
+def dir_size(path):
+    """Bytes of the regular files below `path` (the ready marker aside); symlinks are not followed."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name == READY_MARKER and root == path:
+                continue
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if not os.path.islink(os.path.join(root, name)):
+                total += st.st_size
+    return total
+
+
+def _write_cli_config(mirror, directory):
+    """A CLI config that installs providers only from `mirror`, so init needs no network."""
+    path = os.path.join(directory, "mirror.tfrc")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("provider_installation {\n  filesystem_mirror {\n    path = "
+                + json.dumps(os.path.abspath(mirror)) + '\n    include = ["*/*/*"]\n  }\n}\n')
+    return path
+
+
+def environment(task_dir, key=None, mirror=MIRROR):
+    """Environment variables that point terraform at the keyed plugin cache (and the mirror)."""
+    key = key or cache_key(task_dir)
+    directory = cache_dir(key)
+    os.makedirs(directory, exist_ok=True)
+    env = {"TF_PLUGIN_CACHE_DIR": directory}
+    if not os.path.exists(os.path.join(task_dir, LOCK_FILE)):
+        # Without a lock file terraform would re-download to record checksums instead of using the cache
+        env["TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE"] = "true"
+    if mirror:
+        env["TF_CLI_CONFIG_FILE"] = _write_cli_config(mirror, CACHE_ROOT)
+    return env
+
+
+def init(task_dir, init_args=(), env=None, mirror=MIRROR, capture=False):
+    """
+    Runs 'terraform init' in `task_dir` against its keyed plugin cache.
+    Returns (completed process, stats record).
+    """
+    key = cache_key(task_dir)
+    directory = cache_dir(key)
+    hit = os.path.exists(os.path.join(directory, READY_MARKER))
+    size_before = dir_size(directory)
+    run_env = {**(env or os.environ), **environment(task_dir, key, mirror)}
+
+    started = time.perf_counter()
+    result = tracing.run(["terraform", "init", "-input=false", *init_args], cwd=task_dir, env=run_env,
+                         capture_output=capture, text=True)
+    size_after = dir_size(directory)
+    if result.returncode == 0:
+        with open(os.path.join(directory, READY_MARKER), "w") as f:
+            f.write(str(int(time.time())))
+
+    record = {
+        "time": int(time.time()),
+        "task": os.path.basename(os.path.abspath(task_dir)),
+        "key": key,
+        "hit": hit,
+        "bytes_reused": size_before if hit else 0,
+        "bytes_downloaded": max(0, size_after - size_before),
+        "init_seconds": round(time.perf_counter() - started, 2),
+        "ok": result.returncode == 0,
+    }
+    _append_stats(record)
+    return result, record
+
+
+def _append_stats(record):
+    try:
+        os.makedirs(os.path.dirname(STATS_FILE) or ".", exist_ok=True)
+        with open(STATS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"[WARN] Could not record plugin cache stats: {e}", file=sys.stderr)
+
+
+def summarize(records):
+    records = list(records)
+    hits = [r for r in records if r["hit"]]
+    misses = [r for r in records if not r["hit"]]
+
+    def mean(values):
+        return round(sum(values) / len(values), 2) if values else None
+
+    return {
+        "inits": len(records),
+        "hits": len(hits),
+        "hit_rate": round(len(hits) / len(records), 3) if records else None,
+        "bytes_saved": sum(r["bytes_reused"] for r in hits),
+        "bytes_downloaded": sum(r["bytes_downloaded"] for r in records),
+        "mean_init_seconds_hit": mean([r["init_seconds"] for r in hits]),
+        "mean_init_seconds_miss": mean([r["init_seconds"] for r in misses]),
+    }
+
+
+def read_stats(paths=None):
+    """Records of the given stats files (default: this run's), in file order."""
+    records = []
+    for path in paths or [STATS_FILE]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+        except OSError:
+            continue
+    return records
+
+
+def prune(max_age_days):
+    """Removes cache directories whose last successful init is older than `max_age_days`."""
+    removed = 0
+    cutoff = time.time() - max_age_days * 86400
+    for entry in os.scandir(CACHE_ROOT) if os.path.isdir(CACHE_ROOT) else ():
+        marker = os.path.join(entry.path, READY_MARKER)
+        if entry.is_dir() and os.path.getmtime(marker if os.path.exists(marker) else entry.path) < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _mb(n):
+    return f"{n / (1 << 20):.1f} MB"
+
+
+def _write_github(path_var, lines):
+    path = os.environ.get(path_var)
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@tracing.traced("plugin_cache", "stage")
+def main():
+    parser = argparse.ArgumentParser(description="Keyed provider plugin cache around terraform init.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    key_cmd = sub.add_parser("key", help="Print the cache key and directory of a task")
+    key_cmd.add_argument("task_dir")
+    key_cmd.add_argument("--github-output", action="store_true", help="Also write key/path to GITHUB_OUTPUT")
+    init_cmd = sub.add_parser("init", help="terraform init with the keyed plugin cache")
+    init_cmd.add_argument("task_dir")
+    init_cmd.add_argument("--mirror", default=MIRROR, help="Install providers from this filesystem mirror only")
+    init_cmd.add_argument("init_args", nargs=argparse.REMAINDER, help="Extra arguments for terraform init (after --)")
+    stats_cmd = sub.add_parser("stats", help="Hit rate and bytes saved over the recorded inits")
+    stats_cmd.add_argument("paths", nargs="*", metavar="STATS_FILE",
+                           help="Stats files to aggregate, e.g. downloaded from several runs (default: PLUGIN_CACHE_STATS)")
+    stats_cmd.add_argument("--json", action="store_true")
+    prune_cmd = sub.add_parser("prune", help="Remove cache directories unused for a while")
+    prune_cmd.add_argument("--max-age-days", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.command == "key":
+        key = cache_key(args.task_dir)
+        print(key)
+        if args.github_output:
+            _write_github("GITHUB_OUTPUT", [f"key={key}", f"path={cache_dir(key)}"])
+        return 0
+
+    if args.command == "init":
+        init_args = args.init_args[1:] if args.init_args[:1] == ["--"] else args.init_args
+        result, record = init(args.task_dir, init_args, mirror=args.mirror)
+        if record["hit"]:
+            line = f"Provider plugins: cache hit ({record['key']}), {_mb(record['bytes_reused'])} reused"
+        else:
+            line = f"Provider plugins: cache miss ({record['key']}), {_mb(record['bytes_downloaded'])} downloaded"
+        print(f"[INFO] {line}, init took {record['init_seconds']}s")
+        _write_github("GITHUB_STEP_SUMMARY", [f"- 📦 {line}"])
+        return result.returncode
+
+    if args.command == "prune":
+        print(f"[INFO] Removed {prune(args.max_age_days)} cache director(ies).")
+        return 0
+
+    summary = summarize(read_stats(args.paths))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    elif not summary["inits"]:
+        print("No inits recorded.")
+    else:
+        print(f"{summary['inits']} init(s), hit rate {summary['hit_rate']:.0%}, "
+              f"{_mb(summary['bytes_saved'])} saved, {_mb(summary['bytes_downloaded'])} downloaded; "
+              f"mean init {summary['mean_init_seconds_hit']}s on a hit, {summary['mean_init_seconds_miss']}s on a miss")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import tracing
+
+# Selected options look like '- [x] A' or '- [X] b)'
+ANSWER_PATTERN = re.compile(r'-\s*\[[xX]\]\s*([A-Za-z])')
+
+ARTIFACT_VERSION = 1
+# Kept out of the working tree: the artifact holds absolute paths and must never be committed
+ARTIFACT_DIR = os.environ.get(
+    "CI_ARTIFACT_DIR",
+    os.path.join(os.environ.get("CI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "course-ci")), "quiz"),
+)
+
+
+def quiz_files(task_dir):
+    """
+    Returns the markdown file holding the quiz, as a list: instructions.md when present,
+    otherwise the first .md file of the task directory in name order.
+    """
+    if not os.path.isdir(task_dir):
+        return []
+    names = sorted(f for f in os.listdir(task_dir) if f.endswith(".md"))
+    if "instructions.md" in names:
+        return [os.path.join(task_dir, "instructions.md")]
+    return [os.path.join(task_dir, name) for name in names[:1]]
+
+
+def scan(content, source):
+    """Single pass over one file's text. Returns answer records in document order."""
+    answers = []
+    line, last = 1, 0
+    for match in ANSWER_PATTERN.finditer(content):
+        line += content.count("\n", last, match.start())
+        last = match.start()
+        answers.append({"letter": match.group(1).upper(), "file": source, "line": line})
+    return answers
+
+
+def _stat_signature(paths):
+    signature = []
+    for path in paths:
+        st = os.stat(path)
+        signature.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def _artifact_path(task_name):
+    return os.path.join(ARTIFACT_DIR, f"quiz_answers-{task_name}.json")
+
+
+def read_artifact(task_name):
+    """Returns the stored answers artifact of a task, or None."""
+    try:
+        with open(_artifact_path(task_name), "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != ARTIFACT_VERSION:
+        return None
+    return artifact
+
+
+def _write_artifact(task_name, artifact):
+    try:
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        with open(_artifact_path(task_name), "w", encoding="utf-8") as f:
+            json.dump(artifact, f, indent=2)
+    except OSError as e:
+        print(f"[WARN] Could not write quiz answers artifact: {e}")
+
+
+@tracing.traced("extract_answers", "io")
+def extract_answers(task_dir, use_artifact=True):
+    """
+    Returns the answer records of a task, numbered by question position.
+    The result is stored in an artifact keyed by the hash of the quiz files, so later
+    steps reuse it; files whose size and mtime are unchanged are not even re-read.
+    """
+    task_name = os.path.basename(os.path.normpath(task_dir))
+    task_path = os.path.abspath(task_dir)
+    paths = quiz_files(task_dir)
+    signature = _stat_signature(paths)
+
+    artifact = read_artifact(task_name) if use_artifact else None
+    if artifact and artifact.get("task_dir") != task_path:
+        artifact = None
+    if artifact and artifact.get("files") == signature:
+        return artifact["answers"]
+
+    digest = hashlib.sha256()
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0" + data + b"\0")
+        contents.append((path, data))
+    content_hash = digest.hexdigest()
+
+    if artifact and artifact.get("content_hash") == content_hash:
+        answers = artifact["answers"]
+    else:
+        answers = []
+        for path, data in contents:
+            answers.extend(scan(data.decode("utf-8"), os.path.basename(path)))
+        for position, answer in enumerate(answers, start=1):
+            answer["question"] = position
+
+    if not use_artifact:
+        return answers
+
+    _write_artifact(task_name, {
+        "version": ARTIFACT_VERSION,
+        "task": task_name,
+        "task_dir": task_path,
+        "content_hash": content_hash,
+        "files": signature,
+        "answers": answers,
+    })
+    return answers
+
+
+def selected_letters(task_dir, use_artifact=True):
+    """Returns just the selected letters of a task, in question order."""
+    return [answer["letter"] for answer in extract_answers(task_dir, use_artifact)]
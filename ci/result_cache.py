@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import rules_bundle
+import tracing
+
+# Files produced by CI inside the task directory; they must not change the key
+IGNORED_DIRS = {".terraform"}
+IGNORED_FILES = {"tfplan", "tfplan.json", "tfplan.json.gz", "tfplan.artifact.json.gz", "terraform.tfvars",
+                 ".terraform.tfstate.lock.info"}
+IGNORED_SUFFIXES = (".tfstate", ".tfstate.backup")
+
+STAGES = ("quiz", "manual", "plan")
+# Manual checks look at the student's live Azure resources, which can change without a push,
+# so their verdict is never reused: it is re-checked on every run, cache hit or not.
+CACHED_STAGES = ("quiz", "plan")
+DEFAULT_CACHE = os.path.join(os.environ.get("CI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "course-ci")), "results")
+
+
+def task_files(task_dir):
+    """Yields (relative path, absolute path) of the graded files of a task, in a stable order."""
+    for root, dirs, files in os.walk(task_dir):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for name in sorted(files):
+            if name in IGNORED_FILES or name.endswith(IGNORED_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, task_dir).replace(os.sep, "/"), path
+
+
+@tracing.traced("hash task files", "io")
+def cache_key(task_dir, student_id):
+    """Hash of the task directory's files, the rules bundle version and the student id."""
+    digest = hashlib.sha256()
+    digest.update(f"student={student_id.lower()}\0rules={rules_bundle.content_hash()}\0".encode("utf-8"))
+    for rel_path, path in task_files(task_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        digest.update(f"{rel_path}\0{len(data)}\0".encode("utf-8") + data)
+    return digest.hexdigest()
+
+
+# --- Stores ---
+
+class LocalDirStore:
+    """Keeps one JSON file per key in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, entry):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, self._path(key))
+
+
+class BlobStore:
+    """Keeps one JSON blob per key in an Azure Storage container, using the account key."""
+
+    def __init__(self, account, container, prefix=""):
+        self.account = account
+        self.container = container
+        self.prefix = prefix.strip("/")
+
+    def _name(self, key):
+        return f"{self.prefix}/{key}.json" if self.prefix else f"{key}.json"
+
+    def _az(self, args):
+        cmd = ["az", "storage", *args, "--account-name", self.account, "--container-name", self.container]
+        key = os.environ.get("STORAGE_KEY")
+        if key:
+            cmd += ["--account-key", key]
+        else:
+            cmd += ["--auth-mode", "login"]
+        return tracing.run(cmd, capture_output=True, text=True)
+
+    def get(self, key):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "entry.json")
+            result = self._az(["blob", "download", "--name", self._name(key), "--file", path, "--no-progress", "-o", "none"])
+            if result.returncode != 0:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    def put(self, key, entry):
+        self._az(["container", "create", "-o", "none"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "entry.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            result = self._az(["blob", "upload", "--name", self._name(key), "--file", path, "--overwrite", "-o", "none"])
+        if result.returncode != 0:
+            raise RuntimeError(f"Blob upload failed: {result.stderr.strip()}")
+
+
+def open_store(location=None):
+    """
+    Opens the store named by `location` (or RESULT_CACHE):
+    'blob://<account>/<container>[/<prefix>]', 'dir:<path>' or a plain directory path.
+    """
+    location = location or os.environ.get("RESULT_CACHE") or DEFAULT_CACHE
+    if location.startswith("blob://"):
+        account, _, rest = location[len("blob://"):].partition("/")
+        container, _, prefix = rest.partition("/")
+        return BlobStore(account, container, prefix)
+    if location.startswith("dir:"):
+        location = location[len("dir:"):]
+    return LocalDirStore(location)
+
+
+# --- Commands ---
+
+def _append(env_name, lines):
+    path = os.environ.get(env_name)
+    if path:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def lookup(task_dir, student_id, store):
+    key = cache_key(task_dir, student_id)
+    entry = store.get(key)
+    outputs = [f"cache_key={key}", f"cache_hit={'true' if entry else 'false'}"]
+
+    if not entry:
+        print(f"[INFO] No cached result for {os.path.basename(os.path.normpath(task_dir))} ({key[:12]}).")
+        _append("GITHUB_OUTPUT", outputs)
+        return None
+
+    print(f"[INFO] Cache hit ({key[:12]}): results from {entry.get('sha') or 'a previous run'} are reused.")
+    for stage in CACHED_STAGES:
+        status = entry["results"].get(stage, "skipped")
+        print(f"   [CACHED] {stage}: {status}")
+        outputs.append(f"{stage}_result={status}")
+    if entry.get("plan_blob"):
+        outputs.append(f"plan_blob={entry['plan_blob']}")
+    _append("GITHUB_OUTPUT", outputs)
+    # create_report.py reads the verdicts from these variables
+    _append("GITHUB_ENV", [f"{stage.upper()}_RESULT={entry['results'].get(stage, 'skipped')}" for stage in CACHED_STAGES])
+
+    if entry.get("quiz_summary"):
+        with open("quiz_summary.md", "w", encoding="utf-8") as f:
+            f.write(entry["quiz_summary"])
+    return entry
+
+
+def store_result(task_dir, student_id, store, results, key=None, sha=None, plan_blob=None):
+    """
+    Stores the verdicts of a run. Only runs without failures are cached: manual checks depend
+    on the student's Azure resources, so a failure must be re-validated on the next push.
+    The manual verdict itself is not stored (see CACHED_STAGES).
+    """
+    if any(status == "failure" for status in results.values()):
+        print("[INFO] Run had failures; result not cached.")
+        return False
+
+    key = key or cache_key(task_dir, student_id)
+    entry = {
+        "key": key,
+        "student_id": student_id,
+        "task": os.path.basename(os.path.normpath(task_dir)),
+        "rules_hash": rules_bundle.content_hash(),
+        "sha": sha,
+        "created_at": int(time.time()),
+        "results": {stage: status for stage, status in results.items() if stage in CACHED_STAGES},
+        "plan_blob": plan_blob,
+    }
+    if os.path.exists("quiz_summary.md"):
+        with open("quiz_summary.md", "r", encoding="utf-8") as f:
+            entry["quiz_summary"] = f.read()
+
+    store.put(key, entry)
+    print(f"[INFO] Result cached under {key[:12]}.")
+    return True
+
+
+@tracing.traced("result_cache", "stage")
+def main():
+    parser = argparse.ArgumentParser(description="Content-hash cache of validation results.")
+    parser.add_argument("command", choices=("key", "lookup", "store"))
+    parser.add_argument("task_dir")
+    parser.add_argument("student_id")
+    parser.add_argument("--cache", help="Store location (default: RESULT_CACHE or a local directory)")
+    parser.add_argument("--key", help="Key computed by 'lookup' (store only)")
+    parser.add_argument("--sha", help="Commit the results belong to (store only)")
+    parser.add_argument("--plan-blob", help="Blob name of the uploaded plan (store only)")
+    for stage in STAGES:
+        parser.add_argument(f"--{stage}", default="skipped", help=f"Outcome of the {stage} step (store only)")
+    args = parser.parse_args()
+
+    if args.command == "key":
+        print(cache_key(args.task_dir, args.student_id))
+        return 0
+
+    store = open_store(args.cache)
+    if args.command == "lookup":
+        lookup(args.task_dir, args.student_id, store)
+        return 0
+
+    results = {stage: getattr(args, stage) for stage in STAGES}
+    store_result(args.task_dir, args.student_id, store, results, args.key, args.sha, args.plan_blob)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
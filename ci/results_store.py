@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import tracing
+
+# Append-only store of grading results. Every stage adds one record (who, what, verdict,
+# duration) plus one row per graded item (quiz question, plan attribute, manual check),
+# and the CLI computes cohort aggregates inside SQLite, streaming the rows out.
+
+CACHE_DIR = os.environ.get("CI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "course-ci"))
+DB_PATH = os.environ.get("RESULTS_DB", os.path.join(CACHE_DIR, "results.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    student TEXT NOT NULL,
+    task TEXT NOT NULL,
+    sha TEXT,
+    stage TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    record_id INTEGER NOT NULL REFERENCES records(id),
+    item TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS records_task ON records(task, stage);
+CREATE INDEX IF NOT EXISTS records_student ON records(student, task, stage);
+CREATE INDEX IF NOT EXISTS items_record ON items(record_id);
+CREATE INDEX IF NOT EXISTS items_failed ON items(passed, item);
+"""
+
+_conn = None
+_conn_pid = None
+
+
+def connect(path=None):
+    """Returns this process's connection to the store, creating the schema on first use."""
+    global _conn, _conn_pid
+    if path is None and _conn is not None and _conn_pid == os.getpid():
+        return _conn
+
+    db_path = path or DB_PATH
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Graders run in several processes; WAL lets them append while others read
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    if path is None:
+        _conn, _conn_pid = conn, os.getpid()
+    return conn
+
+
+def current_student():
+    # Not GITHUB_ACTOR: that is whoever triggered the run (often a bot or the course staff)
+    return os.environ.get("STUDENT_ID") or os.environ.get("TF_VAR_student_id") or "unknown"
+
+
+@tracing.traced("results_store.record", "io")
+def record(stage, task, passed, items=(), duration=None, student=None, sha=None):
+    """
+    Appends one stage result. `items` are dicts with 'item', 'passed' and optional 'detail'.
+    Recording never fails the grading: problems with the store are only reported.
+    """
+    try:
+        conn = connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO records (recorded_at, student, task, sha, stage, passed, duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), student or current_student(), task, sha or os.environ.get("GITHUB_SHA"),
+                 stage, int(bool(passed)), duration),
+            )
+            conn.executemany(
+                "INSERT INTO items (record_id, item, passed, detail) VALUES (?, ?, ?, ?)",
+                [(cursor.lastrowid, i["item"], int(bool(i["passed"])), i.get("detail")) for i in items],
+            )
+    except sqlite3.Error as e:
+        print(f"[WARN] Could not record {stage} result: {e}", file=sys.stderr)
+
+
+def merge(conn, paths):
+    """
+    Appends the records and items of other stores, e.g. the per-run stores uploaded by the
+    workflows. Records already present (same time, student, task and stage) are skipped.
+    Returns the number of records added.
+    """
+    added = 0
+    for path in paths:
+        offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM records").fetchone()[0]
+        conn.execute("ATTACH DATABASE ? AS source", (path,))
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO records SELECT s.id + ?, s.recorded_at, s.student, s.task, s.sha, s.stage, s.passed, "
+                    "s.duration FROM source.records s WHERE NOT EXISTS (SELECT 1 FROM records r WHERE "
+                    "r.recorded_at = s.recorded_at AND r.student = s.student AND r.task = s.task AND r.stage = s.stage)",
+                    (offset,),
+                )
+                added += cursor.rowcount
+                conn.execute(
+                    "INSERT INTO items SELECT i.record_id + ?, i.item, i.passed, i.detail FROM source.items i "
+                    "WHERE i.record_id + ? IN (SELECT id FROM records WHERE id > ?)",
+                    (offset, offset, offset),
+                )
+        finally:
+            conn.execute("DETACH DATABASE source")
+    return added
+
+
+# --- Aggregates ---
+
+def _records_view(latest):
+    """Source of records for the aggregates: all attempts, or only each student's latest one."""
+    if not latest:
+        return "records"
+    return ("(SELECT * FROM records WHERE id IN "
+            "(SELECT MAX(id) FROM records GROUP BY student, task, stage))")
+
+
+def pass_rates(conn, latest=False, task=None):
+    """Yields (task, stage, attempts, passed, pass rate) rows."""
+    query = (f"SELECT task, stage, COUNT(*), SUM(passed) FROM {_records_view(latest)} "
+             f"{'WHERE task = ?' if task else ''} GROUP BY task, stage ORDER BY task, stage")
+    for task_name, stage, attempts, passed in conn.execute(query, (task,) if task else ()):
+        yield task_name, stage, attempts, passed, passed / attempts
+
+
+def most_failed_items(conn, stage, latest=False, task=None, limit=10):
+    """Yields (task, item, failures, detail example) for the most often failed items of a stage."""
+    query = (f"SELECT r.task, i.item, COUNT(*) AS failures, MAX(i.detail) FROM items i "
+             f"JOIN {_records_view(latest)} r ON r.id = i.record_id "
+             f"WHERE i.passed = 0 AND r.stage = ? {'AND r.task = ?' if task else ''} "
+             f"GROUP BY r.task, i.item ORDER BY failures DESC, r.task, i.item LIMIT ?")
+    params = (stage, task, limit) if task else (stage, limit)
+    yield from conn.execute(query, params)
+
+
+def _print_table(header, rows):
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    count = 0
+    for row in rows:
+        print("| " + " | ".join(str(v) for v in row) + " |")
+        count += 1
+    if not count:
+        print("_No records._")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort analytics over the grading results store.")
+    parser.add_argument("report", choices=("pass-rates", "missed-questions", "mismatches", "failed-checks", "merge"))
+    parser.add_argument("sources", nargs="*", metavar="STORE", help="Stores to append to --db (merge only)")
+    parser.add_argument("--db", default=DB_PATH, help=f"Store path (default: {DB_PATH})")
+    parser.add_argument("--task", help="Only this task")
+    parser.add_argument("--latest", action="store_true", help="Only count each student's latest attempt")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print JSON lines instead of a table")
+    args = parser.parse_args()
+
+    if args.report == "merge":
+        missing = [path for path in args.sources if not os.path.exists(path)]
+        if missing or not args.sources:
+            print(f"[ERROR] No stores to merge: {', '.join(missing) or 'none given'}")
+            return 1
+        added = merge(connect(args.db), args.sources)
+        print(f"[INFO] Merged {added} record(s) from {len(args.sources)} store(s) into {args.db}.")
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"[ERROR] No results store at {args.db}")
+        return 1
+    conn = connect(args.db)
+
+    if args.report == "pass-rates":
+        header = ("Task", "Stage", "Attempts", "Passed", "Pass rate")
+        rows = ((t, s, n, p, f"{rate:.1%}") for t, s, n, p, rate in pass_rates(conn, args.latest, args.task))
+    else:
+        stage = {"missed-questions": "quiz", "mismatches": "plan", "failed-checks": "manual"}[args.report]
+        header = ("Task", "Item", "Failures", "Example")
+        rows = most_failed_items(conn, stage, args.latest, args.task, args.limit)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(dict(zip(header, row))))
+    else:
+        _print_table(header, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import tracing
+import validate_plan
+import which_checks
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_PATH = os.environ.get("RULES_BUNDLE", os.path.join(SCRIPT_DIR, "rules_bundle.json"))
+BUNDLE_VERSION = 1
+
+# Rule name -> source file in ci/
+SOURCES = {
+    "answers": "answers.json",
+    "quiz_answers": "quiz_answers.json",
+    "manual_checks": "manual_checks.json",
+    "variables": "variables.json",
+    "messages": "messages.json",
+    "tasks_config": "tasks_config.yml",
+}
+
+CHECK_TYPES = ("container_exists", "resource_exists")
+ROUTER_KEYS = ("plan", "quiz", "manual")
+_LETTER = re.compile(r"^[A-Za-z]$")
+
+_loaded = None
+
+
+def _source_path(name):
+    return os.path.join(SCRIPT_DIR, SOURCES[name])
+
+
+@tracing.traced("read_source", "io")
+def read_source(name):
+    """Parses one raw rule file. Returns None if it does not exist."""
+    path = _source_path(name)
+    if not os.path.exists(path):
+        return None
+    if path.endswith(".yml"):
+        return which_checks.load_config(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+@tracing.traced("load_bundle", "io")
+def load_bundle():
+    """Returns the bundle if it exists and was built from the current rule files, else None."""
+    global _loaded
+    if _loaded is not None:
+        return _loaded or None
+
+    _loaded = {}
+    try:
+        with open(BUNDLE_PATH, "r", encoding="utf-8") as f:
+            bundle = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if bundle.get("bundle_version") != BUNDLE_VERSION:
+        # stderr: which_checks.py stdout goes straight into GITHUB_OUTPUT
+        print(f"[WARN] Ignoring {BUNDLE_PATH}: unsupported bundle version.", file=sys.stderr)
+        return None
+    sources = bundle.get("sources", {})
+    for name in SOURCES:
+        path = _source_path(name)
+        current = _signature(path) if os.path.exists(path) else None
+        if current != sources.get(name, {}).get("signature"):
+            print(f"[WARN] Ignoring {BUNDLE_PATH}: {SOURCES[name]} changed since it was built.", file=sys.stderr)
+            return None
+
+    _loaded = bundle
+    return bundle
+
+
+def load_rules(name):
+    """Returns the parsed rules of one file, from the bundle when it is fresh, else from the raw file."""
+    bundle = load_bundle()
+    if bundle is not None:
+        return bundle["rules"].get(name)
+    return read_source(name)
+
+
+def content_hash():
+    """Hash identifying the current rule set (the bundle's, or one computed from the raw files)."""
+    bundle = load_bundle()
+    if bundle is not None:
+        return bundle["content_hash"]
+    return _hash_sources(_read_raw_sources())
+
+
+def _read_raw_sources():
+    raw = {}
+    for name in SOURCES:
+        path = _source_path(name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                raw[name] = f.read()
+    return raw
+
+
+def _hash_sources(raw):
+    digest = hashlib.sha256()
+    for name in sorted(raw):
+        digest.update(name.encode("utf-8") + b"\0" + raw[name] + b"\0")
+    return digest.hexdigest()
+
+
+# --- Validation ---
+
+def validate(rules):
+    """Checks the shape of every rule file and how they reference each other. Returns (errors, warnings)."""
+    errors, warnings = [], []
+
+    def expect(condition, message):
+        if not condition:
+            errors.append(message)
+        return condition
+
+    answers = rules.get("answers") or {}
+    for task, spec in answers.items():
+        if not expect(isinstance(spec, dict), f"answers.json: '{task}' must be an object"):
+            continue
+        for field in ("resources", "create"):
+            values = spec.get(field, [])
+            expect(isinstance(values, list) and all(isinstance(v, str) for v in values),
+                   f"answers.json: '{task}.{field}' must be a list of resource keys")
+        expect(isinstance(spec.get("allow_extra", False), bool), f"answers.json: '{task}.allow_extra' must be true or false")
+        actions = spec.get("actions", {})
+        if expect(isinstance(actions, dict), f"answers.json: '{task}.actions' must be an object"):
+            for res_key, allowed in actions.items():
+                allowed = [allowed] if isinstance(allowed, str) else allowed
+                expect(isinstance(allowed, list) and allowed and all(a in validate_plan.ACTIONS for a in allowed),
+                       f"answers.json: '{task}.actions.{res_key}' must be one of {', '.join(validate_plan.ACTIONS)} (or a list of them)")
+        attributes = spec.get("attributes", {})
+        if expect(isinstance(attributes, dict), f"answers.json: '{task}.attributes' must be an object"):
+            # Malformed resource lists were reported above
+            required = {key for field in ("resources", "create") if isinstance(spec.get(field), list)
+                        for key in spec[field]}
+            for res_key, params in attributes.items():
+                expect(isinstance(params, dict), f"answers.json: '{task}.attributes.{res_key}' must be an object")
+                if "*" not in res_key and res_key not in required:
+                    warnings.append(f"answers.json: '{task}' checks attributes of {res_key}, which is not a required resource")
+
+    quiz_answers = rules.get("quiz_answers") or {}
+    for task, letters in quiz_answers.items():
+        expect(isinstance(letters, list) and all(isinstance(l, str) and _LETTER.match(l) for l in letters),
+               f"quiz_answers.json: '{task}' must be a list of single answer letters")
+
+    manual_checks = rules.get("manual_checks") or {}
+    for task, task_config in manual_checks.items():
+        if not expect(isinstance(task_config, dict), f"manual_checks.json: '{task}' must be an object"):
+            continue
+        checks = task_config.get("checks", [])
+        if not expect(isinstance(checks, list), f"manual_checks.json: '{task}.checks' must be a list"):
+            continue
+        for i, check in enumerate(checks):
+            check_type = check.get("type") if isinstance(check, dict) else None
+            if not expect(check_type in CHECK_TYPES, f"manual_checks.json: '{task}.checks[{i}]' has unknown type '{check_type}'"):
+                continue
+            if check_type == "container_exists":
+                expect(check.get("container_name"), f"manual_checks.json: '{task}.checks[{i}]' needs 'container_name'")
+            else:
+                expect(check.get("resource_type"), f"manual_checks.json: '{task}.checks[{i}]' needs 'resource_type'")
+
+    variables = rules.get("variables") or {}
+    for task, task_vars in variables.items():
+        mappings = task_vars.get("mappings") if isinstance(task_vars, dict) else None
+        if not expect(isinstance(mappings, list), f"variables.json: '{task}.mappings' must be a list"):
+            continue
+        for i, mapping in enumerate(mappings):
+            for letter, exports in mapping.items():
+                if letter == "comment":
+                    continue
+                expect(_LETTER.match(letter) and isinstance(exports, dict),
+                       f"variables.json: '{task}.mappings[{i}]' must map answer letters to variables")
+        if task in quiz_answers and len(mappings) > len(quiz_answers[task]):
+            warnings.append(f"variables.json: '{task}' has more mappings than quiz questions")
+
+    messages = rules.get("messages")
+    if messages is not None:
+        expect(isinstance(messages, dict) and isinstance(messages.get("icons", {}), dict),
+               "messages.json: must be an object with an 'icons' object")
+
+    tasks_config = rules.get("tasks_config")
+    if tasks_config is not None:
+        for key in tasks_config:
+            if key not in ROUTER_KEYS:
+                warnings.append(f"tasks_config.yml: unknown key '{key}'")
+        for key, rule_file, defined in (("quiz", "quiz_answers.json", quiz_answers),
+                                        ("plan", "answers.json", answers),
+                                        ("manual", "manual_checks.json", manual_checks)):
+            for pattern in tasks_config.get(key, []):
+                for task in which_checks.expand_pattern(pattern):
+                    if which_checks.is_glob(task):
+                        if not fnmatch.filter(defined, task):
+                            warnings.append(f"tasks_config.yml: '{pattern}' under '{key}' matches no entry in {rule_file}")
+                    elif task not in defined:
+                        warnings.append(f"tasks_config.yml: '{task}' is listed under '{key}' but has no entry in {rule_file}")
+
+    return errors, warnings
+
+
+@tracing.traced("rules_bundle", "stage")
+def build(strict=False):
+    """Validates the raw rule files and writes the bundle. Returns the process exit code."""
+    raw = _read_raw_sources()
+    rules = {name: read_source(name) for name in raw}
+
+    errors, warnings = validate(rules)
+    for w in warnings:
+        print(f"[WARN] {w}")
+    for e in errors:
+        print(f"[ERROR] {e}")
+    if errors or (strict and warnings):
+        print(f"[RESULT] Rule validation FAILED ({len(errors)} error(s), {len(warnings)} warning(s)).")
+        return 1
+
+    bundle = {
+        "bundle_version": BUNDLE_VERSION,
+        "content_hash": _hash_sources(raw),
+        "built_at": int(time.time()),
+        "sources": {
+            name: {"sha256": hashlib.sha256(data).hexdigest(), "signature": _signature(_source_path(name))}
+            for name, data in raw.items()
+        },
+        "rules": rules,
+    }
+    tmp_path = BUNDLE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(bundle, f, separators=(",", ":"))
+    os.replace(tmp_path, BUNDLE_PATH)
+
+    print(f"[RESULT] Rules bundle written to {BUNDLE_PATH} (hash {bundle['content_hash'][:12]}).")
+    return 0
+
+
+def main():
+    args = sys.argv[1:]
+    if any(a not in ("--strict",) for a in args):
+        print("Usage: rules_bundle.py [--strict]")
+        return 2
+    return build(strict="--strict" in args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
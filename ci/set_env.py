@@ -1,76 +1,77 @@
 import os
-import json
-import re
 import sys
 
-def parse_markdown_answers(task_dir):
+import quiz_extract
+import rules_bundle
+import tracing
+
+def resolve_variables(student_answers, mappings):
     """
-    Scans for any .md file in the task directory and extracts 
-    all selected answers marked with [x] or [X].
+    Yields (step index, variables) for every mapping step the student answered.
+    Variables is None when the selected letter has no mapping in that step.
     """
-    answers = []
-    if not os.path.exists(task_dir):
-        return answers
-        
-    for file in os.listdir(task_dir):
-        if file.endswith(".md"):
-            file_path = os.path.join(task_dir, file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # Find all patterns like - [x] A or - [X] B
-                matches = re.findall(r'-\s*\[[xX]\]\s*([A-Za-z])', content)
-                answers.extend(matches)
-    return [a.upper() for a in answers]
-
-def main():
-    if len(sys.argv) < 2:
-        print("[ERROR] No task directory provided.")
-        sys.exit(1)
+    # We only process as many answers as we have mappings for (Task 1 and Task 2)
+    for idx, mapping in enumerate(mappings):
+        if idx < len(student_answers):
+            yield idx, mapping.get(student_answers[idx])
 
-    task_dir = sys.argv[1]
+@tracing.traced("set_env", "stage")
+def export(task_dir, out=None):
+    """
+    Exports the variables selected by the student's answers to GITHUB_ENV.
+    Returns (exit code, {variable: value} that were exported).
+    Output goes to `out` (default stdout).
+    """
+    out = out or sys.stdout
     task_key = os.path.basename(os.path.normpath(task_dir))
+    exported = {}
     
     # Path to the variable mapping configuration
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(script_dir, "variables.json")
+    config = rules_bundle.load_rules("variables")
     
-    if not os.path.exists(config_path):
-        print(f"[INFO] Configuration file {config_path} not found. Skipping environment setup.")
-        sys.exit(0)
-
-    with open(config_path, 'r') as f:
-        config = json.load(f)
+    if config is None:
+        print(f"[INFO] Configuration file {config_path} not found. Skipping environment setup.", file=out)
+        return 0, exported
 
     if task_key not in config:
-        print(f"[INFO] No variable mapping defined for '{task_key}' in variables.json. Skipping.")
-        sys.exit(0)
+        print(f"[INFO] No variable mapping defined for '{task_key}' in variables.json. Skipping.", file=out)
+        return 0, exported
 
     # Extract answers from MD and mappings from JSON
-    student_answers = parse_markdown_answers(task_dir)
+    student_answers = quiz_extract.selected_letters(task_dir)
     mappings = config[task_key].get("mappings", [])
 
     # GITHUB_ENV is a special file used by GitHub Actions to export environment variables
     env_file = os.environ.get('GITHUB_ENV')
     
-    print(f"[INFO] Processing variables for: {task_key}")
-    print(f"[INFO] Detected answers: {student_answers}")
+    print(f"[INFO] Processing variables for: {task_key}", file=out)
+    print(f"[INFO] Detected answers: {student_answers}", file=out)
 
-    # We only process as many answers as we have mappings for (Task 1 and Task 2)
-    for idx, mapping in enumerate(mappings):
-        if idx < len(student_answers):
-            selected_letter = student_answers[idx]
+    for step, variables_to_set in resolve_variables(student_answers, mappings):
+        if variables_to_set is None:
+            print(f"   [WARN] Answer '{student_answers[step]}' has no variable mapping in Step {step+1}.", file=out)
+            continue
+
+        for var_name, var_value in variables_to_set.items():
+            output_line = f"{var_name}={var_value}"
+            print(f"   [EXPORT] {output_line}", file=out)
+            exported[var_name] = var_value
             
-            if selected_letter in mapping:
-                variables_to_set = mapping[selected_letter]
-                for var_name, var_value in variables_to_set.items():
-                    output_line = f"{var_name}={var_value}"
-                    print(f"   [EXPORT] {output_line}")
-                    
-                    if env_file:
-                        with open(env_file, 'a') as f:
-                            f.write(output_line + "\n")
-            else:
-                print(f"   [WARN] Answer '{selected_letter}' has no variable mapping in Step {idx+1}.")
+            if env_file:
+                with open(env_file, 'a') as f:
+                    f.write(output_line + "\n")
+
+    return 0, exported
+
+def main():
+    if len(sys.argv) < 2:
+        print("[ERROR] No task directory provided.")
+        sys.exit(1)
+
+    code, _ = export(sys.argv[1])
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
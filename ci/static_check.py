@@ -0,0 +1,536 @@
+import glob
+import os
+import re
+import sys
+import time
+
+import tracing
+import validate_plan
+
+# Pre-plan check of a task's .tf files, without the terraform binary. A minimal HCL reader
+# collects the declared resources and their literal attribute values, resolving simple
+# var./local. references from variables.tf defaults, locals, *.tfvars and the TF_VAR_* values
+# set_env.py would export. A rule is only failed when the outcome is certain; anything that
+# depends on functions, other resources, modules or provider defaults is left to the plan.
+
+# Never decided statically: the provider normalizes these before they reach the plan
+NORMALIZED_ATTRIBUTES = {"location"}
+_SIMPLE_KEY = re.compile(r"^(data\.)?[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+$")
+
+
+class _Unknown:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "UNKNOWN"
+
+
+UNKNOWN = _Unknown()
+
+
+# --- Tokenizer ---
+
+_TOKEN = re.compile(r"""
+    (?P<newline>\n)
+  | (?P<space>[ \t\r]+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<heredoc><<-?([A-Za-z_][A-Za-z0-9_]*)[ \t]*\n)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<op>==|!=|<=|>=|&&|\|\||=>|\.\.\.|[{}\[\]()=,.:?!<>+\-*/%])
+""", re.VERBOSE | re.DOTALL)
+
+
+class Token:
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"{self.kind}:{self.value!r}"
+
+
+def _scan_string(text, pos):
+    """Returns (raw string body, position after the closing quote); `pos` is after the opening quote."""
+    start = pos
+    depth = 0
+    while pos < len(text):
+        ch = text[pos]
+        if ch == "\\" and depth == 0:
+            pos += 2
+            continue
+        if depth == 0:
+            if ch == '"':
+                return text[start:pos], pos + 1
+            if ch in "$%" and text.startswith("{", pos + 1) and not text.startswith(ch + ch, pos - 1):
+                depth = 1
+                pos += 2
+                continue
+        else:
+            if ch == '"':
+                # A string inside an interpolation
+                _, pos = _scan_string(text, pos + 1)
+                continue
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+        pos += 1
+    raise ValueError("Unterminated string")
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        if text[pos] == '"':
+            body, pos = _scan_string(text, pos + 1)
+            tokens.append(Token("string", body))
+            continue
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise ValueError(f"Unexpected character {text[pos]!r}")
+        kind = m.lastgroup
+        if kind == "heredoc":
+            marker = m.group(m.lastindex + 1)
+            end = re.compile(r"^[ \t]*" + re.escape(marker) + r"[ \t]*$", re.MULTILINE).search(text, m.end())
+            if not end:
+                raise ValueError(f"Unterminated heredoc {marker}")
+            tokens.append(Token("heredoc", text[m.end():end.start()]))
+            pos = end.end()
+            continue
+        if kind == "newline" or (kind == "comment" and "\n" in m.group()):
+            tokens.append(Token("newline", "\n"))
+        elif kind not in ("space", "comment"):
+            tokens.append(Token(kind, m.group()))
+        pos = m.end()
+    return tokens
+
+
+# --- Parser ---
+
+class Block:
+    """One HCL block: `resource "type" "name" { ... }`, or a nested block such as `identity { ... }`."""
+    __slots__ = ("type", "labels", "attributes", "blocks")
+
+    def __init__(self, type_name, labels):
+        self.type = type_name
+        self.labels = labels
+        # attribute name -> list of expression tokens
+        self.attributes = {}
+        self.blocks = []
+
+    def nested(self, type_name):
+        return [b for b in self.blocks if b.type == type_name]
+
+
+_CLOSE = {"(": ")", "[": "]", "{": "}"}
+
+
+def _expression(tokens, i, terminators):
+    """Collects the tokens of one expression starting at `i`; returns (tokens, next index)."""
+    depth = []
+    start = i
+    while i < len(tokens):
+        tok = tokens[i]
+        if not depth and (tok.kind == "newline" or (tok.kind == "op" and tok.value in terminators)):
+            break
+        if tok.kind == "op" and tok.value in _CLOSE:
+            depth.append(_CLOSE[tok.value])
+        elif tok.kind == "op" and depth and tok.value == depth[-1]:
+            depth.pop()
+        i += 1
+    return tokens[start:i], i
+
+
+def parse_body(tokens, i=0, block=None):
+    """Parses attributes and blocks until the closing brace (or the end); returns (block, next index)."""
+    block = block or Block("", [])
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok.kind == "newline" or (tok.kind == "op" and tok.value == ","):
+            i += 1
+            continue
+        if tok.kind == "op" and tok.value == "}":
+            return block, i + 1
+        if tok.kind not in ("ident", "string"):
+            raise ValueError(f"Unexpected {tok.value!r}")
+        name = tok.value
+        i += 1
+        if i < len(tokens) and tokens[i].kind == "op" and tokens[i].value in ("=", ":"):
+            expr, i = _expression(tokens, i + 1, {"}", ","})
+            block.attributes[name] = expr
+            continue
+        labels = []
+        while i < len(tokens) and tokens[i].kind in ("ident", "string"):
+            labels.append(tokens[i].value)
+            i += 1
+        if i >= len(tokens) or tokens[i].value != "{":
+            raise ValueError(f"Expected '{{' after block '{name}'")
+        child, i = parse_body(tokens, i + 1, Block(name, labels))
+        block.blocks.append(child)
+    return block, i
+
+
+def parse_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_body(tokenize(f.read()))[0]
+
+
+# --- Evaluation ---
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+
+
+def _as_string(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return UNKNOWN
+
+
+class Scope:
+    """Resolves var.* and local.* of one module directory."""
+
+    def __init__(self, variables=None, values=None, locals_=None):
+        self.variables = variables or {}
+        self.values = values or {}
+        self.locals = locals_ or {}
+        self._resolving = set()
+
+    def var(self, name):
+        if name in self.values:
+            return _convert(self.values[name], self.variables.get(name))
+        variable = self.variables.get(name)
+        if variable is not None and "default" in variable.attributes:
+            return evaluate(variable.attributes["default"], Scope())
+        return UNKNOWN
+
+    def local(self, name):
+        if name not in self.locals or name in self._resolving:
+            return UNKNOWN
+        self._resolving.add(name)
+        try:
+            return evaluate(self.locals[name], self)
+        finally:
+            self._resolving.discard(name)
+
+
+def _convert(value, variable):
+    """TF_VAR_* values arrive as strings; convert them like terraform does for the declared type."""
+    if not isinstance(value, str) or variable is None:
+        return value
+    type_tokens = variable.attributes.get("type", [])
+    type_name = type_tokens[0].value if len(type_tokens) == 1 else None
+    if type_name == "bool" and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    if type_name == "number":
+        try:
+            number = float(value)
+        except ValueError:
+            return UNKNOWN
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def _template(body, scope):
+    parts = []
+    pos = 0
+    while pos < len(body):
+        ch = body[pos]
+        if ch == "\\" and pos + 1 < len(body):
+            parts.append(_ESCAPES.get(body[pos + 1], body[pos:pos + 2]))
+            pos += 2
+        elif body.startswith("$${", pos) or body.startswith("%%{", pos):
+            parts.append(body[pos + 1:pos + 3])
+            pos += 3
+        elif body.startswith("%{", pos):
+            # Template directives (if/for) are not evaluated
+            return UNKNOWN
+        elif body.startswith("${", pos):
+            inner_tokens = tokenize(body[pos + 2:])
+            expr, end = _expression(inner_tokens, 0, {"}"})
+            if end >= len(inner_tokens):
+                return UNKNOWN
+            value = _as_string(evaluate([t for t in expr if t.kind != "newline"], scope))
+            if value is UNKNOWN:
+                return UNKNOWN
+            parts.append(value)
+            # Skip past the closing brace in the raw text
+            depth, pos = 1, pos + 2
+            while depth:
+                if body[pos] == '"':
+                    _, pos = _scan_string(body, pos + 1)
+                    continue
+                depth += {"{": 1, "}": -1}.get(body[pos], 0)
+                pos += 1
+        else:
+            parts.append(ch)
+            pos += 1
+    return "".join(parts)
+
+
+def _split(tokens, separators):
+    """Splits a collection body at top-level separators."""
+    items, current, depth = [], [], 0
+    for tok in tokens:
+        if tok.kind == "op" and tok.value in _CLOSE:
+            depth += 1
+        elif tok.kind == "op" and tok.value in _CLOSE.values():
+            depth -= 1
+        if depth == 0 and ((tok.kind == "op" and tok.value in separators) or tok.kind == "newline"):
+            if current:
+                items.append(current)
+            current = []
+        else:
+            current.append(tok)
+    if current:
+        items.append(current)
+    return items
+
+
+def evaluate(tokens, scope):
+    """Value of an expression if it is statically known, else UNKNOWN."""
+    # Newlines separate the items of multi-line collections; elsewhere they do not matter
+    start, end = 0, len(tokens)
+    while start < end and tokens[start].kind == "newline":
+        start += 1
+    while end > start and tokens[end - 1].kind == "newline":
+        end -= 1
+    tokens = tokens[start:end]
+    if not tokens:
+        return UNKNOWN
+    first = tokens[0]
+    if len(tokens) == 1:
+        if first.kind in ("string", "heredoc"):
+            body = first.value
+            if first.kind == "heredoc":
+                body = body.replace("\\", "\\\\")
+            return _template(body, scope)
+        if first.kind == "number":
+            number = float(first.value)
+            return int(number) if number.is_integer() and "." not in first.value else number
+        if first.kind == "ident" and first.value in ("true", "false"):
+            return first.value == "true"
+        return UNKNOWN
+    if len(tokens) == 3 and first.kind == "ident" and tokens[1].value == "." and tokens[2].kind == "ident":
+        if first.value == "var":
+            return scope.var(tokens[2].value)
+        if first.value == "local":
+            return scope.local(tokens[2].value)
+        return UNKNOWN
+    if len(tokens) == 2 and first.value == "-" and tokens[1].kind == "number":
+        value = evaluate(tokens[1:], scope)
+        return -value
+    if first.value == "(" and tokens[-1].value == ")":
+        return evaluate(tokens[1:-1], scope)
+    if first.value == "[" and tokens[-1].value == "]":
+        values = [evaluate(item, scope) for item in _split(tokens[1:-1], {","})]
+        return UNKNOWN if any(v is UNKNOWN for v in values) else values
+    if first.value == "{" and tokens[-1].value == "}":
+        result = {}
+        for item in _split(tokens[1:-1], {","}):
+            if len(item) < 3 or item[1].value not in ("=", ":") or item[0].kind not in ("ident", "string"):
+                return UNKNOWN
+            value = evaluate(item[2:], scope)
+            if value is UNKNOWN:
+                return UNKNOWN
+            result[item[0].value] = value
+        return result
+    return UNKNOWN
+
+
+# --- Module ---
+
+class Module:
+    """The root module of one task directory, as far as it can be read statically."""
+
+    def __init__(self, task_dir, env_values=None):
+        body = Block("", [])
+        for path in sorted(glob.glob(os.path.join(task_dir, "*.tf"))):
+            parsed = parse_file(path)
+            body.blocks.extend(parsed.blocks)
+
+        self.resources = {}
+        self.has_modules = False
+        variables, locals_ = {}, {}
+        for block in body.blocks:
+            if block.type == "resource" and len(block.labels) == 2:
+                self.resources[f"{block.labels[0]}.{block.labels[1]}"] = block
+            elif block.type == "data" and len(block.labels) == 2:
+                self.resources[f"data.{block.labels[0]}.{block.labels[1]}"] = block
+            elif block.type == "module":
+                self.has_modules = True
+            elif block.type == "variable" and block.labels:
+                variables[block.labels[0]] = block
+            elif block.type == "locals":
+                locals_.update(block.attributes)
+
+        # Terraform's precedence: environment, then terraform.tfvars, then *.auto.tfvars
+        values = dict(env_values or {})
+        tfvars = [os.path.join(task_dir, "terraform.tfvars")] + sorted(glob.glob(os.path.join(task_dir, "*.auto.tfvars")))
+        for path in tfvars:
+            if os.path.exists(path):
+                for name, expr in parse_file(path).attributes.items():
+                    value = evaluate(expr, Scope())
+                    if value is not UNKNOWN:
+                        values[name] = value
+        self.scope = Scope(variables, values, locals_)
+
+    def attribute(self, key, path):
+        """Statically known value at `path` of resource `key`, or UNKNOWN."""
+        node = self.resources.get(key)
+        i = 0
+        while i < len(path):
+            step = path[i]
+            if isinstance(node, Block):
+                if not isinstance(step, str):
+                    return UNKNOWN
+                if step in node.attributes:
+                    node = evaluate(node.attributes[step], self.scope)
+                    i += 1
+                    continue
+                # Nested blocks appear in the plan as a list: 'identity[0]' is the first identity block
+                blocks = node.nested(step)
+                dynamic = any(b.labels == [step] for b in node.nested("dynamic"))
+                following = path[i + 1] if i + 1 < len(path) else None
+                if dynamic or not isinstance(following, int) or following >= len(blocks):
+                    return UNKNOWN
+                node = blocks[following]
+                i += 2
+                continue
+            if node is UNKNOWN or step == validate_plan.WILDCARD:
+                return UNKNOWN
+            node = validate_plan.resolve_path(node, (step,))[0]
+            if node is validate_plan.MISSING:
+                return UNKNOWN
+            i += 1
+        return UNKNOWN if node is None or isinstance(node, Block) else node
+
+
+def _normalized(value):
+    # Terraform converts between string, number and bool to match the provider schema
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "false"):
+            return lowered
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+# --- Checks ---
+
+def env_values(task_dir):
+    """TF_VAR_* values from the environment plus those set_env.py would export for the quiz answers."""
+    import quiz_extract
+    import rules_bundle
+    import set_env
+
+    values = {k[len("TF_VAR_"):]: v for k, v in os.environ.items() if k.startswith("TF_VAR_")}
+    task_name = os.path.basename(os.path.normpath(task_dir))
+    mappings = (rules_bundle.load_rules("variables") or {}).get(task_name, {}).get("mappings", [])
+    if mappings:
+        letters = quiz_extract.selected_letters(task_dir)
+        for _, variables in set_env.resolve_variables(letters, mappings):
+            for name, value in (variables or {}).items():
+                if name.startswith("TF_VAR_"):
+                    values[name[len("TF_VAR_"):]] = value
+    return values
+
+
+@tracing.traced("static_check.check", "ci")
+def check(module, spec):
+    """Returns (item, verdict, detail) per rule; verdict is 'pass', 'fail' or 'unknown'."""
+    results = []
+    for key in sorted(validate_plan.required_resource_keys(spec)):
+        if not _SIMPLE_KEY.match(key):
+            results.append((key, "unknown", "address pattern"))
+        elif key in module.resources:
+            results.append((key, "pass", None))
+        elif module.has_modules:
+            results.append((key, "unknown", "may come from a module"))
+        else:
+            results.append((key, "fail", f"Missing resources in plan: ['{key}'] (not declared in any .tf file)"))
+
+    for rule in validate_plan.compile_rules(spec):
+        item = f"{rule.selector.key}.{rule.attribute}"
+        if rule.selector.pattern is not None or not rule.path or rule.path[0] in NORMALIZED_ATTRIBUTES:
+            results.append((item, "unknown", None))
+            continue
+        actual = module.attribute(rule.selector.key, rule.path)
+        if actual is UNKNOWN:
+            results.append((item, "unknown", None))
+        elif validate_plan.values_equal(actual, rule.expected):
+            results.append((item, "pass", None))
+        elif isinstance(actual, (dict, list)) or _normalized(actual) == _normalized(rule.expected):
+            results.append((item, "unknown", None))
+        else:
+            results.append((item, "fail", f"Attribute mismatch in {rule.selector.key}: {rule.attribute} "
+                                          f"expected '{rule.expected}', got '{actual}'"))
+    return results
+
+
+@tracing.traced("static_check", "stage")
+def run(task_dir, answers_path, out=None):
+    """Runs the pre-check for one task directory, printing to `out` (default stdout). Returns (exit code, results)."""
+    from pathlib import Path
+
+    out = out or sys.stdout
+
+    started = time.perf_counter()
+    task_name = os.path.basename(os.path.normpath(task_dir))
+    spec = validate_plan.load_answers(Path(answers_path)).get(task_name)
+    if spec is None:
+        print(f"[INFO] No validation rules for '{task_name}'. Skipping.", file=out)
+        return 0, []
+
+    try:
+        module = Module(task_dir, env_values(task_dir))
+    except (OSError, ValueError) as e:
+        # Syntax the reader does not understand is for terraform to judge
+        print(f"[INFO] Static check skipped, could not read the .tf files: {e}", file=out)
+        return 0, []
+
+    results = check(module, spec)
+    failures = [detail for _, verdict, detail in results if verdict == "fail"]
+    deferred = sum(1 for _, verdict, _ in results if verdict == "unknown")
+    elapsed = time.perf_counter() - started
+
+    if failures:
+        print("❌ Static pre-check failed", file=out)
+        lines = [f"## ⚡ Static Pre-check: {task_name}", "### Status: **FAILED** ❌"]
+        for failure in failures:
+            print(f"- {failure}", file=out)
+            lines.append(f"- 🔴 {failure}")
+        lines.append("\nFix these before the Terraform plan runs.")
+        validate_plan.write_summary("\n".join(lines))
+        return 1, results
+
+    print(f"✅ Static pre-check passed ({len(results) - deferred} decided, {deferred} left to the plan, {elapsed:.2f}s)", file=out)
+    return 0, results
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: static_check.py <tf_dir> [answers_json_path]")
+        return 2
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    answers_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(script_dir, "answers.json")
+    code, _ = run(sys.argv[1], answers_path)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import tracing
+
+# Record/replay of the az and terraform calls the ci scripts make through tracing.run and
+# tracing.popen. With CI_SUBPROCESS_MODE=record every call runs for real and is appended to
+# CI_SUBPROCESS_FIXTURES (JSON lines: argv, cwd, exit code, stdout, stderr, latency). With
+# CI_SUBPROCESS_MODE=replay the calls are answered from that file instead: repeated calls of
+# the same command get the recorded results in order (the last one repeats), and
+# CI_SUBPROCESS_LATENCY scales how much of the recorded latency is slept (0 = none, 1 = real).
+
+MODE = os.environ.get("CI_SUBPROCESS_MODE", "")
+FIXTURES = os.environ.get("CI_SUBPROCESS_FIXTURES", "subprocess_fixtures.jsonl")
+LATENCY = float(os.environ.get("CI_SUBPROCESS_LATENCY", "0") or 0)
+
+# Values following these flags (or joined to them, --flag=value) are not written to fixtures and not used for matching
+SECRET_FLAGS = ("--account-key", "--password", "-p", "--client-secret", "--sas-token", "--connection-string")
+# az commands whose output is itself a secret; the secret fields (or the whole output) are masked
+SECRET_OUTPUT_COMMANDS = (
+    ("storage", "account", "keys", "list"),
+    ("account", "get-access-token"),
+)
+SECRET_OUTPUT_FIELDS = ("value", "accessToken")
+# Environment variables whose values are masked wherever they appear in recorded output
+SECRET_ENV = ("ARM_CLIENT_SECRET", "ARM_ACCESS_KEY", "STORAGE_KEY", "AZURE_ACCESS_TOKEN")
+REDACTED = "***"
+PWD_MARKER = "$PWD"
+
+
+class ReplayMissError(RuntimeError):
+    """Raised in replay mode for a command the fixtures hold no recording of."""
+
+
+def normalize(cmd, cwd=None):
+    """Matching key of a call: the argv with secrets masked and the working directory made relative."""
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    here = os.getcwd()
+    argv, mask_next = [], False
+    for arg in map(str, cmd):
+        flag, joined, _ = arg.partition("=")
+        if mask_next:
+            argv.append(REDACTED)
+        elif joined and flag in SECRET_FLAGS:
+            argv.append(f"{flag}={REDACTED}")
+        else:
+            argv.append(arg.replace(here, PWD_MARKER))
+        mask_next = arg in SECRET_FLAGS
+    cwd = os.path.relpath(os.path.abspath(cwd), here) if cwd else "."
+    return argv, cwd
+
+
+def _key(argv, cwd):
+    return json.dumps([argv, cwd])
+
+
+def _scrub(text):
+    for name in SECRET_ENV:
+        value = os.environ.get(name)
+        if value and len(value) > 3:
+            text = text.replace(value, REDACTED)
+    return text
+
+
+def returns_secret(argv):
+    """Whether the call is an az command from SECRET_OUTPUT_COMMANDS."""
+    if not argv or os.path.basename(argv[0]) not in ("az", "az.cmd"):
+        return False
+    return any(tuple(argv[1:1 + len(command)]) == command for command in SECRET_OUTPUT_COMMANDS)
+
+
+def _mask_fields(value):
+    # Bare strings are what --query narrows the secret fields down to, e.g. [0].value or [].value
+    if isinstance(value, str):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: REDACTED if k in SECRET_OUTPUT_FIELDS and isinstance(v, str)
+                else v if isinstance(v, str) else _mask_fields(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_mask_fields(v) for v in value]
+    return value
+
+
+def redact_output(text):
+    """
+    Output of a secret-returning command with the secrets masked. JSON keeps its shape, so the
+    replayed callers still parse it, with the secret fields and bare strings replaced; any other
+    output is masked line by line.
+    """
+    if not text:
+        return text
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return "".join(REDACTED + line[len(line.rstrip("\r\n")):] if line.strip() else line
+                       for line in text.splitlines(True))
+    trailer = text[len(text.rstrip()):]
+    return json.dumps(_mask_fields(payload), indent=2) + trailer
+
+
+def _to_text(data):
+    if data is None:
+        return None
+    if isinstance(data, bytes):
+        # Undecodable bytes survive the JSON round trip as lone surrogates
+        data = data.decode("utf-8", "surrogateescape")
+    return _scrub(data)
+
+
+def _from_text(data, text_mode):
+    if data is None or text_mode:
+        return data
+    return data.encode("utf-8", "surrogateescape")
+
+
+def _text_mode(kwargs):
+    return bool(kwargs.get("text") or kwargs.get("universal_newlines") or kwargs.get("encoding") or kwargs.get("errors"))
+
+
+# --- Recording ---
+
+class Recorder:
+    """Runs every call for real and appends it to the fixture file."""
+
+    def __init__(self, path, run_impl, popen_impl):
+        self.path = path
+        self._run = run_impl
+        self._popen = popen_impl
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            try:
+                import fcntl
+                fcntl.flock(f, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+            f.write(line)
+
+    def entry(self, kind, cmd, cwd, started, returncode, stdout=None, stderr=None, **extra):
+        argv, cwd = normalize(cmd, cwd)
+        stdout = _to_text(stdout)
+        if returns_secret(argv):
+            stdout = redact_output(stdout)
+            if "lines" in extra:
+                extra["lines"] = [[offset, redact_output(line)] for offset, line in extra["lines"]]
+        return {"kind": kind, "argv": argv, "cwd": cwd, "returncode": returncode,
+                "stdout": stdout, "stderr": _to_text(stderr),
+                "latency": round(time.monotonic() - started, 4), **extra}
+
+    def run(self, cmd, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = self._run(cmd, *args, **kwargs)
+        except subprocess.TimeoutExpired as e:
+            self.append(self.entry("run", cmd, kwargs.get("cwd"), started, None, e.output, e.stderr, timed_out=True))
+            raise
+        except subprocess.CalledProcessError as e:
+            self.append(self.entry("run", cmd, kwargs.get("cwd"), started, e.returncode, e.output, e.stderr))
+            raise
+        self.append(self.entry("run", cmd, kwargs.get("cwd"), started, result.returncode, result.stdout, result.stderr))
+        return result
+
+    def popen(self, cmd, *args, **kwargs):
+        return _RecordingPopen(self, cmd, self._popen(cmd, *args, **kwargs), kwargs.get("cwd"))
+
+
+class _RecordingStream:
+    """Passes a pipe's lines through, noting when each one arrived."""
+
+    def __init__(self, stream, started):
+        self._stream = stream
+        self._started = started
+        self.lines = []
+
+    def _note(self, line):
+        if line:
+            self.lines.append([round(time.monotonic() - self._started, 4), _to_text(line)])
+        return line
+
+    def readline(self, *args):
+        return self._note(self._stream.readline(*args))
+
+    def read(self, *args):
+        return self._note(self._stream.read(*args))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._stream.readline()
+        if not line:
+            raise StopIteration
+        return self._note(line)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _RecordingPopen:
+    """Wraps a real Popen; the call is written once the process has been waited for."""
+
+    def __init__(self, recorder, cmd, proc, cwd):
+        self._recorder = recorder
+        self._cmd = cmd
+        self._cwd = cwd
+        self._proc = proc
+        self._started = time.monotonic()
+        self._saved = False
+        self.stdout = _RecordingStream(proc.stdout, self._started) if proc.stdout else None
+
+    def __getattr__(self, name):
+        return getattr(self._proc, name)
+
+    def _save(self, stdout=None, stderr=None):
+        if self._saved or self._proc.returncode is None:
+            return
+        self._saved = True
+        lines = self.stdout.lines if self.stdout else []
+        if stdout:
+            lines.append([round(time.monotonic() - self._started, 4), _to_text(stdout)])
+        self._recorder.append(self._recorder.entry("popen", self._cmd, self._cwd, self._started,
+                                                   self._proc.returncode, None, stderr, lines=lines))
+
+    def communicate(self, *args, **kwargs):
+        stdout, stderr = self._proc.communicate(*args, **kwargs)
+        self._save(stdout, stderr)
+        return stdout, stderr
+
+    def wait(self, *args, **kwargs):
+        code = self._proc.wait(*args, **kwargs)
+        self._save()
+        return code
+
+    def poll(self):
+        code = self._proc.poll()
+        self._save()
+        return code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._proc.__exit__(exc_type, exc, tb)
+        self._save()
+        return False
+
+
+# --- Replay ---
+
+class Player:
+    """Answers calls from the fixture file, in recorded order per command."""
+
+    def __init__(self, path, latency=LATENCY):
+        self.latency = latency
+        self._recordings = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings.setdefault(_key(entry["argv"], entry["cwd"]), []).append(entry)
+
+    def next_entry(self, kind, cmd, cwd):
+        argv, cwd = normalize(cmd, cwd)
+        key = _key(argv, cwd)
+        with self._lock:
+            recordings = [e for e in self._recordings.get(key, []) if e["kind"] == kind]
+            if not recordings:
+                raise ReplayMissError(f"No recording of {' '.join(argv)} (cwd {cwd}) in the fixtures")
+            position = self._cursors.get((kind, key), 0)
+            self._cursors[(kind, key)] = position + 1
+        return recordings[min(position, len(recordings) - 1)]
+
+    def sleep(self, seconds):
+        if self.latency > 0 and seconds > 0:
+            time.sleep(seconds * self.latency)
+
+    def run(self, cmd, *args, check=False, timeout=None, capture_output=False, **kwargs):
+        entry = self.next_entry("run", cmd, kwargs.get("cwd"))
+        text_mode = _text_mode(kwargs)
+        stdout, stderr = _from_text(entry["stdout"], text_mode), _from_text(entry["stderr"], text_mode)
+
+        if entry.get("timed_out") or (timeout is not None and entry["latency"] > timeout):
+            self.sleep(min(entry["latency"], timeout) if timeout is not None else entry["latency"])
+            raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+        self.sleep(entry["latency"])
+
+        captured = capture_output or kwargs.get("stdout") == subprocess.PIPE
+        if not captured:
+            # The real process would have written to the inherited descriptors
+            for stream, data in ((sys.stdout, entry["stdout"]), (sys.stderr, entry["stderr"])):
+                if data:
+                    stream.write(data)
+                    stream.flush()
+            stdout, stderr = None, None
+        if check and entry["returncode"]:
+            raise subprocess.CalledProcessError(entry["returncode"], cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, entry["returncode"], stdout, stderr)
+
+    def popen(self, cmd, *args, **kwargs):
+        return _ReplayedPopen(self, cmd, self.next_entry("popen", cmd, kwargs.get("cwd")), _text_mode(kwargs))
+
+
+class _ReplayedStream(io.TextIOBase):
+    """Yields the recorded lines, each no earlier than it arrived (scaled by the player's latency)."""
+
+    def __init__(self, player, lines, started, text_mode):
+        self._player = player
+        self._lines = list(lines)
+        self._started = started
+        self._text_mode = text_mode
+
+    def readline(self, *args):
+        if not self._lines:
+            return "" if self._text_mode else b""
+        offset, line = self._lines.pop(0)
+        if self._player.latency > 0:
+            delay = self._started + offset * self._player.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return _from_text(line, self._text_mode)
+
+    def read(self, *args):
+        empty = "" if self._text_mode else b""
+        return empty.join(iter(self.readline, empty))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+
+class _ReplayedPopen:
+    """Popen stand-in: the recorded output becomes stdout, the exit code appears after the recorded latency."""
+
+    def __init__(self, player, cmd, entry, text_mode):
+        self.args = cmd
+        self.pid = 0
+        self.returncode = None
+        self._player = player
+        self._entry = entry
+        self._started = time.monotonic()
+        self.stdout = _ReplayedStream(player, entry.get("lines", []), self._started, text_mode)
+        self.stderr = None
+        self._text_mode = text_mode
+
+    def poll(self):
+        if self.returncode is None and time.monotonic() - self._started >= self._entry["latency"] * self._player.latency:
+            self.returncode = self._entry["returncode"]
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            remaining = self._started + self._entry["latency"] * self._player.latency - time.monotonic()
+            if timeout is not None and remaining > timeout:
+                time.sleep(timeout)
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            if remaining > 0:
+                time.sleep(remaining)
+            self.returncode = self._entry["returncode"]
+        return self.returncode
+
+    def communicate(self, input=None, timeout=None):
+        stdout = self.stdout.read()
+        self.wait(timeout)
+        return stdout, _from_text(self._entry.get("stderr"), self._text_mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wait()
+        return False
+
+
+def install(mode=None, path=None):
+    """Routes tracing.run/popen through a Recorder or Player. Called by tracing when CI_SUBPROCESS_MODE is set."""
+    mode = mode or MODE
+    path = path or FIXTURES
+    if mode == "record":
+        backend = Recorder(path, tracing._run, tracing.popen)
+    elif mode == "replay":
+        backend = Player(path)
+    else:
+        raise ValueError(f"Unknown CI_SUBPROCESS_MODE '{mode}' (expected 'record' or 'replay')")
+    tracing.interpose(backend.run, backend.popen)
+    return backend
+
+
+# --- CLI ---
+
+def read_fixtures(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stats(entries):
+    """Calls, failures and latency per command name, slowest total first."""
+    totals = {}
+    for e in entries:
+        name = tracing.command_name(e["argv"])
+        calls, failed, total, longest = totals.get(name, (0, 0, 0.0, 0.0))
+        totals[name] = (calls + 1, failed + (e["returncode"] != 0), total + e["latency"], max(longest, e["latency"]))
+    return sorted(totals.items(), key=lambda item: -item[1][2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Records or replays the az/terraform calls of the ci scripts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("record", "Run a command, recording its subprocess calls"),
+                            ("replay", "Run a command, answering its subprocess calls from fixtures")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("fixtures", help="Fixture file (JSON lines)")
+        if name == "replay":
+            cmd.add_argument("--latency", type=float, default=LATENCY,
+                             help="Fraction of the recorded latency to reproduce (default: %(default)s)")
+        cmd.add_argument("argv", nargs=argparse.REMAINDER, help="Command to run (after --), e.g. python ci/fix_state.py task5")
+    stats_cmd = sub.add_parser("stats", help="Summarize a fixture file")
+    stats_cmd.add_argument("fixtures")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print("| Command | Calls | Failed | Total (s) | Max (s) |\n|---|---:|---:|---:|---:|")
+        for name, (calls, failed, total, longest) in stats(read_fixtures(args.fixtures)):
+            print(f"| {name} | {calls} | {failed} | {total:.2f} | {longest:.2f} |")
+        return 0
+
+    argv = args.argv[1:] if args.argv[:1] == ["--"] else args.argv
+    if not argv:
+        parser.error("missing command to run")
+    env = {**os.environ, "CI_SUBPROCESS_MODE": args.command, "CI_SUBPROCESS_FIXTURES": os.path.abspath(args.fixtures)}
+    if args.command == "replay":
+        env["CI_SUBPROCESS_LATENCY"] = str(args.latency)
+    # The child scripts install the interposition themselves when they import tracing
+    return subprocess.run(argv, env=env).returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import azure_rest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers from the server's `routes`: {(method, path): callable(handler) -> (status, body)}."""
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+        self.server.requests.append((self.command, self.path, dict(self.headers), self.client_address[1]))
+        route = self.server.routes.get((self.command, self.path.split("?")[0]))
+        status, payload = route(self) if route else (404, {})
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        # HEAD answers announce a length but carry no body
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_HEAD = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.routes, server.requests = {}, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.url = url
+    monkeypatch.setattr(azure_rest, "ARM_ENDPOINT", url)
+    monkeypatch.setattr(azure_rest, "LOGIN_ENDPOINT", url)
+    monkeypatch.setenv("AZURE_ACCESS_TOKEN", "static-token")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def backend(**kwargs):
+    attempts = []
+
+    def no_sleep(attempt):
+        attempts.append(attempt)
+        return True
+
+    rest = azure_rest.AzureRestBackend(subscription_id="sub", backoff=kwargs.pop("backoff", no_sleep), **kwargs)
+    rest.attempts = attempts
+    return rest
+
+
+RESOURCES = "/subscriptions/sub/resourceGroups/rg/resources"
+
+
+def test_list_resources_follows_next_link(stub):
+    stub.routes[("GET", RESOURCES)] = lambda h: (200, {"value": [{"name": "a"}], "nextLink": f"{stub.url}/page2"})
+    stub.routes[("GET", "/page2")] = lambda h: (200, {"value": [{"name": "b"}]})
+
+    rest = backend()
+    assert [r["name"] for r in rest.list_resources("rg")] == ["a", "b"]
+    # Both pages went over one kept-alive connection
+    assert len({port for *_, port in stub.requests}) == 1
+    rest.close()
+
+
+def test_missing_group_is_none(stub):
+    assert backend().list_resources("rg") is None
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttled_requests_are_retried_with_backoff(stub, status):
+    answers = iter([(status, {}), (status, {}), (200, {"value": []})])
+    stub.routes[("GET", RESOURCES)] = lambda h: next(answers)
+
+    rest = backend()
+    assert rest.list_resources("rg") == []
+    assert rest.attempts == [0, 1]
+
+
+def test_retries_stop_after_max_retries(stub, monkeypatch):
+    monkeypatch.setattr(azure_rest, "MAX_RETRIES", 2)
+    stub.routes[("GET", RESOURCES)] = lambda h: (429, {"error": "TooManyRequests"})
+
+    rest = backend()
+    with pytest.raises(azure_rest.AzureRestError) as e:
+        rest.list_resources("rg")
+    assert e.value.status == 429
+    assert rest.attempts == [0, 1]
+    assert len(stub.requests) == 3
+
+
+def test_retries_stop_when_backoff_refuses(stub):
+    stub.routes[("GET", RESOURCES)] = lambda h: (503, {})
+
+    with pytest.raises(azure_rest.AzureRestError):
+        backend(backoff=lambda attempt: False).list_resources("rg")
+    assert len(stub.requests) == 1
+
+
+def test_token_is_acquired_once_and_reused(stub, monkeypatch):
+    monkeypatch.delenv("AZURE_ACCESS_TOKEN")
+    monkeypatch.setenv("ARM_TENANT_ID", "tenant")
+    monkeypatch.setenv("ARM_CLIENT_ID", "client")
+    monkeypatch.setenv("ARM_CLIENT_SECRET", "secret")
+    stub.routes[("POST", "/tenant/oauth2/v2.0/token")] = lambda h: (200, {"access_token": "tok-1", "expires_in": 3600})
+    stub.routes[("GET", RESOURCES)] = lambda h: (200, {"value": []})
+
+    rest = backend()
+    rest.list_resources("rg")
+    rest.list_resources("rg")
+
+    token_requests = [r for r in stub.requests if r[0] == "POST"]
+    resource_requests = [r for r in stub.requests if r[0] == "GET"]
+    assert len(token_requests) == 1
+    assert [r[2]["Authorization"] for r in resource_requests] == ["Bearer tok-1", "Bearer tok-1"]
+
+
+def test_request_timeout_is_capped_by_check_deadline(stub):
+    def slow(handler):
+        time.sleep(2)
+        return 200, {"value": []}
+    stub.routes[("GET", RESOURCES)] = slow
+
+    rest = backend(remaining_time=lambda: 0.2)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        rest.list_resources("rg")
+    assert time.monotonic() - started < 1.5
+
+
+def test_container_exists_maps_head_status(stub, monkeypatch):
+    monkeypatch.setattr(azure_rest, "BLOB_ENDPOINT", stub.url + "/{account}")
+    stub.routes[("HEAD", "/acct/present")] = lambda h: (200, {})
+    rest = backend()
+    assert rest.container_exists("acct", "present") is True
+    assert rest.container_exists("acct", "absent") is False
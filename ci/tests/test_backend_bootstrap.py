@@ -0,0 +1,115 @@
+import itertools
+import json
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+import backend_bootstrap
+from backend_bootstrap import BackendNames, PLANS_CONTAINER, STATE_CONTAINER
+
+# How framework_apply.yml named the backends before backend_bootstrap.py; existing backends
+# were created under these names, so BackendNames must keep producing them
+SHELL_NAMES = """
+LOWER_ID=$(echo "$RAW_ID" | tr '[:upper:]' '[:lower:]')
+STATE_RG="rg-course-${LOWER_ID}-state"
+CLEAN_ID=$(echo "$LOWER_ID" | tr -cd 'a-z0-9')
+SHORT_ID=${CLEAN_ID:0:22}
+echo "$STATE_RG st${SHORT_ID}"
+"""
+
+
+class FakeAz:
+    """Stands in for run_az_cmd: 'show' answers for what exists, 'create' adds it, keys come from `keys`."""
+
+    def __init__(self):
+        self.existing = set()
+        self.keys = ["account-key"]
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, cmd):
+        command = " ".join(itertools.takewhile(lambda word: not word.startswith("-"), cmd[1:]))
+        with self._lock:
+            self.calls.append(command)
+            if command == "storage account keys list":
+                return self.keys.pop(0) if len(self.keys) > 1 else self.keys[0]
+            kind, _, verb = command.rpartition(" ")
+            resource = (kind, cmd[cmd.index("--name") + 1])
+            if verb == "create":
+                self.existing.add(resource)
+                return {}
+            return {} if resource in self.existing else None
+
+
+@pytest.fixture
+def az(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend_bootstrap, "CACHE_DIR", str(tmp_path))
+    fake = FakeAz()
+    monkeypatch.setattr(backend_bootstrap, "run_az_cmd", fake)
+    return fake
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="needs bash")
+@pytest.mark.parametrize("student_id", ["alice", "Bob-Smith", "carol_ann.99", "A" * 30 + "-x"])
+def test_names_match_the_shell_derivation(student_id):
+    shell = subprocess.run(["bash", "-c", SHELL_NAMES], env={"RAW_ID": student_id, "LC_ALL": "C", "PATH": "/usr/bin:/bin"},
+                           capture_output=True, text=True, check=True).stdout.split()
+    names = BackendNames(student_id)
+    assert [names.resource_group, names.account] == shell
+
+
+def test_cold_run_creates_everything_and_writes_the_marker(az, tmp_path):
+    names, key = backend_bootstrap.ensure_backend("Alice", [STATE_CONTAINER, PLANS_CONTAINER])
+
+    assert (names.account, key) == ("stalice", "account-key")
+    assert ("group", "rg-course-alice-state") in az.existing
+    assert ("storage container", PLANS_CONTAINER) in az.existing
+    marker = json.loads((tmp_path / "backend-alice.json").read_text())
+    assert marker["containers"] == sorted([STATE_CONTAINER, PLANS_CONTAINER])
+    assert "account-key" not in json.dumps(marker)
+
+
+def test_warm_marker_costs_one_keys_call(az):
+    backend_bootstrap.ensure_backend("alice")
+    az.calls.clear()
+
+    names, key = backend_bootstrap.ensure_backend("alice")
+    assert key == "account-key"
+    assert az.calls == ["storage account keys list"]
+
+
+def test_marker_without_the_container_bootstraps_again(az):
+    backend_bootstrap.ensure_backend("alice")
+    az.calls.clear()
+
+    backend_bootstrap.ensure_backend("alice", [STATE_CONTAINER, PLANS_CONTAINER])
+    assert "group show" in az.calls
+    assert ("storage container", PLANS_CONTAINER) in az.existing
+
+
+def test_expired_marker_bootstraps_again(az, tmp_path):
+    backend_bootstrap.ensure_backend("alice")
+    marker_path = tmp_path / "backend-alice.json"
+    marker = json.loads(marker_path.read_text())
+    marker["ready_at"] = int(time.time()) - backend_bootstrap.MARKER_TTL - 1
+    marker_path.write_text(json.dumps(marker))
+    az.calls.clear()
+
+    backend_bootstrap.ensure_backend("alice")
+    assert {"group show", "storage account show", "storage container show"} <= set(az.calls)
+    assert json.loads(marker_path.read_text())["ready_at"] > marker["ready_at"]
+
+
+def test_vanished_backend_behind_a_marker_is_recreated(az, tmp_path):
+    backend_bootstrap.ensure_backend("alice")
+    # e.g. the nightly cleanup removed the group: the marker's keys call fails
+    az.existing.clear()
+    az.keys = [None, "new-key"]
+
+    names, key = backend_bootstrap.ensure_backend("alice")
+    assert key == "new-key"
+    assert ("group", "rg-course-alice-state") in az.existing
+    assert (tmp_path / "backend-alice.json").exists()
@@ -0,0 +1,92 @@
+import json
+import subprocess
+
+import pytest
+
+import changed_tasks
+
+ROUTER = "plan:\n  - task1\n  - task2\n\nquiz:\n  - task2\n"
+ANSWERS = {"task1": {"resources": ["azurerm_resource_group.rg"]}, "task2": {"resources": []}}
+
+
+def git(repo, *args):
+    return subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, files):
+    """Writes `files` ({path: text}) and commits them; returns the new sha."""
+    for path, text in files.items():
+        target = repo / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "change")
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """A repo with three tasks; task3 has no check enabled. Returns (path, base sha)."""
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{var}_NAME", "test")
+        monkeypatch.setenv(f"GIT_{var}_EMAIL", "test@example.com")
+    git(tmp_path, "init", "-q")
+    base = commit(tmp_path, {
+        "task1/main.tf": "# task1\n", "task2/main.tf": "# task2\n", "task3/main.tf": "# task3\n",
+        "ci/answers.json": json.dumps(ANSWERS), "ci/tasks_config.yml": ROUTER,
+        "ci/validate_plan.py": "# validator\n", "ci/fixtures/plan.json": "{}\n", "README.md": "# course\n",
+    })
+    return tmp_path, base
+
+
+def detected(repo, base, files):
+    head = commit(repo, files)
+    result = changed_tasks.detect(base, head, str(repo))
+    return result["tasks"], result
+
+
+def test_task_file_selects_its_task(repo):
+    path, base = repo
+    tasks, result = detected(path, base, {"task1/main.tf": "# changed\n"})
+    assert tasks == ["task1"]
+    assert result["reasons"] == {"task1": ["task1/main.tf"]}
+    assert result["checks"]["task1"] == {"quiz": False, "plan": True, "manual": False}
+
+
+def test_rule_file_selects_only_changed_entries(repo):
+    path, base = repo
+    answers = {**ANSWERS, "task2": {"resources": ["azurerm_key_vault.kv"]}}
+    tasks, result = detected(path, base, {"ci/answers.json": json.dumps(answers, indent=2)})
+    assert tasks == ["task2"]
+    assert result["reasons"] == {"task2": ["ci/answers.json"]}
+
+
+def test_unreadable_rule_file_selects_every_task(repo):
+    path, base = repo
+    tasks, _ = detected(path, base, {"ci/answers.json": "{broken"})
+    assert tasks == ["task1", "task2"]
+
+
+def test_router_change_selects_tasks_whose_routing_changed(repo):
+    path, base = repo
+    tasks, result = detected(path, base, {"ci/tasks_config.yml": ROUTER + "\nmanual:\n  - task1\n  - task3\n"})
+    assert tasks == ["task1", "task3"]
+    assert result["checks"]["task3"] == {"quiz": False, "plan": False, "manual": True}
+
+
+def test_shared_files(repo):
+    path, base = repo
+    assert detected(path, base, {"ci/fixtures/plan.json": "[]\n", "README.md": "# edited\n"})[0] == []
+
+    tasks, result = detected(path, base, {"ci/validate_plan.py": "# changed\n"})
+    assert tasks == ["task1", "task2"]
+    assert result["reasons"]["task1"] == ["ci/validate_plan.py"]
+    # Affected, but no check is enabled for it
+    assert result["skipped"] == ["task3"]
+
+
+def test_without_base_every_enabled_task_is_selected(repo):
+    path, _ = repo
+    result = changed_tasks.detect(changed_tasks.NULL_SHA, "HEAD", str(path))
+    assert result["tasks"] == ["task1", "task2"]
+    assert result["diff_base"] is None
@@ -0,0 +1,90 @@
+import io
+import threading
+import time
+
+import azure_cli
+import check_manual_steps
+
+
+def test_is_throttled_matches_error_and_status_codes():
+    assert azure_cli.is_throttled("ERROR: (TooManyRequests) Too many requests.")
+    assert azure_cli.is_throttled("Code: SubscriptionRequestsThrottled")
+    assert azure_cli.is_throttled("(ServerBusy) The server is busy.")
+    assert azure_cli.is_throttled("Operation returned an invalid status code: 429")
+    assert azure_cli.is_throttled("HTTP/1.1 503 Service Unavailable")
+
+
+def test_is_throttled_ignores_digits_in_names():
+    assert not azure_cli.is_throttled("ResourceNotFound: storage account 'st4290x' was not found")
+    assert not azure_cli.is_throttled("(AuthorizationFailed) client 1429-ab has no access")
+
+
+def test_run_checks_writes_each_check_output_in_order(monkeypatch):
+    def slow(rg_name, params):
+        time.sleep(0.1)
+        check_manual_steps.log(f"   slow {params['name_contains']}")
+        return True
+
+    def fast(rg_name, params):
+        check_manual_steps.log(f"   fast {params['container_name']}")
+        return False
+
+    monkeypatch.setitem(check_manual_steps.DISPATCHER, "resource_exists", slow)
+    monkeypatch.setitem(check_manual_steps.DISPATCHER, "container_exists", fast)
+    config = {"checks": [
+        {"type": "resource_exists", "resource_type": "t", "name_contains": "a"},
+        {"type": "container_exists", "container_name": "b"},
+        {"type": "nope"},
+    ]}
+    out, outcomes = io.StringIO(), []
+
+    passed = check_manual_steps.run_checks(config, "rg", max_workers=2, outcomes=outcomes, out=out)
+
+    assert not passed
+    lines = [line.strip() for line in out.getvalue().splitlines()]
+    assert lines == ["slow a", "[PASS] Check passed.", "fast b", "[FAIL] Check failed.",
+                     "[WARN] Unknown check type: nope"]
+    assert [o["passed"] for o in outcomes] == [True, False]
+
+
+def test_inventory_fetch_blocks_only_its_group(monkeypatch):
+    release = threading.Event()
+
+    def load(rg_name, refresh):
+        if rg_name == "slow":
+            release.wait(5)
+        return {}
+
+    monkeypatch.setattr(check_manual_steps, "_load_inventory", load)
+    worker = threading.Thread(target=check_manual_steps.get_inventory, args=("slow", False))
+    worker.start()
+    try:
+        started = time.monotonic()
+        assert check_manual_steps.get_inventory("fast", False) == {}
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_failed_listing_is_an_error_and_retried(monkeypatch, tmp_path):
+    listings = [None, [{"type": "Microsoft.Storage/storageAccounts", "name": "st1"}]]
+
+    class Backend:
+        def list_resources(self, rg_name):
+            return listings.pop(0)
+
+    monkeypatch.setattr(check_manual_steps, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(check_manual_steps, "_inventories", {})
+    monkeypatch.setattr(check_manual_steps, "get_backend", Backend)
+    config = {"checks": [{"type": "resource_exists", "resource_type": "Microsoft.Storage/storageAccounts",
+                          "name_contains": "st"}]}
+
+    out = io.StringIO()
+    assert not check_manual_steps.run_checks(config, "rg", out=out)
+    assert "[ERROR] Could not list resource group rg." in out.getvalue()
+    assert "not found" not in out.getvalue()
+
+    out = io.StringIO()
+    assert check_manual_steps.run_checks(config, "rg", out=out)
+    assert "[OK] Found resource: st1" in out.getvalue()
@@ -0,0 +1,94 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import cleanup
+import plugin_cache
+
+# Stands in for terraform: 'init' succeeds, 'destroy' empties the local state named in the
+# backend override (or fails for the student in FAKE_TERRAFORM_FAIL). Calls are logged.
+FAKE_TERRAFORM = f"""#!{sys.executable}
+import json, os, re, sys
+with open(os.environ["FAKE_TERRAFORM_LOG"], "a") as log:
+    log.write(json.dumps([sys.argv[1], os.environ["TF_VAR_student_id"]]) + "\\n")
+if sys.argv[1] == "destroy":
+    if os.environ["TF_VAR_student_id"] == os.environ.get("FAKE_TERRAFORM_FAIL"):
+        sys.stderr.write("Error: deleting resource group: boom")
+        sys.exit(1)
+    with open("cleanup_backend_override.tf") as f:
+        path = json.loads(re.search(r"path = (.+)", f.read()).group(1))
+    with open(path, "w") as f:
+        json.dump({{"resources": []}}, f)
+"""
+
+
+def state(instances):
+    return {"resources": [{"mode": "managed", "type": "azurerm_resource_group", "name": "rg",
+                           "instances": [{}] * instances},
+                          {"mode": "data", "type": "azurerm_client_config", "name": "c", "instances": [{}]}]}
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """Fake terraform on PATH, a repo with task1 and a local state store."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    terraform = bin_dir / "terraform"
+    terraform.write_text(FAKE_TERRAFORM)
+    terraform.chmod(terraform.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_TERRAFORM_LOG", str(tmp_path / "terraform.log"))
+    monkeypatch.setattr(plugin_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(plugin_cache, "STATS_FILE", str(tmp_path / "stats.jsonl"))
+
+    repo = tmp_path / "repo"
+    (repo / "task1").mkdir(parents=True)
+    (repo / "task1" / "main.tf").write_text('resource "azurerm_resource_group" "rg" {}\n')
+
+    states = tmp_path / "states"
+    for key, document in {"alice/task1.tfstate": state(2), "bob/task1.tfstate": state(0),
+                          "carol/task9.tfstate": state(1), "erin/task1.tfstate": state(1)}.items():
+        (states / key).parent.mkdir(parents=True, exist_ok=True)
+        (states / key).write_text(json.dumps(document))
+    (states / "dave").mkdir()
+    (states / "dave" / "task1.tfstate").write_text("{not json")
+    (states / "alice" / "notes.txt").write_text("not a state")
+    (states / "README.md").write_text("not a student")
+    return repo, states, tmp_path / "terraform.log"
+
+
+def calls(log):
+    return sorted(json.loads(line) for line in log.read_text().splitlines()) if log.exists() else []
+
+
+def test_local_store_lists_student_states(env):
+    _, states, _ = env
+    store = cleanup.LocalStateStore(str(states))
+    assert [ref.key for ref in store.list_states()] == [
+        "alice/task1.tfstate", "bob/task1.tfstate", "carol/task9.tfstate", "dave/task1.tfstate", "erin/task1.tfstate"]
+
+
+def test_cleanup_destroys_states_that_hold_resources(env, monkeypatch):
+    repo, states, log = env
+    monkeypatch.setenv("FAKE_TERRAFORM_FAIL", "erin")
+
+    summary = cleanup.cleanup([cleanup.LocalStateStore(str(states))], str(repo), max_workers=2)
+
+    statuses = {(r["student"], r["task"]): r["status"] for r in summary["records"]}
+    assert statuses == {("alice", "task1"): "destroyed", ("bob", "task1"): "empty", ("carol", "task9"): "skipped",
+                        ("dave", "task1"): "failed", ("erin", "task1"): "failed"}
+    assert (summary["states"], summary["destroyed"], summary["failed"], summary["resources_reclaimed"]) == (5, 1, 2, 2)
+    assert "boom" in next(r["error"] for r in summary["records"] if r["student"] == "erin")
+    assert calls(log) == [["destroy", "alice"], ["destroy", "erin"], ["init", "alice"], ["init", "erin"]]
+    # The destroy went to the local state file through the backend override
+    assert cleanup.count_resources(json.loads((states / "alice" / "task1.tfstate").read_text())) == 0
+
+
+def test_dry_run_runs_no_terraform(env):
+    repo, states, log = env
+    summary = cleanup.cleanup([cleanup.LocalStateStore(str(states))], str(repo), dry_run=True)
+    assert [r["student"] for r in summary["records"] if r["status"] == "would_destroy"] == ["alice", "erin"]
+    assert calls(log) == []
@@ -0,0 +1,32 @@
+import os
+
+import fix_state
+
+STORAGE_ID = "/subscriptions/0000/resourceGroups/rg/providers/Microsoft.Storage/storageAccounts/st1"
+
+
+def test_wrapped_conflict_id_is_joined():
+    text = ('Error: A resource with the ID "/subscriptions/0000/resourceGroups/rg/providers/\n'
+            '  Microsoft.Storage/storageAccounts/st1" already exists - to be managed via Terraform\n'
+            'Error: A resource with the ID "' + STORAGE_ID + '" already exists')
+    assert fix_state.find_conflicts(text) == [STORAGE_ID]
+
+
+def test_diagnostic_detail_with_wrapped_id_is_queued(capsys):
+    event = ('{"type": "diagnostic", "diagnostic": {"severity": "error", "summary": "Resource exists",'
+             ' "detail": "A resource with the ID \\"/subscriptions/0000/resourceGroups/rg/providers/\\n'
+             'Microsoft.Storage/storageAccounts/st1\\" already exists"}}\n')
+    result = fix_state.consume_apply_events([event], fix_state.ApplyResult())
+    assert result.conflicts == [STORAGE_ID]
+    assert result.errors == []
+
+
+def test_replay_of_synthetic_apply_log_queues_children_first():
+    fixture = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures",
+                           "synthetic_apply_conflicts.jsonl")
+    result = fix_state.replay_apply(fixture)
+    account = ("/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg-course-student1"
+               "/providers/Microsoft.Storage/storageAccounts/dlstudent1")
+    assert result.code == 1
+    assert result.conflicts == [account, account + "|diag-datalake"]
+    assert fix_state.deletion_waves(result.conflicts) == [[account + "|diag-datalake"], [account]]
@@ -0,0 +1,80 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import grade_cohort
+import results_store
+import rules_bundle
+import validate_plan
+
+SPEC = {"resources": ["azurerm_resource_group.rg", "azurerm_key_vault.kv"],
+        "attributes": {"azurerm_key_vault.kv": {"sku_name": "standard"}}}
+RULES = {"answers": {"task1": SPEC}, "quiz_answers": {}, "variables": {}, "manual_checks": {},
+         "tasks_config": {"plan": ["task1"]}}
+
+
+def plan(*resources):
+    return {"planned_values": {"root_module": {"resources": [
+        {"address": f"{r_type}.{name}", "mode": "managed", "type": r_type, "name": name, "values": values}
+        for r_type, name, values in resources
+    ]}}}
+
+
+@pytest.fixture
+def cohort(tmp_path, monkeypatch):
+    """alice's plan passes, bob's lacks the key vault. Returns the grading jobs."""
+    plans = {
+        "alice": plan(("azurerm_resource_group", "rg", {}), ("azurerm_key_vault", "kv", {"sku_name": "standard"})),
+        "bob": plan(("azurerm_resource_group", "rg", {})),
+    }
+    for student, document in plans.items():
+        (tmp_path / "checkouts" / student / "task1").mkdir(parents=True)
+        (tmp_path / "plans" / student).mkdir(parents=True)
+        (tmp_path / "plans" / student / "task1.json").write_text(json.dumps(document))
+    monkeypatch.setattr(results_store, "DB_PATH", str(tmp_path / "results.sqlite"))
+    monkeypatch.setattr(results_store, "_conn", None)
+    return list(grade_cohort.discover_jobs(str(tmp_path / "checkouts"), str(tmp_path / "plans"), False))
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the probes reach the workers through fork")
+def test_pool_grades_per_student_and_loads_rules_once_per_worker(cohort, tmp_path, monkeypatch):
+    log = tmp_path / "calls.log"
+    init_worker, load_plan = grade_cohort._init_worker, validate_plan.load_planned_resources
+
+    def logged(event):
+        with open(log, "a") as f:
+            f.write(f"{event} {os.getpid()}\n")
+
+    def init_probe(rules):
+        logged("init")
+        init_worker(rules)
+
+    def load_probe(path, spec):
+        logged("plan")
+        return load_plan(path, spec)
+
+    def no_reload(name):
+        raise AssertionError("workers must use the rules handed to them")
+
+    monkeypatch.setattr(grade_cohort, "_init_worker", init_probe)
+    monkeypatch.setattr(validate_plan, "load_planned_resources", load_probe)
+    monkeypatch.setattr(rules_bundle, "load_rules", no_reload)
+
+    results = grade_cohort.grade(cohort + cohort, RULES, workers=2)
+
+    assert sorted(results) == ["alice", "bob"]
+    assert results["alice"]["task1"]["plan"]["status"] == "success"
+    assert results["bob"]["task1"]["plan"]["status"] == "failure"
+    assert results["bob"]["task1"]["plan"]["errors"] == ["Missing resources in plan: ['azurerm_key_vault.kv']"]
+    assert results["alice"]["task1"]["quiz"] == {"status": "skipped"}
+
+    calls = [line.split() for line in log.read_text().splitlines()]
+    init_pids = [pid for event, pid in calls if event == "init"]
+    assert len(init_pids) == len(set(init_pids)) <= 2
+    assert {pid for event, pid in calls if event == "plan"} <= set(init_pids)
+    assert sum(1 for event, _ in calls if event == "plan") == 4
+
+    rows = results_store.connect().execute("SELECT student, passed FROM records ORDER BY student").fetchall()
+    assert sorted(set(rows)) == [("alice", 1), ("bob", 0)]
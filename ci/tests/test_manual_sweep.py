@@ -0,0 +1,49 @@
+import json
+import os
+
+import check_manual_steps
+import manual_sweep
+
+CI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(CI_DIR, "fixtures", "manual_sweep.json")
+
+
+def load_config():
+    with open(os.path.join(CI_DIR, "manual_checks.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_sweep_over_fixture():
+    matrix = manual_sweep.sweep(manual_sweep.FixtureBackend(FIXTURE), load_config())
+
+    verdicts = {student: {task: result["passed"] for task, result in tasks.items()} for student, tasks in matrix.items()}
+    assert verdicts == {
+        "alice": {"task5": True, "task6": True, "task7": True, "task8": True},
+        "bob": {"task5": False, "task6": True, "task7": False, "task8": False},
+        "carol-ann": {"task5": False, "task6": False, "task7": False, "task8": False},
+    }
+    assert matrix["alice"]["task5"]["items"][0]["detail"] == "stalice01/manual-verification-done"
+    assert matrix["carol-ann"]["task5"]["items"][0]["detail"] == "no storage account in rg-course-carol-ann-ch1"
+
+
+def test_sweep_probes_the_same_storage_account_as_the_single_check(monkeypatch):
+    fixture = manual_sweep.FixtureBackend(FIXTURE)
+    config = {"task5": load_config()["task5"]}
+    matrix = manual_sweep.sweep(fixture, config, students=["alice"])
+    swept_account = matrix["alice"]["task5"]["items"][0]["detail"].split("/")[0]
+
+    # The single check lists the group through Azure, in whatever order it returns
+    rows = [r for r in fixture.fixture["resources"] if r["resourceGroup"] == "rg-course-alice-ch1"]
+    index = check_manual_steps.build_index(list(reversed(rows)))
+    probed = []
+
+    class Backend:
+        def container_exists(self, account, container):
+            probed.append(account)
+            return fixture.container_exists(account, container)
+
+    monkeypatch.setattr(check_manual_steps, "find_resources", lambda rg, r_type, match=None: list(index[r_type.lower()].values()))
+    monkeypatch.setattr(check_manual_steps, "get_backend", Backend)
+
+    assert check_manual_steps.check_container_exists("rg-course-alice-ch1", config["task5"]["checks"][0])
+    assert probed == [swept_account] == ["stalice01"]
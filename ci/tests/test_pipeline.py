@@ -0,0 +1,39 @@
+import sys
+import time
+
+import pipeline
+
+
+def test_stage_output_is_grouped_per_stage(monkeypatch, capsys):
+    def slow(ctx, out):
+        print("slow 1", file=out)
+        time.sleep(0.1)
+        print("slow 2", file=out)
+        return {"status": "success"}
+
+    def fast(ctx, out):
+        print("fast", file=out)
+        return {"status": "failure"}
+
+    def broken(ctx, out):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(pipeline, "STAGES", (
+        pipeline.Stage("slow", (), slow),
+        pipeline.Stage("fast", (), fast),
+        pipeline.Stage("after", ("slow", "fast"), fast),
+        pipeline.Stage("report", ("slow", "fast"), broken, always=True),
+    ))
+    stdout = sys.stdout
+
+    results = pipeline.run_pipeline("task1", stage_names=("slow", "fast", "after", "report"))
+
+    assert sys.stdout is stdout
+    assert results["after"]["status"] == "skipped"
+    assert results["report"]["error"] == "boom"
+    groups = [g.split("\n", 1) for g in capsys.readouterr().out.split("::endgroup::\n") if g]
+    assert [(head.split(" ")[0], body) for head, body in groups] == [
+        ("::group::fast", "fast\n"),
+        ("::group::slow", "slow 1\nslow 2\n"),
+        ("::group::report", "[ERROR] Stage 'report' raised: boom\n"),
+    ]
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import plan_artifact
+import validate_plan
+
+PLAN = {
+    "format_version": "1.2",
+    "terraform_version": "1.7.0",
+    "planned_values": {"root_module": {
+        "resources": [
+            {"address": "azurerm_key_vault.kv", "mode": "managed", "type": "azurerm_key_vault", "name": "kv",
+             "values": {"sku_name": "standard", "location": "westeurope"}},
+            {"address": "azurerm_resource_group.rg", "mode": "managed", "type": "azurerm_resource_group",
+             "name": "rg", "values": {"name": "rg-course"}},
+        ],
+        "child_modules": [{"resources": [
+            {"address": "module.net.azurerm_subnet.s[0]", "mode": "managed", "type": "azurerm_subnet",
+             "name": "s", "index": 0, "values": {"name": "snet"}},
+        ]}],
+    }},
+    "resource_changes": [
+        {"address": "azurerm_key_vault.kv", "mode": "managed", "type": "azurerm_key_vault", "name": "kv",
+         "change": {"actions": ["create"], "before": None, "after": {}}},
+        {"address": "azurerm_storage_account.old", "mode": "managed", "type": "azurerm_storage_account",
+         "name": "old", "change": {"actions": ["delete"], "before": {}, "after": None}},
+    ],
+    "configuration": {"root_module": {}},
+}
+SPEC = {"resources": ["azurerm_key_vault.kv", "azurerm_subnet.s"],
+        "attributes": {"azurerm_key_vault.kv": {"sku_name": "standard"}},
+        "actions": {"azurerm_key_vault.kv": "create", "azurerm_resource_group.rg": "create"}}
+
+
+def write_plan(tmp_path, sort_keys=False):
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps(PLAN, sort_keys=sort_keys), encoding="utf-8")
+    return path
+
+
+def pack(tmp_path, spec, sort_keys=False):
+    out = tmp_path / "plan.artifact"
+    plan_artifact.write(plan_artifact.build(write_plan(tmp_path, sort_keys), spec), out)
+    return out
+
+
+def summary(index):
+    return ({a: (r.action, r.values) for a, r in index.by_address.items()},
+            sorted((r.address, r.action) for r in index.removed))
+
+
+@pytest.mark.parametrize("sort_keys", [False, True])
+def test_round_trip_matches_the_full_plan(tmp_path, sort_keys):
+    artifact = pack(tmp_path, SPEC, sort_keys)
+    from_artifact = validate_plan.load_planned_resources(artifact, SPEC)
+    from_plan = validate_plan.load_planned_resources(write_plan(tmp_path, sort_keys), SPEC)
+
+    assert len(from_artifact) == 3
+    assert summary(from_artifact) == summary(from_plan)
+    assert from_artifact.by_address["azurerm_key_vault.kv"].values == {"sku_name": "standard"}
+    # No resource_changes entry: the action stays unknown, as in the full plan
+    assert from_artifact.by_address["azurerm_resource_group.rg"].action is None
+    assert validate_plan.validate_resources(SPEC, from_artifact) == validate_plan.validate_resources(SPEC, from_plan)
+
+
+def test_all_attributes_artifact_serves_any_spec(tmp_path):
+    artifact = pack(tmp_path, None)
+    index = validate_plan.load_planned_resources(artifact, SPEC)
+    assert index.by_address["azurerm_key_vault.kv"].values == {"sku_name": "standard", "location": "westeurope"}
+
+
+def test_artifact_for_other_rules_is_refused(tmp_path):
+    artifact = pack(tmp_path, SPEC)
+    other = {**SPEC, "attributes": {"azurerm_key_vault.kv": {"location": "westeurope"}}}
+    with pytest.raises(ValueError, match="different rules"):
+        validate_plan.load_planned_resources(artifact, other)
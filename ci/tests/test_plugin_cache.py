@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import stat
+import sys
+
+import pytest
+
+import plugin_cache
+
+PROVIDER = "registry.terraform.io/hashicorp/azurerm/3.100.0/linux_amd64/terraform-provider-azurerm_v3.100.0"
+
+# Stands in for 'terraform init': copies the providers of the filesystem mirror named in
+# TF_CLI_CONFIG_FILE into TF_PLUGIN_CACHE_DIR unless they are already there.
+FAKE_TERRAFORM = f"""#!{sys.executable}
+import os, re, shutil, sys
+with open(os.environ["TF_CLI_CONFIG_FILE"]) as f:
+    mirror = re.search(r'path = "([^"]+)"', f.read()).group(1)
+cache = os.environ["TF_PLUGIN_CACHE_DIR"]
+for root, _, files in os.walk(mirror):
+    for name in files:
+        target = os.path.join(cache, os.path.relpath(os.path.join(root, name), mirror))
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(root, name), target)
+sys.exit(int(os.environ.get("FAKE_TERRAFORM_EXIT", "0")))
+"""
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """Fake terraform on PATH, a one-provider mirror and a task with a lock file."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    terraform = bin_dir / "terraform"
+    terraform.write_text(FAKE_TERRAFORM)
+    terraform.chmod(terraform.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    mirror = tmp_path / "mirror"
+    (mirror / os.path.dirname(PROVIDER)).mkdir(parents=True)
+    (mirror / PROVIDER).write_bytes(b"x" * 4096)
+
+    task = tmp_path / "task1"
+    task.mkdir()
+    (task / "main.tf").write_text('resource "azurerm_resource_group" "rg" {}\n')
+    (task / plugin_cache.LOCK_FILE).write_text('provider "registry.terraform.io/hashicorp/azurerm" {\n  version = "3.100.0"\n}\n')
+
+    monkeypatch.setattr(plugin_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(plugin_cache, "STATS_FILE", str(tmp_path / "stats.jsonl"))
+    return task, mirror
+
+
+def test_key_follows_lock_file_and_platform(env):
+    task, _ = env
+    key = plugin_cache.cache_key(str(task))
+    assert re.fullmatch(rf"lock-[0-9a-f]{{16}}-{plugin_cache.platform_name()}", key)
+
+    (task / plugin_cache.LOCK_FILE).write_text('provider "registry.terraform.io/hashicorp/azurerm" {\n  version = "3.101.0"\n}\n')
+    assert plugin_cache.cache_key(str(task)) != key
+
+
+def test_key_without_lock_file_ignores_unrelated_edits(env):
+    task, _ = env
+    os.remove(task / plugin_cache.LOCK_FILE)
+    key = plugin_cache.cache_key(str(task))
+    assert key.startswith("req-")
+
+    (task / "main.tf").write_text('resource "azurerm_resource_group" "rg" {\n  name = "other"\n}\n')
+    assert plugin_cache.cache_key(str(task)) == key
+    (task / "main.tf").write_text('resource "random_string" "s" {}\n')
+    assert plugin_cache.cache_key(str(task)) != key
+
+
+def test_miss_then_hit_from_mirror(env):
+    task, mirror = env
+
+    _, miss = plugin_cache.init(str(task), mirror=str(mirror), capture=True)
+    _, hit = plugin_cache.init(str(task), mirror=str(mirror), capture=True)
+
+    assert (miss["hit"], miss["bytes_downloaded"], miss["bytes_reused"], miss["ok"]) == (False, 4096, 0, True)
+    assert (hit["hit"], hit["bytes_downloaded"], hit["bytes_reused"], hit["ok"]) == (True, 0, 4096, True)
+    assert os.path.exists(os.path.join(plugin_cache.cache_dir(miss["key"]), PROVIDER))
+
+    summary = plugin_cache.summarize(plugin_cache.read_stats())
+    assert (summary["inits"], summary["hits"], summary["hit_rate"], summary["bytes_saved"]) == (2, 1, 0.5, 4096)
+
+
+def test_failed_init_is_not_a_hit_next_time(env, monkeypatch):
+    task, mirror = env
+    monkeypatch.setenv("FAKE_TERRAFORM_EXIT", "1")
+    _, record = plugin_cache.init(str(task), mirror=str(mirror), capture=True)
+    assert not record["ok"]
+
+    monkeypatch.delenv("FAKE_TERRAFORM_EXIT")
+    _, record = plugin_cache.init(str(task), mirror=str(mirror), capture=True)
+    assert not record["hit"] and record["ok"]
+
+
+def test_stats_aggregate_several_runs(tmp_path):
+    runs = []
+    for number, hit in enumerate((False, True, True)):
+        path = tmp_path / f"run{number}.jsonl"
+        path.write_text(json.dumps({"hit": hit, "bytes_reused": 100 if hit else 0, "bytes_downloaded": 0 if hit else 100,
+                                    "init_seconds": 1.0 if hit else 3.0}) + "\n")
+        runs.append(str(path))
+    summary = plugin_cache.summarize(plugin_cache.read_stats(runs))
+    assert (summary["inits"], summary["hit_rate"], summary["bytes_saved"]) == (3, 0.667, 200)
@@ -0,0 +1,25 @@
+import quiz_extract
+
+
+def test_quiz_file_is_instructions_else_first_markdown(tmp_path):
+    (tmp_path / "b.md").write_text("- [x] B\n")
+    (tmp_path / "a.md").write_text("- [x] A\n")
+    assert quiz_extract.selected_letters(str(tmp_path), use_artifact=False) == ["A"]
+
+    (tmp_path / "instructions.md").write_text("- [ ] A\n- [X] c\n")
+    assert quiz_extract.selected_letters(str(tmp_path), use_artifact=False) == ["C"]
+
+
+def test_artifact_is_written_outside_the_working_directory(tmp_path, monkeypatch):
+    task = tmp_path / "task1"
+    task.mkdir()
+    (task / "instructions.md").write_text("- [x] A\n- [x] D\n")
+    artifacts = tmp_path / "cache"
+    monkeypatch.setattr(quiz_extract, "ARTIFACT_DIR", str(artifacts))
+    monkeypatch.chdir(task)
+
+    assert quiz_extract.selected_letters(str(task)) == ["A", "D"]
+    assert [p.name for p in artifacts.iterdir()] == ["quiz_answers-task1.json"]
+    assert quiz_extract.read_artifact("task1")["answers"][1] == {"letter": "D", "file": "instructions.md",
+                                                                 "line": 2, "question": 2}
+    assert sorted(p.name for p in task.iterdir()) == ["instructions.md"]
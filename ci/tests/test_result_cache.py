@@ -0,0 +1,30 @@
+import result_cache
+
+
+def test_manual_verdict_is_not_cached(tmp_path, monkeypatch):
+    task = tmp_path / "task1"
+    task.mkdir()
+    (task / "main.tf").write_text('resource "x" "y" {}\n')
+    github_output = tmp_path / "output"
+    monkeypatch.setenv("GITHUB_OUTPUT", str(github_output))
+    monkeypatch.delenv("GITHUB_ENV", raising=False)
+    monkeypatch.chdir(tmp_path)
+    store = result_cache.LocalDirStore(str(tmp_path / "cache"))
+
+    results = {"quiz": "success", "manual": "success", "plan": "success"}
+    assert result_cache.store_result(str(task), "s1", store, results, plan_blob="plans/1.json.gz")
+
+    entry = result_cache.lookup(str(task), "s1", store)
+    assert entry["results"] == {"quiz": "success", "plan": "success"}
+    outputs = github_output.read_text().splitlines()
+    assert "cache_hit=true" in outputs
+    assert "plan_blob=plans/1.json.gz" in outputs
+    assert not any(line.startswith("manual_result=") for line in outputs)
+
+
+def test_failed_run_is_not_cached(tmp_path):
+    task = tmp_path / "task1"
+    task.mkdir()
+    store = result_cache.LocalDirStore(str(tmp_path / "cache"))
+    assert not result_cache.store_result(str(task), "s1", store, {"quiz": "success", "manual": "failure"})
+    assert not (tmp_path / "cache").exists()
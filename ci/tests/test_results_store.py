@@ -0,0 +1,33 @@
+import results_store
+
+
+def store(path, student, passed):
+    conn = results_store.connect(str(path))
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO records (recorded_at, student, task, sha, stage, passed, duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (1000.0, student, "task1", None, "quiz", int(passed), 0.1),
+        )
+        conn.execute("INSERT INTO items (record_id, item, passed, detail) VALUES (?, ?, ?, ?)",
+                     (cursor.lastrowid, "Q1", int(passed), None))
+    conn.close()
+    return str(path)
+
+
+def test_merge_appends_runs_once(tmp_path):
+    runs = [store(tmp_path / "a.sqlite", "s1", True), store(tmp_path / "b.sqlite", "s2", False)]
+    conn = results_store.connect(str(tmp_path / "cohort.sqlite"))
+
+    assert results_store.merge(conn, runs) == 2
+    assert results_store.merge(conn, runs) == 0
+    assert list(results_store.pass_rates(conn)) == [("task1", "quiz", 2, 1, 0.5)]
+    assert [row[:3] for row in results_store.most_failed_items(conn, "quiz")] == [("task1", "Q1", 1)]
+
+
+def test_current_student_ignores_github_actor(monkeypatch):
+    monkeypatch.delenv("STUDENT_ID", raising=False)
+    monkeypatch.delenv("TF_VAR_student_id", raising=False)
+    monkeypatch.setenv("GITHUB_ACTOR", "github-actions[bot]")
+    assert results_store.current_student() == "unknown"
+    monkeypatch.setenv("TF_VAR_student_id", "s1")
+    assert results_store.current_student() == "s1"
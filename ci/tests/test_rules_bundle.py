@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import rules_bundle
+
+CI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def rules_dir(tmp_path, monkeypatch):
+    """A copy of the repo's rule files with the bundle written next to them."""
+    for source in rules_bundle.SOURCES.values():
+        shutil.copy(os.path.join(CI_DIR, source), tmp_path / source)
+    monkeypatch.setattr(rules_bundle, "SCRIPT_DIR", str(tmp_path))
+    monkeypatch.setattr(rules_bundle, "BUNDLE_PATH", str(tmp_path / "rules_bundle.json"))
+    monkeypatch.setattr(rules_bundle, "_loaded", None)
+    return tmp_path
+
+
+def reload_bundle(monkeypatch):
+    monkeypatch.setattr(rules_bundle, "_loaded", None)
+    return rules_bundle.load_bundle()
+
+
+def test_repo_rules_have_no_errors():
+    rules = {name: rules_bundle.read_source(name) for name in rules_bundle.SOURCES}
+    errors, _ = rules_bundle.validate(rules)
+    assert errors == []
+
+
+def test_cross_file_warnings():
+    rules = {
+        "answers": {"task1": {"resources": ["azurerm_resource_group.rg"],
+                              "attributes": {"azurerm_key_vault.kv": {"sku_name": "standard"},
+                                             "azurerm_subnet.s[*]": {"name": "a"}}}},
+        "quiz_answers": {"task1": ["A"]},
+        "variables": {"task1": {"mappings": [{"A": {"X": "1"}}, {"B": {"Y": "2"}}]}},
+        "manual_checks": {},
+        "tasks_config": {"plan": ["task{1,2}", "lab-*"], "quiz": ["task1"], "extra": []},
+    }
+    errors, warnings = rules_bundle.validate(rules)
+    assert errors == []
+    assert sorted(warnings) == sorted([
+        "answers.json: 'task1' checks attributes of azurerm_key_vault.kv, which is not a required resource",
+        "variables.json: 'task1' has more mappings than quiz questions",
+        "tasks_config.yml: unknown key 'extra'",
+        "tasks_config.yml: 'task2' is listed under 'plan' but has no entry in answers.json",
+        "tasks_config.yml: 'lab-*' under 'plan' matches no entry in answers.json",
+    ])
+
+
+def test_shape_errors():
+    rules = {"answers": {"task1": {"resources": "azurerm_resource_group.rg", "actions": {"a.b": "destroy"}}},
+             "manual_checks": {"task1": {"checks": [{"type": "container_exists"}, {"type": "vm_running"}]}}}
+    errors, _ = rules_bundle.validate(rules)
+    assert len(errors) == 4
+
+
+def test_fresh_bundle_is_used(rules_dir, capsys):
+    assert rules_bundle.build() == 0
+    bundle = json.loads((rules_dir / "rules_bundle.json").read_text())
+    bundle["rules"]["answers"] = {"from": "bundle"}
+    (rules_dir / "rules_bundle.json").write_text(json.dumps(bundle))
+    assert rules_bundle.load_rules("answers") == {"from": "bundle"}
+
+
+@pytest.mark.parametrize("touch", ["content", "mtime"])
+def test_stale_bundle_is_ignored_until_rebuilt(rules_dir, monkeypatch, capsys, touch):
+    assert rules_bundle.build() == 0
+    answers_path = rules_dir / "answers.json"
+    answers = json.loads(answers_path.read_text())
+    if touch == "content":
+        answers["task99"] = {"resources": []}
+        answers_path.write_text(json.dumps(answers))
+    else:
+        # Same size, newer mtime: still treated as changed
+        st = os.stat(answers_path)
+        os.utime(answers_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert reload_bundle(monkeypatch) is None
+    assert "answers.json changed since it was built" in capsys.readouterr().err
+    assert rules_bundle.load_rules("answers") == answers
+
+    monkeypatch.setattr(rules_bundle, "_loaded", None)
+    assert rules_bundle.build() == 0
+    bundle = reload_bundle(monkeypatch)
+    assert bundle is not None
+    assert bundle["rules"]["answers"] == answers
+    assert bundle["content_hash"] == rules_bundle.content_hash()
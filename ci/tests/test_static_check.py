@@ -0,0 +1,13 @@
+import static_check
+
+
+def evaluate(text):
+    return static_check.evaluate(static_check.tokenize(text), static_check.Scope())
+
+
+def test_newlines_separate_multi_line_object_items():
+    assert evaluate('\n{\n  a = 1\n  b = "x"\n}\n') == {"a": 1, "b": "x"}
+
+
+def test_newlines_separate_multi_line_list_items():
+    assert evaluate('[\n  "a",\n  "b"\n]') == ["a", "b"]
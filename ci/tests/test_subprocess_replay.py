@@ -0,0 +1,55 @@
+import json
+import subprocess
+
+import subprocess_replay
+from subprocess_replay import REDACTED, Player, Recorder, normalize
+
+
+def fake_run(stdout):
+    def run(cmd, *args, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, stdout, "")
+    return run
+
+
+def record(tmp_path, cmd, stdout):
+    path = tmp_path / "fixtures.jsonl"
+    Recorder(str(path), fake_run(stdout), None).run(cmd, capture_output=True, text=True)
+    return path, json.loads(path.read_text(encoding="utf-8").splitlines()[-1])
+
+
+def test_joined_secret_flag_is_masked():
+    argv, _ = normalize(["az", "storage", "container", "create", "--account-key=s3cr3t", "--name=tfstate"])
+    assert argv[-2:] == [f"--account-key={REDACTED}", "--name=tfstate"]
+    assert normalize(["az", "login", "--password", "s3cr3t"])[0][-1] == REDACTED
+
+
+def test_account_key_output_is_not_recorded(tmp_path):
+    cmd = ["az", "storage", "account", "keys", "list", "--account-name", "st1", "--query", "[0].value"]
+    path, entry = record(tmp_path, cmd, '"c2VjcmV0LWtleQ=="\n')
+    assert "c2VjcmV0LWtleQ" not in path.read_text(encoding="utf-8")
+    assert json.loads(entry["stdout"]) == REDACTED
+
+    _, entry = record(tmp_path, cmd[:-2], json.dumps([{"keyName": "key1", "value": "c2VjcmV0LWtleQ=="}]))
+    assert json.loads(entry["stdout"]) == [{"keyName": "key1", "value": REDACTED}]
+
+    _, entry = record(tmp_path, cmd[:-1] + ["[].value"], '["key-one", "key-two"]')
+    assert json.loads(entry["stdout"]) == [REDACTED, REDACTED]
+
+
+def test_access_token_output_keeps_its_shape(tmp_path):
+    cmd = ["az", "account", "get-access-token", "--resource", "https://management.azure.com/", "-o", "json"]
+    payload = {"accessToken": "eyJ0eXAiOiJKV1Qi", "expires_on": 1700000000, "tokenType": "Bearer"}
+    path, entry = record(tmp_path, cmd, json.dumps(payload) + "\n")
+    assert "eyJ0eXAiOiJKV1Qi" not in path.read_text(encoding="utf-8")
+
+    replayed = Player(str(path)).run(cmd, capture_output=True, text=True)
+    assert json.loads(replayed.stdout) == {**payload, "accessToken": REDACTED}
+
+
+def test_plain_output_of_secret_command_is_masked_per_line():
+    assert subprocess_replay.redact_output("key-one\n\nkey-two\n") == f"{REDACTED}\n\n{REDACTED}\n"
+
+
+def test_other_output_is_kept(tmp_path):
+    _, entry = record(tmp_path, ["az", "storage", "account", "list", "-o", "json"], '[{"value": "st1"}]')
+    assert entry["stdout"] == '[{"value": "st1"}]'
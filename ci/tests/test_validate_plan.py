@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import validate_plan
+from validate_plan import MISSING, PlannedResource, ResourceIndex, ResourceSelector, parse_path, resolve_path
+
+
+def resource(address, index=None):
+    parts = address.split(".")
+    type_name, name = parts[-2], parts[-1].split("[")[0]
+    return PlannedResource(address, "managed", type_name, name, index, {})
+
+
+def addresses(index, key):
+    return sorted(r.address for r in index.select(ResourceSelector(key)))
+
+
+def test_plain_key_selects_root_and_module_instances():
+    index = ResourceIndex([
+        resource("azurerm_key_vault.kv"),
+        resource("module.m.azurerm_key_vault.kv"),
+        resource("azurerm_subnet.s[0]", 0),
+        resource("azurerm_subnet.s[1]", 1),
+    ])
+    assert addresses(index, "azurerm_key_vault.kv") == ["azurerm_key_vault.kv", "module.m.azurerm_key_vault.kv"]
+    assert addresses(index, "azurerm_subnet.s") == ["azurerm_subnet.s[0]", "azurerm_subnet.s[1]"]
+
+
+def test_address_selector_is_exact():
+    index = ResourceIndex([resource("azurerm_key_vault.kv"), resource("module.m.azurerm_key_vault.kv"),
+                           resource("azurerm_subnet.s[1]", 1)])
+    assert addresses(index, "module.m.azurerm_key_vault.kv") == ["module.m.azurerm_key_vault.kv"]
+    assert addresses(index, "azurerm_subnet.s[1]") == ["azurerm_subnet.s[1]"]
+    assert addresses(index, "module.other.azurerm_key_vault.kv") == []
+    assert "module.other.azurerm_key_vault.kv" not in index
+
+
+def test_wildcard_over_empty_collection_is_missing():
+    path = parse_path("network_rules[*].default_action")
+    assert resolve_path({"network_rules": []}, path) == [MISSING]
+    assert resolve_path({"network_rules": [{"default_action": "Deny"}, {}]}, path) == ["Deny", MISSING]
+    assert resolve_path({"tags": {}}, parse_path("tags[*]")) == [MISSING]
+
+
+PLAN = {
+    "format_version": "1.2",
+    "terraform_version": "1.7.0",
+    "planned_values": {"root_module": {"resources": [
+        {"address": "azurerm_key_vault.kv", "mode": "managed", "type": "azurerm_key_vault", "name": "kv",
+         "values": {"sku_name": "standard", "tags": {}}},
+    ]}},
+    "resource_changes": [
+        {"address": "azurerm_key_vault.kv", "mode": "managed", "type": "azurerm_key_vault", "name": "kv",
+         "change": {"actions": ["create"], "before": None, "after": {"sku_name": "standard"}}},
+    ],
+    "prior_state": {"values": {}},
+    "configuration": {"root_module": {}},
+}
+SPEC = {"resources": ["azurerm_key_vault.kv"], "attributes": {"azurerm_key_vault.kv": {"sku_name": "standard"}},
+        "actions": {"azurerm_key_vault.kv": "create"}}
+
+
+@pytest.mark.parametrize("sort_keys", [False, True])
+def test_plan_keys_in_any_order_are_read(tmp_path, sort_keys):
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps(PLAN, sort_keys=sort_keys), encoding="utf-8")
+    index = validate_plan.load_planned_resources(path, SPEC)
+    assert len(index) == 1
+    assert index.by_address["azurerm_key_vault.kv"].action == "create"
+    assert validate_plan.validate_resources(SPEC, index) == []
+
+
+def test_tail_key_after_planned_values_ends_the_scan(tmp_path):
+    path = tmp_path / "plan.json"
+    # Truncated after prior_state: reading past it would fail
+    text = json.dumps({k: v for k, v in PLAN.items() if k != "resource_changes"})
+    path.write_text(text[:text.index('"configuration"')], encoding="utf-8")
+    index = validate_plan.load_planned_resources(path, SPEC)
+    assert len(index) == 1
+    assert index.by_address["azurerm_key_vault.kv"].action is None
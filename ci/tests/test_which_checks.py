@@ -0,0 +1,59 @@
+import json
+
+import which_checks
+from which_checks import RoutingIndex, expand_pattern
+
+
+def test_alternatives():
+    assert expand_pattern("task{4,5}") == ["task4", "task5"]
+    assert expand_pattern("{lab,task}-{a,b}") == ["lab-a", "lab-b", "task-a", "task-b"]
+
+
+def test_numeric_ranges_keep_zero_padding():
+    assert expand_pattern("task{001..003}") == ["task001", "task002", "task003"]
+    assert expand_pattern("task{9..11}") == ["task9", "task10", "task11"]
+    assert expand_pattern("task{3..1}") == ["task3", "task2", "task1"]
+
+
+def test_nested_braces():
+    assert expand_pattern("task{1,{3..4}}") == ["task1", "task3", "task4"]
+    assert sorted(expand_pattern("task{a{1,2},b}")) == ["taska1", "taska2", "taskb"]
+
+
+def test_non_expressions_are_kept():
+    assert expand_pattern("task{}") == ["task{}"]
+    assert expand_pattern("{x}{1,2}") == ["{x}1", "{x}2"]
+    assert expand_pattern("lab-*") == ["lab-*"]
+
+
+def test_index_combines_names_ranges_and_globs():
+    index = RoutingIndex({"plan": ["task{001..003}", "lab-[ab]*"], "quiz": ["task{2,5}"], "manual": []})
+    assert index.checks_for("task002") == {"quiz": False, "plan": True, "manual": False}
+    assert index.checks_for("task5") == {"quiz": True, "plan": False, "manual": False}
+    assert index.enabled("lab-b1", "plan")
+    # Patterns that match nothing enable nothing
+    assert index.checks_for("task004") == {"quiz": False, "plan": False, "manual": False}
+    assert not index.enabled("lab-c1", "plan")
+
+
+def test_matrix_output_shape(tmp_path, monkeypatch, capsys):
+    for task in ("task1", "task2", "other"):
+        (tmp_path / task).mkdir()
+    monkeypatch.setattr(which_checks, "_index", RoutingIndex({"plan": ["task*"], "quiz": ["task2"]}))
+    monkeypatch.setattr("sys.argv", ["which_checks.py", "--matrix", str(tmp_path)])
+
+    which_checks.main()
+
+    outputs = dict(line.split("=", 1) for line in capsys.readouterr().out.splitlines())
+    assert outputs["task_count"] == "2"
+    assert json.loads(outputs["matrix"]) == {"include": [
+        {"task": "task1", "quiz": False, "plan": True, "manual": False},
+        {"task": "task2", "quiz": True, "plan": True, "manual": False},
+    ]}
+    assert json.loads(outputs["checks"])["task2"] == {"quiz": True, "plan": True, "manual": False}
+    assert " " not in outputs["matrix"]
+
+
+def test_matrix_for_given_tasks(tmp_path, monkeypatch):
+    monkeypatch.setattr(which_checks, "_index", RoutingIndex({"plan": ["task1"]}))
+    assert which_checks.matrix(str(tmp_path), ["task1"]) == {"task1": {"quiz": False, "plan": True, "manual": False}}
@@ -0,0 +1,208 @@
+import atexit
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Span-based timing for the ci scripts. Enabled with CI_TRACE=1: every process then appends
+# its spans to CI_TRACE_FILE (Chrome trace-event format, open it in chrome://tracing or
+# Perfetto) and a per-process timing table to GITHUB_STEP_SUMMARY. When disabled, span()
+# returns a shared no-op object and traced()/run are the undecorated originals.
+
+ENABLED = os.environ.get("CI_TRACE", "").lower() in ("1", "true", "yes")
+TRACE_FILE = os.environ.get("CI_TRACE_FILE", "ci_trace.json")
+# Spans shorter than this are left out of the step summary table (not the trace)
+SUMMARY_MIN_MS = float(os.environ.get("CI_TRACE_SUMMARY_MIN_MS", "1"))
+
+_events = []
+_lock = threading.Lock()
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+def _process_start_us():
+    """When this process was started, from /proc on Linux; None elsewhere."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # The command name may contain spaces; fields after it are fixed
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat", "r") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return int((boot_time + start_ticks / os.sysconf("SC_CLK_TCK")) * 1_000_000)
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event = {
+            "name": self.name, "cat": self.cat, "ph": "X",
+            "ts": self.start, "dur": _now_us() - self.start,
+            "pid": os.getpid(), "tid": threading.get_ident(),
+        }
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        if self.args:
+            event["args"] = self.args
+        _events.append(event)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, cat="ci", **args):
+    """Times the enclosed block: `with tracing.span("terraform plan", "subprocess"): ...`."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, cat, args)
+
+
+def traced(name=None, cat="ci"):
+    """Decorator form of span(). Returns the function unchanged when tracing is disabled."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def command_name(cmd):
+    """Short label of a command line, e.g. 'az storage blob list' or 'terraform plan'."""
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    words = [os.path.basename(str(cmd[0]))] if cmd else []
+    for arg in cmd[1:4]:
+        arg = str(arg)
+        if arg.startswith("-") or "/" in arg or "=" in arg:
+            break
+        words.append(arg)
+    return " ".join(words)
+
+
+# What run/popen call underneath; subprocess_replay.py swaps these via interpose()
+_run = subprocess.run
+
+
+def _traced_run(cmd, *args, **kwargs):
+    with _Span(command_name(cmd), "subprocess", {}) as s:
+        result = _run(cmd, *args, **kwargs)
+        s.args["returncode"] = result.returncode
+        return result
+
+
+# Drop-in for subprocess.run that records one span per command
+run = _traced_run if ENABLED else subprocess.run
+# Drop-in for subprocess.Popen; callers time it with span() themselves
+popen = subprocess.Popen
+
+
+def interpose(run_impl, popen_impl):
+    """Routes run() and popen() through other implementations. Spans are still recorded."""
+    global _run, run, popen
+    _run = run_impl
+    run = _traced_run if ENABLED else run_impl
+    popen = popen_impl
+
+
+# --- Output ---
+
+def _write_trace(events):
+    """Appends the events to the trace file in the JSON array format (the closing ']' is optional)."""
+    data = ",\n".join(json.dumps(e, separators=(",", ":")) for e in events)
+    with open(TRACE_FILE, "a", encoding="utf-8") as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        f.seek(0, os.SEEK_END)
+        f.write(("[\n" if f.tell() == 0 else ",\n") + data)
+
+
+def summary_table(events, title):
+    """Compact markdown table: spans grouped by name, slowest total first."""
+    totals = {}
+    for e in events:
+        if e.get("ph") != "X":
+            continue
+        count, total, longest = totals.get((e["cat"], e["name"]), (0, 0, 0))
+        totals[(e["cat"], e["name"])] = (count + 1, total + e["dur"], max(longest, e["dur"]))
+
+    lines = [f"#### ⏱️ Timings: {title}", "", "| Span | Kind | Calls | Total (ms) | Max (ms) |", "|---|---|---:|---:|---:|"]
+    for (cat, name), (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        if total / 1000 < SUMMARY_MIN_MS:
+            continue
+        lines.append(f"| {name} | {cat} | {count} | {total / 1000:.1f} | {longest / 1000:.1f} |")
+    return "\n".join(lines)
+
+
+def flush(summary=True):
+    """
+    Writes the spans this process recorded so far and clears them. Runs automatically at exit;
+    pool workers, which skip exit handlers, call it themselves (usually with summary=False).
+    """
+    pid = os.getpid()
+    with _lock:
+        # Forked workers inherit the parent's pending spans; those are the parent's to write
+        events = [e for e in _events if e["pid"] == pid]
+        _events.clear()
+    if not events:
+        return
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+    events.insert(0, {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{script} ({pid})"}})
+    try:
+        _write_trace(events)
+    except OSError as e:
+        print(f"[WARN] Could not write trace file {TRACE_FILE}: {e}", file=sys.stderr)
+
+    summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+    if summary and summary_path:
+        with open(summary_path, "a", encoding="utf-8") as f:
+            f.write(summary_table(events, script) + "\n\n")
+
+
+if ENABLED:
+    _started = _process_start_us()
+    if _started is not None:
+        # Interpreter start-up and imports until this module was loaded
+        _events.append({"name": "python startup", "cat": "startup", "ph": "X", "ts": _started,
+                        "dur": max(0, _now_us() - _started), "pid": os.getpid(), "tid": threading.get_ident()})
+    atexit.register(flush)
+
+if os.environ.get("CI_SUBPROCESS_MODE"):
+    # Record or replay every az/terraform call of this process (see subprocess_replay.py)
+    import subprocess_replay
+    subprocess_replay.install()
@@ -1,17 +1,424 @@
+import gzip
 import json
+import re
 import sys
 import os
+import time
 from pathlib import Path
 
+import results_store
+import tracing
+
+# Plans are read in chunks of this many characters; the read size doubles while
+# a single value is still incomplete, so re-decoding stays linear overall.
+READ_CHUNK = 1 << 20
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Attribute paths such as 'identity[0].type' or 'network_rules[*].default_action'
+_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+|\*)\]")
+WILDCARD = "*"
+# Marks a path that does not resolve in the planned values
+MISSING = object()
+
+# Planned actions as answers.json names them; a delete+create pair is a 'replace'
+ACTIONS = ("create", "update", "replace", "delete", "no-op", "read")
+DESTRUCTIVE_ACTIONS = ("delete", "replace")
+# Top-level keys `terraform show -json` writes after planned_values and resource_changes:
+# once one of them is reached after planned_values, a missing resource_changes (a plan
+# without changes) will not come any more. Terraform does not promise this order, so a tail
+# key met before planned_values (e.g. a plan re-serialized with sorted keys) means reading on.
+PLAN_TAIL_KEYS = ("output_changes", "prior_state", "configuration")
+
 def write_summary(text):
     summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
     if summary_path:
         with open(summary_path, "a", encoding="utf-8") as f:
             f.write(text + "\n")
 
+@tracing.traced("load_json", "io")
 def load_json(path: Path) -> dict:
     return json.loads(path.read_text(encoding="utf-8"))
 
+@tracing.traced("load_answers", "io")
+def load_answers(path: Path) -> dict:
+    """Loads the plan rules, from the rules bundle when `path` is the bundled ci/answers.json."""
+    import rules_bundle
+
+    if path.resolve() == Path(rules_bundle.SCRIPT_DIR, "answers.json").resolve():
+        answers = rules_bundle.load_rules("answers")
+        if answers is not None:
+            return answers
+    return load_json(path)
+
+class PlannedResource:
+    """Compact record of one planned resource, holding only the projected attributes."""
+    __slots__ = ("address", "mode", "type", "name", "index", "values", "actions")
+
+    def __init__(self, address, mode, type_name, name, index, values, actions=None):
+        self.address = address
+        self.mode = mode
+        self.type = type_name
+        self.name = name
+        self.index = index
+        self.values = values
+        # Planned change actions (e.g. ['create']) when the source carries them
+        self.actions = actions
+
+    @property
+    def key(self) -> str:
+        """Module- and instance-less key as used in answers.json, e.g. 'azurerm_key_vault.kv'."""
+        prefix = "data." if self.mode == "data" else ""
+        return f"{prefix}{self.type}.{self.name}"
+
+    @property
+    def action(self):
+        return action_name(self.actions)
+
+
+def action_name(actions):
+    """['create'] -> 'create', ['delete', 'create'] -> 'replace'; None when the actions are unknown."""
+    if not actions:
+        return None
+    if set(actions) == {"create", "delete"}:
+        return "replace"
+    return actions[0]
+
+
+class ResourceSelector:
+    """
+    Compiled resource key from answers.json. A plain 'type.name' matches every instance
+    in every module, a full address matches exactly one, and '*' matches any run of characters.
+    """
+    __slots__ = ("key", "pattern", "is_address")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.pattern = None
+        # Module path or instance index: the key names one address, not every instance
+        self.is_address = key.startswith("module.") or "[" in key
+        if WILDCARD in key:
+            self.pattern = re.compile(".*".join(re.escape(part) for part in key.split(WILDCARD)) + r"\Z")
+
+    def matches(self, resource: PlannedResource) -> bool:
+        if self.pattern is not None:
+            return self.pattern.match(resource.address) is not None
+        if self.is_address:
+            return resource.address == self.key
+        return resource.key == self.key
+
+
+class AttributeRule:
+    """One compiled attribute check: resource selector, parsed path and expected value."""
+    __slots__ = ("selector", "attribute", "path", "expected")
+
+    def __init__(self, selector: ResourceSelector, attribute: str, expected):
+        self.selector = selector
+        self.attribute = attribute
+        self.path = parse_path(attribute)
+        self.expected = expected
+
+
+def parse_path(attribute: str) -> tuple:
+    """'identity[0].type' -> ('identity', 0, 'type'); '[*]' becomes WILDCARD."""
+    path = []
+    for name, index in _PATH_TOKEN.findall(attribute):
+        if name:
+            path.append(name)
+        elif index == WILDCARD:
+            path.append(WILDCARD)
+        else:
+            path.append(int(index))
+    return tuple(path)
+
+
+def resolve_path(values, path: tuple) -> list:
+    """Returns every value at `path`; wildcards fan out, unresolvable branches yield MISSING."""
+    current = [values]
+    for step in path:
+        resolved = []
+        for value in current:
+            if step == WILDCARD:
+                # An empty collection has nothing to check, which must not pass as a match
+                if isinstance(value, list) and value:
+                    resolved.extend(value)
+                elif isinstance(value, dict) and value:
+                    resolved.extend(value.values())
+                else:
+                    resolved.append(MISSING)
+            elif isinstance(step, int):
+                is_item = isinstance(value, list) and step < len(value)
+                resolved.append(value[step] if is_item else MISSING)
+            else:
+                is_key = isinstance(value, dict) and step in value
+                resolved.append(value[step] if is_key else MISSING)
+        current = resolved
+    return current
+
+
+def values_equal(actual, expected) -> bool:
+    """Typed equality: the expected value from answers.json is read as the planned value's type."""
+    if actual is MISSING:
+        return False
+    if isinstance(actual, bool):
+        if isinstance(expected, str):
+            return expected.strip().lower() == str(actual).lower()
+        return actual == expected
+    if isinstance(actual, (int, float)):
+        try:
+            return float(actual) == float(expected)
+        except (TypeError, ValueError):
+            return False
+    if actual is None:
+        return expected is None or str(expected) in ("None", "null")
+    if isinstance(actual, (dict, list)) and not isinstance(expected, str):
+        return actual == expected
+    # Use string comparison for everything else to avoid type mismatch
+    return str(actual) == str(expected)
+
+
+def compile_rules(spec: dict) -> list:
+    """Compiles the 'attributes' section of a task spec into AttributeRule objects."""
+    rules = []
+    for res_key, required_params in spec.get("attributes", {}).items():
+        selector = ResourceSelector(res_key)
+        for param_key, param_val in required_params.items():
+            rules.append(AttributeRule(selector, param_key, param_val))
+    return rules
+
+
+class ResourceIndex:
+    """
+    All planned resources of one plan, indexed by full address and by 'type.name' key.
+    Resources the plan removes have actions but no planned values and are kept apart.
+    """
+
+    def __init__(self, resources, removed=()):
+        self.by_address = {}
+        self.by_key = {}
+        for resource in resources:
+            self.by_address[resource.address] = resource
+            self.by_key.setdefault(resource.key, []).append(resource)
+        self.removed = list(removed)
+
+    def select_removed(self, selector: ResourceSelector) -> list:
+        return [r for r in self.removed if selector.matches(r)]
+
+    def destructive(self) -> list:
+        """Resources planned for delete or replace, in address order."""
+        changes = [r for r in self.by_address.values() if r.action in DESTRUCTIVE_ACTIONS]
+        changes += [r for r in self.removed if r.action in DESTRUCTIVE_ACTIONS]
+        return sorted(changes, key=lambda r: r.address)
+
+    def select(self, selector: ResourceSelector) -> list:
+        if selector.pattern is not None:
+            return [r for r in self.by_address.values() if selector.matches(r)]
+        if selector.is_address:
+            exact = self.by_address.get(selector.key)
+            return [exact] if exact is not None else []
+        # A plain 'type.name' covers the root resource and every module or indexed instance alike
+        return self.by_key.get(selector.key, [])
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.select(ResourceSelector(key)))
+
+    def __len__(self):
+        return len(self.by_address)
+
+
+class _PlanStream:
+    """Incremental reader over the top-level object of a `terraform show -json` file."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # Drop what has been consumed so the buffer only holds the pending value
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(max(READ_CHUNK, len(self.buf)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def _skip_ws(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def _next_char(self) -> str:
+        self._skip_ws()
+        if self.pos >= len(self.buf):
+            raise ValueError("Unexpected end of plan JSON")
+        ch = self.buf[self.pos]
+        self.pos += 1
+        return ch
+
+    def _decode(self, decoder):
+        self._skip_ws()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may still be truncated
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def find(self, wanted_key: str, decoder):
+        """Decodes only the value of `wanted_key`; earlier values are skipped, later ones never read."""
+        return self.find_all({wanted_key: decoder}).get(wanted_key)
+
+    def find_all(self, decoders: dict, stop_keys=(), after=()) -> dict:
+        """
+        Decodes the values of several top-level keys in one pass, each with its own decoder.
+        Reading stops as soon as all of them were found, or at one of `stop_keys` once the
+        keys in `after` were found; a stop key met earlier shows the keys are not in the
+        expected order, and the rest is read. Missing keys are absent from the result.
+        """
+        plain = json.JSONDecoder()
+        found = {}
+        in_order = True
+        if self._next_char() != "{":
+            raise ValueError("Plan JSON must be an object")
+        while len(found) < len(decoders):
+            self._skip_ws()
+            if self.buf.startswith("}", self.pos):
+                break
+            key = self._decode(plain)
+            if key in stop_keys and in_order:
+                if all(k in found for k in after):
+                    break
+                in_order = False
+            if self._next_char() != ":":
+                raise ValueError("Malformed plan JSON")
+            if key in decoders:
+                found[key] = self._decode(decoders[key])
+            else:
+                self._decode(plain)
+            if len(found) == len(decoders):
+                break
+            sep = self._next_char()
+            if sep == "}":
+                break
+            if sep != ",":
+                raise ValueError("Malformed plan JSON")
+        return found
+
+
+def _projecting_hook(rules: list):
+    # Top-level attribute names each selector needs. Plain keys are looked up by
+    # 'type.name' and by address; only wildcard selectors are matched one by one.
+    by_key, patterned = {}, {}
+    for rule in rules:
+        if rule.selector.pattern is None:
+            attrs = by_key.setdefault(rule.selector.key, set())
+        else:
+            attrs = patterned.setdefault(rule.selector.key, (rule.selector, set()))[1]
+        if rule.path:
+            attrs.add(rule.path[0])
+
+    def hook(obj):
+        if "address" in obj and "type" in obj and "values" in obj:
+            resource = PlannedResource(obj["address"], obj.get("mode"), obj["type"], obj.get("name"), obj.get("index"), None)
+            wanted = by_key.get(resource.key, set()) | by_key.get(resource.address, set())
+            for selector, attrs in patterned.values():
+                if selector.matches(resource):
+                    wanted |= attrs
+            values = obj["values"] or {}
+            resource.values = {attr: values[attr] for attr in wanted if attr in values}
+            return resource
+        return obj
+    return hook
+
+
+def _change_hook(obj):
+    # resource_changes entries: keep the address and actions, drop before/after
+    if "actions" in obj and ("before" in obj or "after" in obj):
+        return {"actions": obj["actions"]}
+    if "address" in obj and "change" in obj:
+        return {"address": obj["address"], "mode": obj.get("mode"), "type": obj.get("type"),
+                "name": obj.get("name"), "index": obj.get("index"),
+                "actions": obj["change"].get("actions", []) if isinstance(obj["change"], dict) else []}
+    return obj
+
+
+def join_changes(resources: list, changes) -> ResourceIndex:
+    """
+    Attaches the actions of `resource_changes` entries to the planned resources with the
+    same address. Changes without planned values (deletes) become the index's removed resources.
+    """
+    pending = {change["address"]: change for change in changes or []}
+    for resource in resources:
+        change = pending.pop(resource.address, None)
+        if change is not None:
+            resource.actions = change["actions"]
+    removed = [PlannedResource(c["address"], c.get("mode"), c.get("type"), c.get("name"), c.get("index"), None, c["actions"])
+               for c in pending.values()]
+    return ResourceIndex(resources, removed)
+
+
+def open_plan(path: Path):
+    """Opens a plan file as text; gzip-compressed files are decompressed while they are read."""
+    with path.open("rb") as f:
+        compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+@tracing.traced("load_planned_resources", "io")
+def load_planned_resources(path: Path, spec: dict) -> ResourceIndex:
+    """
+    Streams `planned_values.root_module` and `resource_changes` out of a plan file in one
+    pass and indexes every resource by full address with its planned actions, keeping
+    only the attributes the spec's rules reference.
+    Pruned plan artifacts (see plan_artifact.py) and gzip-compressed plans are accepted too.
+    """
+    import plan_artifact
+
+    with open_plan(path) as f:
+        if f.read(len(plan_artifact.ARTIFACT_PREFIX)) == plan_artifact.ARTIFACT_PREFIX:
+            f.seek(0)
+            return plan_artifact.load_index(f, spec)
+        f.seek(0)
+        found = _PlanStream(f).find_all({
+            "planned_values": json.JSONDecoder(object_hook=_projecting_hook(compile_rules(spec))),
+            "resource_changes": json.JSONDecoder(object_hook=_change_hook),
+        }, stop_keys=PLAN_TAIL_KEYS, after=("planned_values",))
+    planned_values = found.get("planned_values") or {}
+    return join_changes(module_resources(planned_values.get("root_module", {})), found.get("resource_changes"))
+
+
+def module_resources(root_module: dict) -> list:
+    """The PlannedResource records of a projected module tree, child modules included."""
+    resources = []
+
+    def extract_from_module(module):
+        for resource in module.get("resources", []):
+            if isinstance(resource, PlannedResource):
+                resources.append(resource)
+
+        for child in module.get("child_modules", []):
+            extract_from_module(child)
+
+    extract_from_module(root_module)
+    return resources
+
 def collect_planned_resources(plan: dict) -> dict:
     """Collects all resources that WILL exist after apply."""
     resources = {}
@@ -31,18 +438,106 @@ def collect_planned_resources(plan: dict) -> dict:
     extract_from_module(root_module)
     return resources
 
+def required_resource_keys(spec: dict) -> set:
+    return set(spec.get("resources", []) + spec.get("create", []))
+
+def required_actions(spec: dict) -> dict:
+    """{resource key: allowed action names}; keys listed under 'create' must be created."""
+    required = {key: ("create",) for key in spec.get("create", [])}
+    for key, allowed in spec.get("actions", {}).items():
+        required[key] = (allowed,) if isinstance(allowed, str) else tuple(allowed)
+    return required
+
+def referenced_keys(spec: dict) -> set:
+    """Every resource key a task's rules mention."""
+    return required_resource_keys(spec) | set(spec.get("attributes", {})) | set(spec.get("actions", {}))
+
+def extra_resources(spec: dict, index: ResourceIndex) -> list:
+    """Managed resources in the plan that no rule of the task mentions (data sources never count)."""
+    selectors = [ResourceSelector(key) for key in referenced_keys(spec)]
+    plain = {s.key for s in selectors if s.pattern is None}
+    patterned = [s for s in selectors if s.pattern is not None]
+    return sorted(
+        r.address for r in index.by_address.values()
+        if r.mode != "data" and r.key not in plain and r.address not in plain
+        and not any(s.matches(r) for s in patterned)
+    )
+
+def destructive_changes(index: ResourceIndex) -> list:
+    """Warnings for resources the plan deletes or replaces."""
+    return [f"{r.address} will be {'replaced' if r.action == 'replace' else 'deleted'}" for r in index.destructive()]
+
+@tracing.traced("validate_resources", "ci")
+def validate_resources(spec: dict, index: ResourceIndex, outcomes: list = None) -> list:
+    """
+    Checks the indexed plan against one task's rules and returns the list of errors.
+    When `outcomes` is a list, one item per required resource and attribute rule is appended to it.
+    """
+    errors = []
+
+    # Check 1: Existence
+    required = required_resource_keys(spec)
+    missing = {key for key in required if key not in index}
+    if missing:
+        errors.append(f"Missing resources in plan: {sorted(missing)}")
+    if outcomes is not None:
+        outcomes.extend({"item": key, "passed": key not in missing, "detail": "missing" if key in missing else None}
+                        for key in sorted(required))
+
+    # Check 2: Attributes (every matched instance must satisfy the rule)
+    for rule in compile_rules(spec):
+        rule_errors = []
+        for resource in index.select(rule.selector):
+            for real_val in resolve_path(resource.values, rule.path):
+                if not values_equal(real_val, rule.expected):
+                    shown = None if real_val is MISSING else real_val
+                    where = rule.selector.key if resource.address == rule.selector.key else resource.address
+                    rule_errors.append(f"Attribute mismatch in {where}: {rule.attribute} expected '{rule.expected}', got '{shown}'")
+        errors.extend(rule_errors)
+        if outcomes is not None:
+            outcomes.append({"item": f"{rule.selector.key}.{rule.attribute}", "passed": not rule_errors,
+                             "detail": rule_errors[0] if rule_errors else None})
+
+    # Check 3: Planned actions (every matched instance, removed ones included)
+    for key, allowed in sorted(required_actions(spec).items()):
+        selector = ResourceSelector(key)
+        matched = index.select(selector) + index.select_removed(selector)
+        if matched:
+            wrong = [f"{r.address} ({r.action or 'unknown'})" for r in matched if r.action not in allowed]
+            error = f"Unexpected action for {key}: expected {' or '.join(allowed)}, planned {', '.join(wrong)}" if wrong else None
+        elif key in required:
+            # Already reported as missing
+            error = None
+        else:
+            error = f"No planned change for {key}: expected {' or '.join(allowed)}"
+        if error:
+            errors.append(error)
+        if outcomes is not None:
+            outcomes.append({"item": f"{key}:action", "passed": error is None and bool(matched), "detail": error})
+
+    # Check 4: Extra resources
+    if not spec.get("allow_extra", True):
+        extra = extra_resources(spec, index)
+        if extra:
+            errors.append(f"Unexpected resources in plan (allow_extra is false): {extra}")
+        if outcomes is not None:
+            outcomes.append({"item": "allow_extra", "passed": not extra, "detail": f"{len(extra)} extra resource(s)" if extra else None})
+
+    return errors
+
+@tracing.traced("validate_plan", "stage")
 def main() -> int:
     if len(sys.argv) != 4:
         print("Usage: validate_plan.py <tf_dir> <plan_json_path> <answers_json_path>")
         return 2
 
+    started = time.perf_counter()
     tf_dir = sys.argv[1]
     plan_path = Path(sys.argv[2])
     answers_path = Path(sys.argv[3])
 
     try:
-        plan = load_json(plan_path)
-        answers = load_json(answers_path)
+        answers = load_answers(answers_path)
     except Exception as e:
         print(f"ERROR loading files: {e}")
         return 2
@@ -52,32 +547,23 @@ def main() -> int:
         return 0
 
     spec = answers[tf_dir]
-    required_resources = set(spec.get("resources", []) + spec.get("create", []))
-    expected_attributes = spec.get("attributes", {})
+    required_resources = required_resource_keys(spec)
 
-    actual_resources_map = collect_planned_resources(plan)
-    actual_resources_keys = set(actual_resources_map.keys())
-
-    errors = []
-
-    # Check 1: Existence
-    missing = required_resources - actual_resources_keys
-    if missing:
-        errors.append(f"Missing resources in plan: {sorted(missing)}")
-
-    # Check 2: Attributes
-    for res_key, required_params in expected_attributes.items():
-        if res_key not in actual_resources_map:
-            continue
+    try:
+        index = load_planned_resources(plan_path, spec)
+    except Exception as e:
+        print(f"ERROR loading files: {e}")
+        return 2
 
-        actual_params = actual_resources_map[res_key]
-        for param_key, param_val in required_params.items():
-            real_val = actual_params.get(param_key)
-            # Use string comparison to avoid type mismatch (int vs str)
-            if str(real_val) != str(param_val):
-                errors.append(f"Attribute mismatch in {res_key}: {param_key} expected '{param_val}', got '{real_val}'")
+    outcomes = []
+    errors = validate_resources(spec, index, outcomes)
+    warnings = destructive_changes(index)
+    results_store.record("plan", tf_dir, not errors, outcomes, duration=round(time.perf_counter() - started, 3))
 
     summary_lines = [f"## 🏗️ Terraform Plan Verification: {tf_dir}"]
+    for w in warnings:
+        print(f"⚠️ Destructive change: {w}")
+        summary_lines.append(f"- ⚠️ Destructive change: {w}")
 
     if errors:
         print("❌ Plan validation failed")
@@ -1,59 +1,190 @@
+import fnmatch
 import json
 import os
+import re
 import sys
 
+import tracing
+
+CHECKS = ("quiz", "plan", "manual")
+# task{001..014} -> task001 ... task014 (zero padding is kept), task{4,5} -> task4, task5
+_BRACE = re.compile(r"\{([^{}]*)\}")
+_RANGE = re.compile(r"^(-?\d+)\.\.(-?\d+)$")
+_GLOB_CHARS = set("*?[")
+
+
+@tracing.traced("load_config", "io")
 def load_config(path):
     with open(path, "r", encoding="utf-8") as f:
         if path.endswith(".json"):
             return json.load(f)
-        # YAML fallback - prosty parser dla list
-        import re
-        content = f.read()
-        config = {}
-        current_key = None
-        for line in content.splitlines():
-            m = re.match(r"^(\w+):\s*$", line)
-            if m:
-                current_key = m.group(1)
-                config[current_key] = []
-            elif current_key and line.strip().startswith("- "):
-                config[current_key].append(line.strip()[2:].strip())
-        return config
+        return parse_config(f.read())
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: which_checks.py <task_dir>")
-        sys.exit(1)
 
-    task_dir = sys.argv[1]
-    task_name = os.path.basename(os.path.normpath(task_dir))
+def parse_config(content):
+    # YAML fallback - prosty parser dla list
+    config = {}
+    current_key = None
+    for line in content.splitlines():
+        m = re.match(r"^(\w+):\s*$", line)
+        if m:
+            current_key = m.group(1)
+            config[current_key] = []
+        elif current_key and line.strip().startswith("- "):
+            config[current_key].append(line.strip()[2:].strip().strip("'\""))
+    return config
+
+
+def expand_pattern(pattern, start=0):
+    """
+    Expands {a..b} ranges and {x,y} alternatives, innermost first, so braces may nest
+    (task{1,{3..4}} -> task1, task3, task4); glob characters are left for fnmatch.
+    """
+    m = _BRACE.search(pattern, start)
+    if not m:
+        return [pattern]
+    body = m.group(1)
+    rng = _RANGE.match(body)
+    if rng:
+        first, last = int(rng.group(1)), int(rng.group(2))
+        width = len(rng.group(1)) if rng.group(1).startswith("0") else 0
+        step = 1 if last >= first else -1
+        options = [str(n).zfill(width) for n in range(first, last + step, step)]
+    elif "," in body:
+        options = body.split(",")
+    else:
+        # Not a brace expression, keep the braces literally
+        return expand_pattern(pattern, m.end())
+    expanded = []
+    for option in options:
+        # The expansion may complete an enclosing brace expression
+        for result in expand_pattern(pattern[:m.start()] + option + pattern[m.end():]):
+            if result not in expanded:
+                expanded.append(result)
+    return expanded
+
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, "tasks_config.yml")
-    if not os.path.exists(config_path):
-        config_path = os.path.join(script_dir, "tasks_config.json")
+def is_glob(pattern):
+    return any(c in _GLOB_CHARS for c in pattern)
 
-    if not os.path.exists(config_path):
+
+class RoutingIndex:
+    """
+    tasks_config compiled once: exact names (and expanded ranges) go into one set per
+    check, globs into one regex per check. Lookups cost a set hit or one regex match.
+    """
+    __slots__ = ("names", "globs")
+
+    def __init__(self, config):
+        self.names = {}
+        self.globs = {}
+        for check in CHECKS:
+            names, globs = set(), []
+            for pattern in config.get(check, []):
+                for expanded in expand_pattern(str(pattern)):
+                    if is_glob(expanded):
+                        globs.append(fnmatch.translate(expanded))
+                    else:
+                        names.add(expanded)
+            self.names[check] = names
+            self.globs[check] = re.compile("|".join(globs)) if globs else None
+
+    def enabled(self, task_name, check):
+        if task_name in self.names[check]:
+            return True
+        glob = self.globs[check]
+        return glob is not None and glob.match(task_name) is not None
+
+    def checks_for(self, task_name):
+        return {check: self.enabled(task_name, check) for check in CHECKS}
+
+
+class _RunEverything:
+    """Stand-in index when there is no tasks_config."""
+
+    def checks_for(self, task_name):
         # Brak configu = uruchom wszystko (backward compatibility)
-        print("run_quiz=true")
-        print("run_plan=true")
-        print("run_manual=true")
-        return
+        return {check: True for check in CHECKS}
+
+
+_index = None
 
-    config = load_config(config_path)
 
-    plan_tasks = set(config.get("plan", []))
-    quiz_tasks = set(config.get("quiz", []))
-    manual_tasks = set(config.get("manual", []))
+def compile_index(config):
+    """Returns a RoutingIndex for `config`, or an index that enables everything if it is None."""
+    return _RunEverything() if config is None else RoutingIndex(config)
+
+
+def load_index():
+    """The routing index of this repo's tasks_config, built once per process."""
+    global _index
+    if _index is None:
+        import rules_bundle
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        config = rules_bundle.load_rules("tasks_config")
+        json_config_path = os.path.join(script_dir, "tasks_config.json")
+        if config is None and os.path.exists(json_config_path):
+            config = load_config(json_config_path)
+        _index = compile_index(config)
+    return _index
+
+
+@tracing.traced("which_checks", "stage")
+def checks_for(task_name):
+    """Returns {"quiz", "plan", "manual"} -> bool for one task according to tasks_config."""
+    return load_index().checks_for(task_name)
+
+
+def task_dirs(repo_dir):
+    """Names of the task* directories in `repo_dir`, sorted."""
+    return sorted(
+        entry.name for entry in os.scandir(repo_dir)
+        if entry.is_dir() and entry.name.startswith("task")
+    )
+
+
+@tracing.traced("which_checks.matrix", "stage")
+def matrix(repo_dir, tasks=None):
+    """{task: {quiz, plan, manual}} for every task directory of the repo, or only for `tasks`."""
+    index = load_index()
+    if tasks is None:
+        tasks = task_dirs(repo_dir)
+    return {task: index.checks_for(task) for task in tasks}
+
+
+def matrix_outputs(checks):
+    """GITHUB_OUTPUT lines for a {task: checks} mapping: checks, matrix and task_count."""
+    include = [{"task": task, **task_checks} for task, task_checks in checks.items()]
+    # Single-line JSON, ready for fromJSON() in a strategy.matrix
+    return [
+        f"checks={json.dumps(checks, separators=(',', ':'))}",
+        f"matrix={json.dumps({'include': include}, separators=(',', ':'))}",
+        f"task_count={len(include)}",
+    ]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: which_checks.py <task_dir> | --matrix [repo_dir [task_dir ...]]")
+        sys.exit(1)
+
+    if sys.argv[1] == "--matrix":
+        repo_dir = sys.argv[2] if len(sys.argv) > 2 else "."
+        tasks = [os.path.basename(os.path.normpath(d)) for d in sys.argv[3:]] or None
+        for line in matrix_outputs(matrix(repo_dir, tasks)):
+            print(line)
+        return
+
+    task_dir = sys.argv[1]
+    task_name = os.path.basename(os.path.normpath(task_dir))
 
-    run_quiz = task_name in quiz_tasks
-    run_plan = task_name in plan_tasks
-    run_manual = task_name in manual_tasks
+    checks = checks_for(task_name)
 
     # Wypisz do stdout - GitHub Actions może to przechwycić
-    print(f"run_quiz={str(run_quiz).lower()}")
-    print(f"run_plan={str(run_plan).lower()}")
-    print(f"run_manual={str(run_manual).lower()}")
+    print(f"run_quiz={str(checks['quiz']).lower()}")
+    print(f"run_plan={str(checks['plan']).lower()}")
+    print(f"run_manual={str(checks['manual']).lower()}")
 
 
 if __name__ == "__main__":